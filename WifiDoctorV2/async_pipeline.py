@@ -0,0 +1,153 @@
+"""
+Asyncio producer / consumer pipeline over a tshark field export.
+
+tshark dissects the capture in its own process while this one parses its output and folds
+the frames into the window sums, so a run takes about max(decode, analysis) instead of
+extract_all_data() followed by run_analysis(). The stages are connected by bounded queues:
+when the analysis falls behind, the reader stops draining tshark's stdout and tshark blocks
+on the full pipe (backpressure), so memory stays at a few chunks whatever the capture size.
+
+    tshark stdout -> read_chunks -> [raw chunks] -> parse_chunks -> [tables] -> analyze_tables
+                                                   (thread)                  (thread, consumers)
+
+The consumers are the ones of pipeline.py, so the results are those of run_analysis().
+"""
+import asyncio
+import csv
+import io
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import instrumentation
+from frame_filter import FrameFilter
+from packet_table import ANALYSIS_FIELDS, MISSING_TIME
+from pipeline import Pipeline, RssidConsumer, LinkWindowConsumer
+from tshark_backend import TsharkError, build_command, select_fields, tshark_available, _chunk_to_table
+from wifi_analysis_engine import WINDOW_SIZE_S, MAX_DURATION_S
+
+QUEUE_SIZE = 4
+READ_BYTES = 1 << 20  # about 10k tshark lines per chunk
+
+
+async def read_chunks(stream, queue, read_bytes=READ_BYTES):
+    """Producer: tshark stdout -> chunks of whole lines, None once the stream ends."""
+    rest = b''
+    while True:
+        data = await stream.read(read_bytes)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b'\n') + 1
+        rest = data[cut:]
+        if cut:
+            await queue.put(data[:cut])
+    if rest:
+        await queue.put(rest)
+    await queue.put(None)
+
+
+@instrumentation.instrumented("parse")
+def parse_chunk(data, fields, parser):
+    """tshark lines -> rate-gap annotated PacketTable with the ANALYSIS_FIELDS columns."""
+    chunk = pd.read_csv(
+        io.BytesIO(data), sep='\t', header=None, names=list(fields), dtype=str,
+        keep_default_na=False, na_values=[''], quoting=csv.QUOTE_NONE, encoding='utf-8', encoding_errors='replace',
+    )
+    return parser.add_rate_gap(_chunk_to_table(chunk).ensure_columns(ANALYSIS_FIELDS))
+
+
+async def parse_chunks(raw_queue, table_queue, executor, fields, parser):
+    loop = asyncio.get_running_loop()
+    while (data := await raw_queue.get()) is not None:
+        await table_queue.put(await loop.run_in_executor(executor, parse_chunk, data, fields, parser))
+    await table_queue.put(None)
+
+
+def table_frames(table):
+    """Rows of a PacketTable as the frame dicts the pipeline consumers take."""
+    for i in range(len(table)):
+        frame = table.row(i)
+        if frame.get('sniff_time') is None:
+            frame['sniff_time'] = MISSING_TIME
+        yield frame
+
+
+@instrumentation.instrumented("analyze", table_arg=1)
+def _feed(pipeline, table):
+    pipeline.feed(table_frames(table))
+
+
+async def analyze_tables(table_queue, executor, pipeline):
+    loop = asyncio.get_running_loop()
+    while (table := await table_queue.get()) is not None:
+        await loop.run_in_executor(executor, _feed, pipeline, table)
+    pipeline.finish()
+
+
+async def analyze_capture_async(pcap_file, parser, transmitter_mac, receiver_mac, subtype="0x0028",
+                                window_size=WINDOW_SIZE_S, step=None, max_duration=MAX_DURATION_S, consumers=(),
+                                start_s=None, end_s=None, tshark="tshark", queue_size=QUEUE_SIZE, percentiles=None,
+                                sketches=None):
+    """
+    The single-link analysis of run_analysis() with tshark decoding and our analysis overlapped.
+
+    Args:
+        parser (module): parser_11n or parser_11ac (its TSHARK_FIELDS and add_rate_gap are used)
+        consumers (list): extra pipeline consumers that see the same frames
+        start_s, end_s (float): only analyze [start_s, end_s) seconds of the capture
+        queue_size (int): chunks each queue holds before the stage in front of it waits
+        percentiles, sketches: see pipeline.analyze_capture()
+
+    Returns:
+        list: one dict per non-empty window, like pipeline.analyze_capture()
+
+    Raises:
+        TsharkError: tshark is not installed or failed
+    """
+    if not tshark_available(tshark):
+        raise TsharkError(f"{tshark} not found on PATH")
+    fields = select_fields(parser.TSHARK_FIELDS, ANALYSIS_FIELDS)
+    # only the link frames and the beacons are dissected
+    frame_filter = FrameFilter(transmitter_mac, receiver_mac, subtype, keep_beacons=True, start_s=start_s, end_s=end_s)
+    rssid = RssidConsumer()
+    link = LinkWindowConsumer(transmitter_mac, receiver_mac, rssid, subtype, window_size, step, max_duration,
+                              percentiles=percentiles)
+    pipeline = Pipeline([rssid, link, *consumers])
+
+    # stderr goes to a file so a chatty tshark cannot block on a full pipe
+    with tempfile.TemporaryFile() as stderr, ThreadPoolExecutor(max_workers=2) as executor:
+        process = await asyncio.create_subprocess_exec(
+            *build_command(pcap_file, fields, frame_filter.display_filter(), tshark),
+            stdout=asyncio.subprocess.PIPE, stderr=stderr,
+        )
+        raw_queue = asyncio.Queue(queue_size)
+        table_queue = asyncio.Queue(queue_size)
+        try:
+            await asyncio.gather(
+                read_chunks(process.stdout, raw_queue),
+                parse_chunks(raw_queue, table_queue, executor, fields, parser),
+                analyze_tables(table_queue, executor, pipeline),
+            )
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            raise
+        finally:
+            await process.wait()
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', 'replace').strip()
+            raise TsharkError(f"tshark exited with {process.returncode}: {message}")
+    if sketches is not None and link.sketches is not None:
+        sketches.merge(link.sketches)
+    return link.results
+
+
+def analyze_capture(pcap_file, parser, transmitter_mac, receiver_mac, subtype="0x0028", window_size=WINDOW_SIZE_S,
+                    step=None, max_duration=MAX_DURATION_S, consumers=(), start_s=None, end_s=None, tshark="tshark",
+                    percentiles=None, sketches=None):
+    """Blocking wrapper around analyze_capture_async()."""
+    return asyncio.run(analyze_capture_async(
+        pcap_file, parser, transmitter_mac, receiver_mac, subtype, window_size, step, max_duration, consumers,
+        start_s, end_s, tshark, percentiles=percentiles, sketches=sketches,
+    ))
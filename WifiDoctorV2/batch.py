@@ -0,0 +1,366 @@
+"""
+Non-interactive Wi-Fi Doctor over many captures.
+
+Every capture is analyzed by one worker process (extraction, rate gap, windows), captures are
+independent so the run scales with the number of cores. The results end up in one summary
+table with a row per capture per window.
+
+Long captures can be cut into time slices (--slice) that are analyzed as separate jobs, each
+worker seeks to its slice through the capture's time index (see time_index.py).
+
+    python batch.py "pcap_files/*.pcapng" --parser auto --jobs 8 --output weekly_summary.csv
+    python batch.py pcap_files/two_hours.pcapng --slice 300 --max-duration 0
+    python batch.py "pcap_files/*.pcap" --plots plots/   # one headless figure per capture
+    python batch.py "pcap_files/*.pcapng" --format parquet --output weekly/   # <capture>/<link>/part-*.parquet
+    python batch.py two_hours.pcapng --slice 300 --percentiles --distributions links.csv   # p5 / p50 / p95
+
+With --percentiles every window also gets the p5 / p50 / p95 of RSSI, rate and rate gap. The
+quantile sketches behind them (see sketches.py) are sent back by the workers and merged, so
+--distributions has the percentiles of every link over the whole capture even when its slices
+were analyzed by different processes.
+"""
+import argparse
+import functools
+import glob
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from frame_filter import FrameFilter, mac_to_bytes
+from capture_cache import CaptureCache, load_or_extract
+from packet_table import ANALYSIS_FIELDS
+from pcap_reader import PcapFormatError, detect_phy
+import pipeline
+from time_index import INDEX_SUFFIX, load_or_build_index
+from capture_catalog import CATALOG_FILE, catalog_entry
+from output_writers import FORMATS, DatasetWriter, format_of, write_rows
+from plotting import LAYOUTS, render_many
+from sketches import PERCENTILES, MetricSketches, percentile_columns
+from wifi_analysis_engine import analyze_link, analyze_links, LINK_COLUMNS, WINDOW_SIZE_S, MAX_DURATION_S
+
+SUMMARY_COLUMNS = ['capture', 'parser', 'window_start', 'timestamp', 'avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap',
+                   'theoretical_throughput']
+
+
+def _parsers():
+    from wifi_doctor import PARSERS
+    return {parser.PHY: (parser, ta, ra) for parser, _, ta, ra in PARSERS.values()}
+
+
+def expand_captures(patterns):
+    """
+    Paths / glob patterns -> existing capture files, in the given order without duplicates.
+    Glob matches skip the time index and catalog files kept next to the captures.
+    """
+    captures = []
+    for pattern in patterns:
+        matches = [path for path in sorted(glob.glob(pattern, recursive=True))
+                   if not path.endswith(INDEX_SUFFIX) and os.path.basename(path) != CATALOG_FILE]
+        matches = matches or ([pattern] if os.path.isfile(pattern) else [])
+        for path in matches:
+            if os.path.isfile(path) and path not in captures:
+                captures.append(path)
+    return captures
+
+
+def analyze_capture(pcap_file, phy="auto", transmitter_mac=None, receiver_mac=None, subtype="0x0028",
+                    window_size=WINDOW_SIZE_S, step=None, max_duration=MAX_DURATION_S, cache_dir=None, group_by=None,
+                    start_s=None, end_s=None, percentiles=None):
+    """
+    Worker: the whole wifi_doctor pipeline for one capture, without prompts, prints or plots.
+
+    Args:
+        phy (str): "11n", "11ac" or "auto" (detected from the radiotap headers)
+        transmitter_mac, receiver_mac (str): the link, default to the MACs wifi_doctor uses for the parser
+        cache_dir (str): extraction cache directory, None disables the cache
+        group_by (str): analyze every link ('ta_ra' or 'bssid_station') instead of the one TA/RA pair
+        start_s, end_s (float): only analyze [start_s, end_s) seconds after the first record of the
+            capture, the windows then start at the first link frame of that slice
+        percentiles (list): add these percentiles of RSSI, rate and rate gap to every window, the
+            table's attrs['sketches'] then maps every link tuple to the MetricSketches of its frames
+
+    Returns:
+        pandas.DataFrame: one row per (link and) non-empty window
+    """
+    import pandas as pd
+    if phy == "auto":
+        phy = detect_phy(pcap_file)
+    parser, default_ta, default_ra = _parsers()[phy]
+    transmitter_mac = transmitter_mac or default_ta
+    receiver_mac = receiver_mac or default_ra
+    columns = SUMMARY_COLUMNS[3:] + (percentile_columns(percentiles) if percentiles else [])
+    link = (transmitter_mac.lower(), receiver_mac.lower())
+    sketches = MetricSketches() if percentiles else None
+
+    if not group_by and cache_dir is None:
+        # nothing to cache, so read the capture once through the fused pipeline
+        try:
+            results = pipeline.analyze_capture(pcap_file, phy, transmitter_mac, receiver_mac, subtype,
+                                               window_size, step, max_duration, start_s=start_s, end_s=end_s,
+                                               percentiles=percentiles, sketches=sketches)
+            return _with_capture(pd.DataFrame(results, columns=columns), pcap_file, phy, window_size,
+                                 sketches and {link: sketches})
+        except PcapFormatError:
+            # not something the native decoder reads: tshark dissects it while the windows are computed
+            from tshark_backend import tshark_available
+            if tshark_available():
+                import async_pipeline
+                results = async_pipeline.analyze_capture(pcap_file, parser, transmitter_mac, receiver_mac, subtype,
+                                                         window_size, step, max_duration, start_s=start_s, end_s=end_s,
+                                                         percentiles=percentiles, sketches=sketches)
+                return _with_capture(pd.DataFrame(results, columns=columns), pcap_file, phy, window_size,
+                                     sketches and {link: sketches})
+
+    if group_by:
+        frame_filter = FrameFilter(subtype=subtype, keep_beacons=True, start_s=start_s, end_s=end_s)
+    else:
+        frame_filter = FrameFilter(transmitter_mac, receiver_mac, subtype, keep_beacons=True, start_s=start_s, end_s=end_s)
+    if cache_dir is None:
+        packets = parser.add_rate_gap(parser.extract_all_data(pcap_file, frame_filter=frame_filter, fields=ANALYSIS_FIELDS))
+    else:
+        packets = load_or_extract(pcap_file, parser, frame_filter=frame_filter, fields=ANALYSIS_FIELDS,
+                                  cache=CaptureCache(cache_dir))
+
+    if group_by:
+        link_sketches = {} if percentiles else None
+        rows = analyze_links(packets, packets, subtype, group_by, window_size, step, max_duration,
+                             percentiles=percentiles, sketches=link_sketches)
+        rows.insert(0, 'parser', f"parser_{phy}")
+        rows.insert(0, 'capture', pcap_file)
+        if link_sketches is not None:
+            rows.attrs['sketches'] = link_sketches
+        return rows
+    link_packets = parser.filter_for_1_2(packets, transmitter_mac, receiver_mac, subtype)
+    analysis = analyze_link(link_packets, packets, window_size, step, max_duration, verbose=False,
+                            percentiles=percentiles, sketches=sketches)
+    return _with_capture(pd.DataFrame(analysis[1] if analysis else [], columns=columns),
+                         pcap_file, phy, window_size, sketches and {link: sketches})
+
+
+def _instrumented_job(profile, pcap_file, **options):
+    """Worker: analyze_capture() under instrumentation, returns (table, metrics report)."""
+    from instrumentation import Instrumentation
+    with Instrumentation(profile=profile) as instrumentation:
+        table = analyze_capture(pcap_file, **options)
+    return table, instrumentation.report()
+
+
+def _with_capture(rows, pcap_file, phy, window_size, sketches=None):
+    rows.insert(0, 'window_start', rows['timestamp'] - window_size)
+    rows.insert(0, 'parser', f"parser_{phy}")
+    rows.insert(0, 'capture', pcap_file)
+    if sketches:
+        rows.attrs['sketches'] = sketches
+    return rows
+
+
+def _slice_jobs(captures, slice_s, start_s=None, end_s=None):
+    """(capture, start_s, end_s) jobs: every capture, or its slices of slice_s seconds."""
+    if not slice_s:
+        return [(capture, start_s, end_s) for capture in captures]
+    jobs = []
+    for capture in captures:
+        try:
+            slices = load_or_build_index(capture).slices(slice_s, start_s, end_s)
+        except (OSError, PcapFormatError):
+            slices = [(start_s, end_s)]  # let the worker report the error
+        jobs.extend((capture, start, end) for start, end in slices)
+    return jobs
+
+
+def _job_name(capture, start_s, end_s):
+    if start_s is None and end_s is None:
+        return capture
+    return f"{capture} [{start_s or 0:g}s, {'end' if end_s is None else f'{end_s:g}s'})"
+
+
+def _busiest_link_options(captures):
+    """Per capture parser / TA / RA from the capture catalogs (scanned here, once, not in the workers)."""
+    options = {}
+    for capture in captures:
+        entry = catalog_entry(capture)
+        if 'error' in entry:
+            continue  # the worker reports it
+        options[capture] = {'phy': entry['parser']}
+        if entry['busiest_link']:
+            options[capture].update(transmitter_mac=entry['busiest_link']['ta'], receiver_mac=entry['busiest_link']['ra'])
+    return options
+
+
+def run_batch(captures, jobs=None, slice_s=None, start_s=None, end_s=None, busiest_link=False, metrics=None,
+              profile=False, writer=None, distributions=None, **options):
+    """
+    Analyzes captures in a process pool.
+
+    Args:
+        captures (list): capture paths
+        jobs (int): worker processes (defaults to the number of cores)
+        slice_s (float): cut every capture into slices of this many seconds, analyzed as separate jobs
+        start_s, end_s (float): only analyze this part of every capture (seconds after its first record)
+        busiest_link (bool): analyze the busiest link of every capture with the parser its catalog
+            entry suggests (see capture_catalog) instead of options' phy / transmitter_mac / receiver_mac
+        metrics (dict): when given, every job is instrumented and its report (see instrumentation)
+            is stored in it under the job name
+        profile (bool): add the sampling profile to the metrics reports
+        writer (output_writers.DatasetWriter): every job's table is written through it as soon as the job is done
+        distributions (dict): when given (with the percentiles option), the link sketches of every job are
+            merged into it under (capture, *link), slices of a capture end up in the same sketches
+        options: passed on to analyze_capture()
+
+    Returns:
+        tuple: (summary DataFrame in the order of captures (and slices), {job: error message} of the failed ones)
+    """
+    import pandas as pd
+    jobs = jobs or os.cpu_count() or 1
+    tasks = _slice_jobs(captures, slice_s, start_s, end_s)
+    overrides = _busiest_link_options(captures) if busiest_link else {}
+    tables = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=min(jobs, max(len(tasks), 1))) as pool:
+        worker = analyze_capture if metrics is None else functools.partial(_instrumented_job, profile)
+        futures = {pool.submit(worker, capture, start_s=start, end_s=end,
+                               **{**options, **overrides.get(capture, {})}): (capture, start, end)
+                   for capture, start, end in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            task = futures[future]
+            name = _job_name(*task)
+            try:
+                table = future.result()
+                if metrics is not None:
+                    table, metrics[name] = table
+                for link, sketches in table.attrs.pop('sketches', {}).items():
+                    if distributions is not None:
+                        key = (task[0], *link)
+                        distributions[key] = distributions[key].merge(sketches) if key in distributions else sketches
+                if task[1] is not None or task[2] is not None:
+                    table.insert(2, 'slice_start', task[1] or 0.0)
+                tables[task] = table
+                if writer is not None:
+                    writer.write_frame(table)
+                print(f"[{done}/{len(tasks)}] {name}: {len(table)} windows", file=sys.stderr)
+            except Exception as error:
+                errors[name] = f"{type(error).__name__}: {error}"
+                print(f"[{done}/{len(tasks)}] {name}: [ERROR] {errors[name]}", file=sys.stderr)
+    ordered = [tables[task] for task in tasks if task in tables]
+    summary = pd.concat(ordered, ignore_index=True) if ordered else pd.DataFrame(columns=SUMMARY_COLUMNS)
+    return summary, errors
+
+
+def distribution_rows(distributions, percentiles=PERCENTILES):
+    """One row per (capture, link) of run_batch() distributions: its frames and the percentiles of its metrics."""
+    return [(*key, len(sketches.sketches['rssi']), *sketches.percentiles(percentiles).values())
+            for key, sketches in distributions.items()]
+
+
+def plot_jobs(summary, output_dir, layout="combined"):
+    """
+    render_many() jobs for a batch summary: one per capture (and per link / slice when the
+    summary has them), file names prefixed with the capture name.
+    """
+    link_columns = [column for columns in LINK_COLUMNS.values() for column in columns]
+    keys = ['capture'] + [column for column in ('slice_start', *link_columns) if column in summary.columns]
+    jobs = []
+    for key, rows in summary.groupby(keys, sort=False):
+        key = key if isinstance(key, tuple) else (key,)
+        name = "_".join([os.path.basename(key[0])] + [f"{value:g}" if isinstance(value, float) else str(value)
+                                                       for value in key[1:]])
+        prefix = re.sub(r'[^\w.-]+', '_', name) + "_"
+        results = rows.drop(columns=keys).astype(object).where(rows.drop(columns=keys).notna(), None).to_dict('records')
+        jobs.append({'results': results, 'layout': layout, 'output_dir': output_dir, 'prefix': prefix,
+                     'title': " ".join(str(value) for value in key)})
+    return jobs
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run Wi-Fi Doctor over many captures without prompts.")
+    arg_parser.add_argument("captures", nargs="+", help="capture files or glob patterns (quote them)")
+    arg_parser.add_argument("--parser", choices=["auto", "11n", "11ac"], default="auto",
+                            help="auto picks 11ac when the radiotap headers carry VHT fields")
+    arg_parser.add_argument("--ta", help="link transmitter MAC (defaults to the one wifi_doctor uses for the parser)")
+    arg_parser.add_argument("--busiest-link", action="store_true",
+                            help="per capture, the parser and the busiest TA/RA pair from the capture catalog")
+    arg_parser.add_argument("--ra", help="link receiver MAC")
+    arg_parser.add_argument("--subtype", default="0x0028")
+    arg_parser.add_argument("--all-links", choices=sorted(LINK_COLUMNS), dest="group_by",
+                            help="analyze every link grouped by (TA, RA) or (BSSID, station) instead of --ta/--ra")
+    arg_parser.add_argument("--window", type=float, default=WINDOW_SIZE_S, help="window size in seconds")
+    arg_parser.add_argument("--step", type=float, help="window step in seconds (defaults to the window size)")
+    arg_parser.add_argument("--max-duration", type=float, default=MAX_DURATION_S,
+                            help="seconds analyzed after the first link packet, 0 = whole capture")
+    arg_parser.add_argument("--start", type=float, help="skip the first START seconds of every capture")
+    arg_parser.add_argument("--end", type=float, help="stop END seconds after the start of every capture")
+    arg_parser.add_argument("--slice", type=float, help="analyze every capture as independent slices of this many seconds")
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    arg_parser.add_argument("--cache-dir", help="extraction cache directory (default: no cache)")
+    arg_parser.add_argument("--output", default="wifi_batch_summary.csv",
+                            help="summary CSV, or the dataset directory of --format parquet / arrow")
+    arg_parser.add_argument("--format", choices=list(FORMATS), default="csv",
+                            help="parquet / arrow write one file per capture (and link) as the jobs finish")
+    arg_parser.add_argument("--plots", metavar="DIR", help="also save the metric plots of every capture into DIR")
+    arg_parser.add_argument("--plot-layout", choices=LAYOUTS, default="combined")
+    arg_parser.add_argument("--metrics", metavar="FILE", help="save per-stage time / frame / memory metrics of every job (JSON)")
+    arg_parser.add_argument("--profile", action="store_true", help="add a sampling profile of every job to --metrics")
+    arg_parser.add_argument("--percentiles", nargs="?", const=",".join(map(str, PERCENTILES)), metavar="LIST",
+                            help="add these comma separated percentiles of RSSI, rate and rate gap to every window "
+                                 f"(default {','.join(map(str, PERCENTILES))})")
+    arg_parser.add_argument("--distributions", metavar="FILE",
+                            help="save the percentiles of every link over the whole capture (all slices merged), "
+                                 ".csv / .parquet / .arrow")
+    args = arg_parser.parse_args(argv)
+
+    for mac in filter(None, (args.ta, args.ra)):
+        try:
+            mac_to_bytes(mac)
+        except ValueError:
+            arg_parser.error(f"invalid MAC address {mac!r}")
+    if args.profile and not args.metrics:
+        arg_parser.error("--profile needs --metrics")
+    percentiles = None
+    if args.percentiles or args.distributions:
+        try:
+            percentiles = [float(value) for value in (args.percentiles or ",".join(map(str, PERCENTILES))).split(',')]
+        except ValueError:
+            arg_parser.error(f"invalid --percentiles {args.percentiles!r}")
+        if not all(0 <= value <= 100 for value in percentiles):
+            arg_parser.error("percentiles must be between 0 and 100")
+    captures = expand_captures(args.captures)
+    if not captures:
+        arg_parser.error("no capture matched")
+
+    metrics = {} if args.metrics else None
+    distributions = {} if args.distributions else None
+    writer = None
+    output = args.output
+    if args.format != "csv":
+        output = os.path.splitext(output)[0] if output.endswith(".csv") else output
+        link_columns = [column for columns in LINK_COLUMNS.values() for column in columns]
+        writer = DatasetWriter(output, args.format, partition_by=['capture', *link_columns])
+    summary, errors = run_batch(
+        captures, args.jobs, slice_s=args.slice, start_s=args.start, end_s=args.end, busiest_link=args.busiest_link,
+        metrics=metrics, profile=args.profile, writer=writer, distributions=distributions,
+        phy=args.parser, transmitter_mac=args.ta, receiver_mac=args.ra, subtype=args.subtype,
+        window_size=args.window, step=args.step, max_duration=args.max_duration or None, cache_dir=args.cache_dir,
+        group_by=args.group_by, percentiles=percentiles,
+    )
+    if writer is None:
+        summary.to_csv(output, index=False)
+    if metrics is not None:
+        with open(args.metrics, 'w') as f:
+            json.dump({'jobs': metrics}, f, indent=1)
+        print(f"[INFO] Stage metrics of {len(metrics)} jobs -> {args.metrics}")
+    if distributions is not None:
+        columns = ['capture', *LINK_COLUMNS[args.group_by or 'ta_ra'], 'packets', *percentile_columns(percentiles)]
+        path = write_rows(args.distributions, distribution_rows(distributions, percentiles), columns,
+                          format_of(args.distributions))
+        print(f"[INFO] Percentiles of {len(distributions)} links -> {path}")
+    if args.plots and len(summary):
+        images = render_many(plot_jobs(summary, args.plots, args.plot_layout), args.jobs)
+        print(f"[INFO] {sum(map(len, images))} plots -> {args.plots}")
+    failed = f", {len(errors)} failed jobs" if errors else ""
+    print(f"[INFO] {len(captures)} captures{failed}, {len(summary)} windows -> {output}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
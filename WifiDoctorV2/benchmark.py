@@ -0,0 +1,322 @@
+"""
+Offline benchmark of the analysis stages on synthetic captures.
+
+Every capture of a suite is generated by synthetic_capture.py (or given with --capture) and
+run through the stages of wifi_doctor one by one:
+
+    extract   extract_all_data(backend="native", fields=ANALYSIS_FIELDS)
+    rate_gap  add_rate_gap()
+    filter    filter_for_1_2() on the link
+    rssid     compute_rssid_series() over the whole capture
+    windows   compute_link_windows() on the link
+    export    the CSVs of run_analysis() (window summary and RSSID series)
+    pipeline  pipeline.analyze_capture(), the one-pass path of batch.py, end to end
+
+A stage is timed best of --repeat runs (wall and CPU time) and run once more under tracemalloc
+for its peak allocation. The results go to a JSON file together with the commit, the Python /
+NumPy versions and the capture parameters, and --compare prints the change against an earlier
+file and exits with 1 when a stage got slower than --tolerance allows.
+
+    python benchmark.py --suite quick -o bench.json
+    python benchmark.py --suite quick -o new.json --compare bench.json
+    python benchmark.py --capture pcap_files/test.pcap
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import parser_11ac
+import parser_11n
+import synthetic_capture
+from packet_table import ANALYSIS_FIELDS, MISSING_TIME
+from wifi_analysis_engine import compute_link_windows, compute_rssid_series
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_VERSION = 1
+REPEAT = 3
+TOLERANCE = 0.10
+STAGES = ("extract", "rate_gap", "filter", "rssid", "windows", "export", "pipeline")
+PARSERS = {"11n": parser_11n, "11ac": parser_11ac}
+
+# suite -> keyword arguments of synthetic_capture.write_capture(), one dict per capture
+SUITES = {
+    'quick': [
+        {'packets': 20_000, 'phy': '11n'},
+        {'packets': 20_000, 'phy': '11ac', 'fmt': 'pcapng'},
+    ],
+    'full': [
+        {'packets': 100_000, 'phy': '11n'},
+        {'packets': 100_000, 'phy': '11ac', 'fmt': 'pcapng'},
+        {'packets': 200_000, 'phy': '11n', 'stations': 16, 'access_points': 4, 'channels': (1, 6, 36, 149),
+         'retry_rate': 0.3},
+        {'packets': 200_000, 'phy': '11ac', 'stations': 4, 'access_points': 8, 'channels': (36, 40, 44, 48),
+         'beacons_per_s': 50.0, 'data_rate_pps': 200.0},
+    ],
+}
+
+
+def capture_name(params):
+    """File name of a synthetic capture, derived from every parameter so reused files always match."""
+    channels = "-".join(str(channel) for channel in params.get('channels', (6,)))
+    return (f"{params.get('phy', '11n')}_{params['packets']}_s{params.get('stations', 2)}"
+            f"_ap{params.get('access_points', 1)}_ch{channels}_b{params.get('beacons_per_s', 10.0):g}"
+            f"_d{params.get('data_rate_pps', 500.0):g}_r{params.get('retry_rate', 0.1):g}"
+            f"_seed{params.get('seed', 0)}.{params.get('fmt', 'pcap')}")
+
+
+def git_revision():
+    """(commit hash, dirty) of the checkout, (None, None) outside of git."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=cwd, check=True)
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                text=True, cwd=cwd, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def max_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(function, repeat=REPEAT):
+    """
+    Returns:
+        tuple: (result of the last call, {seconds, cpu_seconds, peak_bytes}), the times are the
+            best of repeat runs, the peak allocation comes from one extra traced run
+    """
+    best_wall = best_cpu = float('inf')
+    for _ in range(repeat):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        result = function()
+        best_wall = min(best_wall, time.perf_counter() - start_wall)
+        best_cpu = min(best_cpu, time.process_time() - start_cpu)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'seconds': best_wall, 'cpu_seconds': best_cpu, 'peak_bytes': peak}
+
+
+def _link_windows(link):
+    # the part of analyze_link() after the RSSID series
+    usable = (link['sniff_time'] != MISSING_TIME) & ~np.isnan(link['signal_strength'])
+    packets = link.take(usable).sort_by('sniff_time')
+    return packets, (packets['sniff_time'] - packets['sniff_time'][0]) / 1e9
+
+
+def _export(results, rssid_series, output_dir):
+    from output_writers import RSSID_SERIES_COLUMNS, SUMMARY_COLUMNS, write_rows
+    write_rows(os.path.join(output_dir, "wifi_analysis_summary"), results, SUMMARY_COLUMNS)
+    write_rows(os.path.join(output_dir, "rssid_series"), rssid_series.rows(), RSSID_SERIES_COLUMNS)
+
+
+def run_stages(pcap_file, phy, transmitter_mac, receiver_mac, repeat=REPEAT, stages=STAGES, output_dir=None):
+    """
+    Times the stages on one capture.
+
+    Args:
+        pcap_file (str): the capture
+        phy (str): "11n" or "11ac"
+        transmitter_mac, receiver_mac (str): the analyzed link
+        repeat (int): timed runs per stage, the best counts
+        stages (tuple): the stages to time (the earlier ones run untimed when a later one needs them)
+        output_dir (str): where the export stage writes (default: a temporary directory)
+
+    Returns:
+        dict: stage -> {seconds, cpu_seconds, peak_bytes, frames, frames_per_s}
+    """
+    parser = PARSERS[phy]
+    timings = {}
+
+    def stage(name, function, frames):
+        if name not in stages:
+            return function()
+        result, timing = measure(function, repeat)
+        count = frames(result)
+        timing['frames'] = count
+        timing['frames_per_s'] = count / timing['seconds'] if timing['seconds'] > 0 else None
+        timings[name] = timing
+        return result
+
+    needed = set(stages)
+    table = stage("extract", lambda: parser.extract_all_data(pcap_file, backend="native", fields=ANALYSIS_FIELDS), len)
+    total = len(table)
+    if needed - {"extract", "pipeline"}:
+        table = stage("rate_gap", lambda: parser.add_rate_gap(table), len)
+        link = stage("filter", lambda: parser.filter_for_1_2(table, transmitter_mac, receiver_mac, "0x0028"),
+                     lambda _: total)
+        rssid_series = stage("rssid", lambda: compute_rssid_series(table), lambda _: total)
+        packets, timestamps = _link_windows(link)
+        if len(packets):
+            channel = int(packets['channel'][0]) if packets['channel'][0] >= 0 else 1
+            link_rssid = rssid_series.link_rssid(channel, int(packets['sniff_time'][0]) / 1e9)
+            _, results = stage("windows", lambda: compute_link_windows(packets, timestamps, link_rssid),
+                               lambda _: len(packets))
+            if "export" in needed:
+                with tempfile.TemporaryDirectory() as tmp:
+                    stage("export", lambda: _export(results, rssid_series, output_dir or tmp), lambda _: len(packets))
+        else:
+            print(f"[WARN] {os.path.basename(pcap_file)}: no frames on {transmitter_mac} -> {receiver_mac}, "
+                  "windows and export are skipped")
+    if "pipeline" in needed:
+        import pipeline
+        stage("pipeline", lambda: pipeline.analyze_capture(pcap_file, phy, transmitter_mac, receiver_mac),
+              lambda _: total)
+    return timings
+
+
+def benchmark_capture(pcap_file, repeat=REPEAT, stages=STAGES, params=None):
+    """Stage timings of one capture, parser and link come from a header-only scan of it."""
+    from capture_catalog import scan_capture
+    scan = scan_capture(pcap_file)
+    link = scan['busiest_link']
+    if link is None:
+        raise ValueError(f"{pcap_file} has no data frames to analyze")
+    print(f"[INFO] {os.path.basename(pcap_file)}: {scan['packets']} packets, {scan['parser']}, "
+          f"link {link['ta']} -> {link['ra']}")
+    return {
+        'name': os.path.basename(pcap_file),
+        'params': params,
+        'packets': scan['packets'],
+        'parser': scan['parser'],
+        'link': link,
+        'stages': run_stages(pcap_file, scan['parser'], link['ta'], link['ra'], repeat, stages),
+    }
+
+
+def run_suite(suite, workdir, repeat=REPEAT, stages=STAGES):
+    """Generates (or reuses) the captures of a suite in workdir and benchmarks each of them."""
+    captures = []
+    for params in SUITES[suite]:
+        path = os.path.join(workdir, capture_name(params))
+        if not os.path.exists(path):
+            print(f"[INFO] Generating {os.path.basename(path)}...")
+            synthetic_capture.write_capture(path, **params)
+        captures.append(benchmark_capture(path, repeat, stages, {**params, 'channels': list(params.get('channels', (6,)))}))
+    return captures
+
+
+def environment():
+    commit, dirty = git_revision()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(old, new, tolerance=TOLERANCE):
+    """
+    Prints new against old stage by stage (captures matched by name).
+
+    Returns:
+        list: (capture, stage, ratio) of every stage that got slower than 1 + tolerance
+    """
+    regressions = []
+    old_captures = {capture['name']: capture for capture in old['captures']}
+    print(f"\nComparing with {old.get('commit') or '?'} ({old.get('created', '?')}):")
+    for capture in new['captures']:
+        previous = old_captures.get(capture['name'])
+        if previous is None:
+            print(f"  {capture['name']}: not in the old results")
+            continue
+        print(f"  {capture['name']}:")
+        for stage, timing in capture['stages'].items():
+            before = previous['stages'].get(stage)
+            if not before or not before['seconds']:
+                continue
+            ratio = timing['seconds'] / before['seconds']
+            memory = timing['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else float('nan')
+            slower = ratio > 1 + tolerance
+            if slower:
+                regressions.append((capture['name'], stage, ratio))
+            print(f"    {stage:<9} {before['seconds'] * 1000:9.1f} -> {timing['seconds'] * 1000:9.1f} ms "
+                  f"x{ratio:5.2f}  peak x{memory:5.2f}{'  SLOWER' if slower else ''}")
+    return regressions
+
+
+def print_report(captures):
+    for capture in captures:
+        print(f"\n{capture['name']} ({capture['packets']} packets)")
+        for stage, timing in capture['stages'].items():
+            rate = f"{timing['frames_per_s']:12,.0f} frames/s" if timing['frames_per_s'] else ""
+            print(f"  {stage:<9} {timing['seconds'] * 1000:9.1f} ms  cpu {timing['cpu_seconds'] * 1000:9.1f} ms  "
+                  f"peak {timing['peak_bytes'] / 2**20:8.1f} MiB  {rate}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the analysis stages on synthetic captures.")
+    arg_parser.add_argument("--suite", choices=list(SUITES), default="quick")
+    arg_parser.add_argument("--capture", action="append", help="benchmark this capture instead of a suite (repeatable)")
+    arg_parser.add_argument("--workdir", help="where the synthetic captures are generated and reused "
+                                              "(default: a temporary directory)")
+    arg_parser.add_argument("--stages", default=",".join(STAGES), help="comma separated stages to time")
+    arg_parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per stage, the best counts")
+    arg_parser.add_argument("-o", "--output", help="write the results as JSON")
+    arg_parser.add_argument("--compare", help="earlier results JSON to compare with")
+    arg_parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                            help="slowdown ratio above 1 that counts as a regression (default 0.10)")
+    args = arg_parser.parse_args(argv)
+
+    stages = tuple(stage for stage in args.stages.split(",") if stage)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        arg_parser.error(f"unknown stages {', '.join(sorted(unknown))}, expected {', '.join(STAGES)}")
+    if args.capture:
+        captures = [benchmark_capture(path, args.repeat, stages) for path in args.capture]
+    elif args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        captures = run_suite(args.suite, args.workdir, args.repeat, stages)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            captures = run_suite(args.suite, workdir, args.repeat, stages)
+
+    results = {
+        'version': RESULTS_VERSION,
+        **environment(),
+        'suite': None if args.capture else args.suite,
+        'repeat': args.repeat,
+        'max_rss_bytes': max_rss_bytes(),
+        'captures': captures,
+    }
+    print_report(captures)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"\n[INFO] Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get('version') != RESULTS_VERSION:
+            print(f"[WARN] {args.compare} has results version {old.get('version')}, expected {RESULTS_VERSION}")
+        regressions = compare(old, results, args.tolerance)
+        if regressions:
+            print(f"\n[WARN] {len(regressions)} stage(s) slower than x{1 + args.tolerance:.2f}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
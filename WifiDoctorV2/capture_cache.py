@@ -0,0 +1,269 @@
+"""
+On-disk cache of extracted + rate-gap annotated PacketTables.
+
+Entries are .npz files keyed by the capture's content hash, the parser (parser_11n / parser_11ac)
+and its PARSER_VERSION, and the frame filter used during extraction. The content hash is
+memoised per (path, size, mtime) in index.json so a warm lookup does not re-read the capture.
+The directory is kept under max_bytes by evicting the least recently used entries.
+
+The default directory is $WIFIDOCTOR_CACHE_DIR, else $XDG_CACHE_HOME/wifidoctor (~/.cache/wifidoctor),
+never the source tree. load_or_extract() only caches when it is given a CaptureCache.
+
+Several processes can share one cache (batch.py --jobs with --cache-dir): files are written
+under unique temporary names and renamed into place, and every read-modify-write of index.json
+holds an exclusive lock on index.lock. A missing or unreadable index only costs a re-hash.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import instrumentation
+from packet_table import PacketTable
+
+DEFAULT_CACHE_DIR = pathlib.Path(os.environ.get("WIFIDOCTOR_CACHE_DIR") or pathlib.Path(
+    os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache") / "wifidoctor")
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+HASH_BLOCK = 1024 * 1024
+
+
+@contextlib.contextmanager
+def _locked(path):
+    # exclusive lock on path for the duration of the block, between processes
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _umask()
+
+
+def write_atomic(path, write):
+    """
+    Calls write(temporary path) for a unique file next to path and renames it over path, so readers
+    see the old file or the new one but never a partial one (also used by time_index).
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.stem + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        # mkstemp creates the file 0600, give it the mode any other file would get so a shared cache stays readable
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        pathlib.Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def hash_file(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CaptureCache:
+    """
+    Args:
+        cache_dir (str): where the .npz entries and index.json live
+        max_bytes (int): size bound of all entries together, older entries are evicted first
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / "index.json"
+        self.lock_path = self.cache_dir / "index.lock"
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(index, dict):
+            return {}
+        # entries from a damaged or foreign index are dropped, they only cost a re-hash
+        return {path: entry for path, entry in index.items()
+                if isinstance(entry, dict) and {'size', 'mtime_ns', 'hash', 'keys'} <= entry.keys()}
+
+    def _save_index(self, index):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(index, f, indent=1)
+        write_atomic(self.index_path, write)
+
+    @contextlib.contextmanager
+    def _index(self):
+        """The index for a read-modify-write, saved on exit if changed, other processes wait meanwhile."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with _locked(self.lock_path):
+            index = self._load_index()
+            before = json.dumps(index, sort_keys=True)
+            yield index
+            if json.dumps(index, sort_keys=True) != before:
+                self._save_index(index)
+
+    def content_hash(self, pcap_file):
+        """Content hash of pcap_file, only recomputed when its size or mtime changed."""
+        path = str(pathlib.Path(pcap_file).resolve())
+        stat = os.stat(path)
+        entry = self._load_index().get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['hash']
+        # hashed outside the lock, a large capture must not hold up the other workers
+        content = hash_file(path)
+        with self._index() as index:
+            entry = index.get(path)
+            keys = []
+            if entry:
+                if entry['hash'] == content:
+                    keys = entry['keys']
+                else:
+                    # the capture changed, its old entries can never be hit again
+                    for key in entry['keys']:
+                        self._entry_path(key).unlink(missing_ok=True)
+            index[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content, 'keys': keys}
+        return content
+
+    def key(self, pcap_file, parser_name, parser_version, variant=""):
+        """
+        Args:
+            variant (str): anything else the table depends on, e.g. repr() of the frame filter
+        """
+        content = self.content_hash(pcap_file)
+        raw = f"{content}|{parser_name}|{parser_version}|{variant}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            table = PacketTable.load_npz(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except OSError:
+            pass  # evicted by another process since, the loaded table is still good
+        return table
+
+    def put(self, key, table, pcap_file):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        write_atomic(self._entry_path(key), table.save_npz)
+
+        with self._index() as index:
+            entry = index.get(str(pathlib.Path(pcap_file).resolve()))
+            if entry is not None and key not in entry['keys']:
+                entry['keys'].append(key)
+        self.evict()
+
+    def invalidate(self, pcap_file):
+        """Drops every entry extracted from pcap_file."""
+        if not self.cache_dir.exists():
+            return
+        with self._index() as index:
+            entry = index.pop(str(pathlib.Path(pcap_file).resolve()), None)
+            for key in entry['keys'] if entry else []:
+                self._entry_path(key).unlink(missing_ok=True)
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self.cache_dir.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob("*.npz"):
+            path.unlink(missing_ok=True)
+        self.index_path.unlink(missing_ok=True)
+
+
+@instrumentation.instrumented("load")
+def load_or_extract(pcap_file, parser, frame_filter=None, cache=None, fields=None, **extract_kwargs):
+    """
+    Returns the extracted, rate-gap annotated table for pcap_file, from the cache when possible.
+    An unfiltered, all-columns entry also serves filtered and projected requests.
+    Without a cache this is just the extraction.
+
+    Args:
+        pcap_file (str): path to the pcap file
+        parser (module): parser_11n or parser_11ac
+        frame_filter (FrameFilter): optional extraction filter
+        cache (CaptureCache): where to look up / store the table, None = no caching
+        fields (list): columns to extract (see packet_table.ANALYSIS_FIELDS), None = all
+        extract_kwargs: passed on to parser.extract_all_data (backend, workers)
+
+    Returns:
+        PacketTable: extracted packets with rate_gap filled in
+    """
+    if cache is None:
+        return parser.add_rate_gap(parser.extract_all_data(pcap_file, frame_filter=frame_filter, fields=fields,
+                                                           **extract_kwargs))
+    parser_name = parser.__name__
+    # the backends decode some fields differently, so a forced backend gets its own entries
+    # ("auto" keeps the plain keys), workers only changes how the same table is decoded
+    backend = extract_kwargs.get("backend", "auto")
+    backend_variant = f"backend={backend}" if backend != "auto" else ""
+    full_key = cache.key(pcap_file, parser_name, parser.PARSER_VERSION, backend_variant)
+    table = cache.get(full_key)
+    if table is not None:
+        print(f"[INFO] Using cached extraction of {pcap_file}")
+        instrumentation.note(cache="hit")
+        if frame_filter:
+            table = table.take(frame_filter.mask(table))
+        if fields is not None:
+            table = table.select(fields)
+        return table
+
+    variant = repr(frame_filter) if frame_filter else ""
+    if fields is not None:
+        variant += f"|fields={sorted(fields)}"
+    if variant and backend_variant:
+        variant += f"|{backend_variant}"
+    key = cache.key(pcap_file, parser_name, parser.PARSER_VERSION, variant) if variant else full_key
+    if key != full_key:
+        table = cache.get(key)
+        if table is not None:
+            print(f"[INFO] Using cached extraction of {pcap_file}")
+            instrumentation.note(cache="hit")
+            return table
+
+    instrumentation.note(cache="miss")
+    table = parser.add_rate_gap(parser.extract_all_data(pcap_file, frame_filter=frame_filter, fields=fields, **extract_kwargs))
+    cache.put(key, table, pcap_file)
+    return table
@@ -0,0 +1,222 @@
+"""
+Catalog of the captures in pcap_files/ with cached per-file metadata.
+
+Every capture is summarized by one header-only pass over its records (record headers,
+radiotap presence bits / channel, 802.11 addresses; only beacons and probe responses are
+fully decoded for their SSID): packet count, duration, PHY mix, channels, the busiest TA/RA
+pairs and the SSIDs seen. The summaries are kept in <pcap dir>/.catalog.json and a capture is
+only scanned again when its size or mtime changed, so listing the directory stays instant.
+
+The catalog also picks the parser (11ac as soon as VHT frames show up, like detect_phy()) and
+the busiest link (the TA/RA pair with the most QoS data frames) of a capture.
+
+    python capture_catalog.py pcap_files
+"""
+import json
+import pathlib
+import sys
+from collections import Counter
+from capture_cache import write_atomic
+from packet_table import MISSING_TIME
+from pcap_reader import (
+    PcapFormatError, LINKTYPE_IEEE802_11_RADIOTAP, PHY_11AC, PHY_11N, _open_mmap,
+    channel_from_frequency, decode_frame, format_mac, iter_records, peek_radiotap,
+)
+
+DEFAULT_PCAP_DIR = pathlib.Path(__file__).parent / "pcap_files"
+CATALOG_FILE = ".catalog.json"
+CATALOG_VERSION = 1
+CAPTURE_SUFFIXES = (".pcap", ".pcapng")
+TOP_LINKS = 10
+QOS_DATA = 0x28
+SSID_SUBTYPES = (0x05, 0x08)  # probe response, beacon
+PHY_NAMES = {PHY_11AC: "11ac", PHY_11N: "11n", None: "legacy"}
+
+
+def scan_capture(pcap_file, top_links=TOP_LINKS):
+    """
+    Header-only summary of one capture.
+
+    Args:
+        pcap_file (str): path to the pcap / pcapng file
+        top_links (int): how many TA/RA pairs to keep
+
+    Returns:
+        dict: packets, first_time (ns), duration (s), phy_mix {"11n"/"11ac"/"legacy": frames},
+            channels {channel: frames}, links [{ta, ra, frames, qos_data}] busiest first,
+            ssids [{ssid, bssid, channel, frames}], parser ("11n" / "11ac") and busiest_link
+    """
+    packets = 0
+    first_time = last_time = None
+    phy_mix = Counter()
+    frequencies = Counter()
+    pair_frames = Counter()
+    pair_qos = Counter()
+    ssids = Counter()
+    with open(pcap_file, 'rb') as f, _open_mmap(f) as buf:
+        for sniff_time, data, caplen, origlen, linktype, _ in iter_records(buf):
+            if linktype != LINKTYPE_IEEE802_11_RADIOTAP:
+                raise PcapFormatError(f"unsupported link type {linktype}")
+            packets += 1
+            if sniff_time != MISSING_TIME:
+                first_time = sniff_time if first_time is None else min(first_time, sniff_time)
+                last_time = sniff_time if last_time is None else max(last_time, sniff_time)
+            try:
+                radiotap_length, phy_type, frequency = peek_radiotap(buf, data, caplen)
+            except PcapFormatError:
+                continue
+            phy_mix[phy_type] += 1
+            frequencies[frequency] += 1
+
+            header = data + radiotap_length
+            if caplen - radiotap_length < 16:
+                continue
+            fc0 = buf[header]
+            frame_type = (fc0 >> 2) & 0x3
+            subtype = (fc0 >> 4) & 0xf
+            if frame_type == 2:
+                # RA and TA side by side, formatted once per pair at the end
+                pair = bytes(buf[header + 4:header + 16])
+                pair_frames[pair] += 1
+                if (frame_type << 4) | subtype == QOS_DATA:
+                    pair_qos[pair] += 1
+            elif frame_type == 0 and subtype in SSID_SUBTYPES:
+                frame = decode_frame(buf, data, caplen, origlen, '11n')
+                if frame.get('ssid'):
+                    ssids[(frame['ssid'], frame.get('bssid'), frame.get('channel'))] += 1
+
+    links = [{'ta': format_mac(pair, 6), 'ra': format_mac(pair, 0), 'frames': frames, 'qos_data': pair_qos[pair]}
+             for pair, frames in pair_frames.items()]
+    links.sort(key=lambda link: (link['qos_data'], link['frames']), reverse=True)
+    channels = Counter()
+    for frequency, frames in frequencies.items():
+        channel = channel_from_frequency(frequency) if frequency else None
+        if channel is not None:
+            channels[channel] += frames
+
+    if phy_mix[PHY_11AC]:
+        parser = "11ac"
+    elif phy_mix[PHY_11N]:
+        parser = "11n"
+    else:
+        parser = "11ac" if any(frequency and frequency >= 5000 for frequency in frequencies) else "11n"
+    busiest = links[0] if links else None
+    return {
+        'packets': packets,
+        'first_time': first_time,
+        'duration': (last_time - first_time) / 1e9 if first_time is not None else 0.0,
+        'phy_mix': {PHY_NAMES[phy_type]: frames for phy_type, frames in phy_mix.items() if phy_type in PHY_NAMES},
+        'channels': {str(channel): frames for channel, frames in sorted(channels.items())},
+        'links': links[:top_links],
+        'ssids': [{'ssid': ssid, 'bssid': bssid, 'channel': channel, 'frames': frames}
+                  for (ssid, bssid, channel), frames in ssids.most_common()],
+        'parser': parser,
+        'busiest_link': {'ta': busiest['ta'], 'ra': busiest['ra']} if busiest else None,
+    }
+
+
+class CaptureCatalog:
+    """
+    Args:
+        pcap_dir (str): directory with the captures, the catalog file lives in it
+    """
+
+    def __init__(self, pcap_dir=DEFAULT_PCAP_DIR):
+        self.pcap_dir = pathlib.Path(pcap_dir)
+        self.path = self.pcap_dir / CATALOG_FILE
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return catalog.get('captures', {}) if catalog.get('version') == CATALOG_VERSION else {}
+
+    def _save(self, captures):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump({'version': CATALOG_VERSION, 'captures': captures}, f, indent=1)
+        try:
+            # two menus refreshing the same directory must not interleave their writes
+            write_atomic(self.path, write)
+        except OSError as error:
+            print(f"[WARN] Could not save the capture catalog {self.path}: {error}")
+
+    def files(self):
+        return sorted(f for f in self.pcap_dir.iterdir() if f.suffix in CAPTURE_SUFFIXES and f.is_file())
+
+    @staticmethod
+    def _scan(path, stat, verbose):
+        if verbose:
+            print(f"[INFO] Cataloging {path.name}...")
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        try:
+            entry.update(scan_capture(path))
+        except (OSError, PcapFormatError) as error:
+            entry['error'] = str(error)
+        return entry
+
+    def refresh(self, verbose=True):
+        """
+        Scans the captures that are new or changed since the last refresh and forgets the
+        removed ones.
+
+        Returns:
+            dict: file name -> entry (see scan_capture(), plus size / mtime_ns, or 'error')
+        """
+        captures = self._load()
+        fresh = {}
+        changed = False
+        for path in self.files():
+            stat = path.stat()
+            entry = captures.get(path.name)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                entry = self._scan(path, stat, verbose)
+                changed = True
+            fresh[path.name] = entry
+        if changed or set(fresh) != set(captures):
+            self._save(fresh)
+        return fresh
+
+    def entry(self, pcap_file, verbose=True):
+        """The (refreshed) entry of one capture in this catalog's directory."""
+        path = pathlib.Path(pcap_file)
+        stat = path.stat()
+        captures = self._load()
+        entry = captures.get(path.name)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = captures[path.name] = self._scan(path, stat, verbose)
+            self._save(captures)
+        return entry
+
+
+def catalog_entry(pcap_file, verbose=False):
+    """Catalog entry of pcap_file from the catalog of its own directory."""
+    return CaptureCatalog(pathlib.Path(pcap_file).parent).entry(pcap_file, verbose)
+
+
+def describe(entry):
+    """One line summary of a catalog entry for the file menu."""
+    if 'error' in entry:
+        return f"[unreadable: {entry['error']}]"
+    phy = "/".join(f"{name} {frames * 100 // max(entry['packets'], 1)}%" for name, frames in entry['phy_mix'].items())
+    channels = ",".join(entry['channels']) or "-"
+    ssids = ", ".join(sorted({ssid['ssid'] for ssid in entry['ssids']})[:3]) or "-"
+    link = entry['busiest_link']
+    busiest = f"{link['ta']} -> {link['ra']}" if link else "-"
+    return (f"{entry['packets']} packets, {entry['duration']:.0f}s, {phy or '-'}, ch {channels}, "
+            f"SSIDs {ssids}, busiest {busiest}")
+
+
+def main(argv=None):
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Refresh and print the capture catalog of a directory.")
+    arg_parser.add_argument("pcap_dir", nargs="?", default=str(DEFAULT_PCAP_DIR))
+    args = arg_parser.parse_args(argv)
+    for name, entry in CaptureCatalog(args.pcap_dir).refresh().items():
+        print(f"{name}: {describe(entry)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
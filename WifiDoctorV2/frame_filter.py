@@ -0,0 +1,136 @@
+"""
+TA / RA / subtype (and optional time range) predicate that is pushed into extraction,
+so frames filter_for_1_2 would throw away are never fully dissected.
+Beacons are kept by default because the RSSID series (compute_rssid_series()) needs them.
+"""
+import numpy as np
+from packet_table import MISSING_TIME
+
+BEACON_SUBTYPE = "0x0008"
+
+
+def mac_to_bytes(mac):
+    return bytes(int(part, 16) for part in mac.split(':'))
+
+
+class FrameFilter:
+    """
+    Args:
+        transmitter_mac (str): keep only frames sent by this TA (None = any)
+        receiver_mac (str): keep only frames sent to this RA (None = any)
+        subtype (str): keep only this wlan.fc.type_subtype, e.g. "0x0028" (None = any)
+        keep_beacons (bool): beacons pass regardless of TA/RA/subtype
+        start_s (float): drop frames earlier than start_s seconds after the first frame of the capture
+        end_s (float): drop frames at or after end_s seconds after the first frame of the capture
+
+    The time origin is the first frame with a timestamp (pcapng simple packet blocks have none),
+    frames without a timestamp never pass a time range.
+    """
+
+    def __init__(self, transmitter_mac=None, receiver_mac=None, subtype=None, keep_beacons=True, start_s=None, end_s=None):
+        self.transmitter_mac = transmitter_mac.lower() if transmitter_mac else None
+        self.receiver_mac = receiver_mac.lower() if receiver_mac else None
+        self.subtype = subtype
+        self.keep_beacons = keep_beacons
+        self.start_s = start_s
+        self.end_s = end_s
+        self._ta = mac_to_bytes(self.transmitter_mac) if self.transmitter_mac else None
+        self._ra = mac_to_bytes(self.receiver_mac) if self.receiver_mac else None
+        self._subtype = int(subtype, 16) if subtype else None
+
+    def __repr__(self):
+        return (f"FrameFilter(transmitter_mac={self.transmitter_mac!r}, receiver_mac={self.receiver_mac!r}, "
+                f"subtype={self.subtype!r}, keep_beacons={self.keep_beacons!r}, "
+                f"start_s={self.start_s!r}, end_s={self.end_s!r})")
+
+    def matches_time(self, sniff_time, first_time):
+        """
+        Args:
+            sniff_time (int): the frame's time in ns, MISSING_TIME when it has none
+            first_time (int): time of the first timestamped frame of the capture (see pcap_reader.first_record_time())
+        """
+        if self.start_s is None and self.end_s is None:
+            return True
+        if sniff_time == MISSING_TIME:
+            return False
+        relative_ns = sniff_time - first_time
+        if self.start_s is not None and relative_ns < self.start_s * 1e9:
+            return False
+        if self.end_s is not None and relative_ns >= self.end_s * 1e9:
+            return False
+        return True
+
+    def matches_header(self, buf, offset, end):
+        """
+        Early check on the raw 802.11 header at buf[offset:end], before anything else is decoded.
+        """
+        if self._subtype is None and self._ra is None and self._ta is None:
+            return True
+        # shorter frames get no subtype or addresses in the table either, see pcap_reader.decode_80211()
+        if end - offset < 10:
+            return False
+        fc0 = buf[offset]
+        type_subtype = (((fc0 >> 2) & 0x3) << 4) | ((fc0 >> 4) & 0xf)
+        if self.keep_beacons and type_subtype == 0x08:
+            return True
+        if self._subtype is not None and type_subtype != self._subtype:
+            return False
+        if self._ra is not None and buf[offset + 4:offset + 10] != self._ra:
+            return False
+        if self._ta is not None:
+            # control frames without an addr2 (CTS / ACK) have no TA
+            if end - offset < 16 or (type_subtype >> 4 == 1 and type_subtype & 0xf in (0xc, 0xd)):
+                return False
+            if buf[offset + 10:offset + 16] != self._ta:
+                return False
+        return True
+
+    def mask(self, table):
+        """
+        The same predicate evaluated on an already extracted (unfiltered) PacketTable.
+
+        Returns:
+            numpy.ndarray: boolean mask of the rows that pass
+        """
+        keep = np.ones(len(table), dtype=bool)
+        if self.transmitter_mac:
+            keep &= table.equals('transmitter_mac', self.transmitter_mac)
+        if self.receiver_mac:
+            keep &= table.equals('receiver_mac', self.receiver_mac)
+        if self.subtype:
+            keep &= table.equals('frame_type_subtype', self.subtype)
+        if self.keep_beacons:
+            keep |= table.equals('frame_type_subtype', BEACON_SUBTYPE)
+        if self.start_s is not None or self.end_s is not None:
+            sniff_time = table['sniff_time']
+            timed = sniff_time != MISSING_TIME
+            keep &= timed
+            if timed.any():
+                # the same origin as the extraction, the first timestamped frame
+                relative_ns = sniff_time - sniff_time[np.argmax(timed)]
+                if self.start_s is not None:
+                    keep &= relative_ns >= self.start_s * 1e9
+                if self.end_s is not None:
+                    keep &= relative_ns < self.end_s * 1e9
+        return keep
+
+    def display_filter(self):
+        """The same predicate as a wireshark display filter, for the tshark and pyshark backends."""
+        link = []
+        if self.transmitter_mac:
+            link.append(f"wlan.ta == {self.transmitter_mac}")
+        if self.receiver_mac:
+            link.append(f"wlan.ra == {self.receiver_mac}")
+        if self.subtype:
+            link.append(f"wlan.fc.type_subtype == {self.subtype}")
+        clauses = []
+        if link:
+            predicate = " && ".join(link)
+            if self.keep_beacons:
+                predicate = f"({predicate}) || wlan.fc.type_subtype == {BEACON_SUBTYPE}"
+            clauses.append(f"({predicate})")
+        if self.start_s is not None:
+            clauses.append(f"frame.time_relative >= {self.start_s}")
+        if self.end_s is not None:
+            clauses.append(f"frame.time_relative < {self.end_s}")
+        return " && ".join(clauses) or None
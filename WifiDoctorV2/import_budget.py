@@ -0,0 +1,97 @@
+"""
+Import-time budget of the Wi-Fi Doctor entry points.
+
+Every entry module is imported in a fresh interpreter with -X importtime. The report has the
+import time of the module (best of a few runs), the wall time of the whole process, its
+slowest imports and the heavy dependencies (pandas, matplotlib, pyshark, tqdm) that got loaded
+although they should only be imported where extraction, exports or plots happen.
+
+    python import_budget.py                   # every entry point against its budget
+    python import_budget.py batch --budget 0.3
+
+Exits with 1 when an entry point is over budget or loads a lazy dependency at import time.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# entry module -> import budget in seconds
+ENTRY_POINTS = {
+    'wifi_doctor': 0.5,
+    'batch': 0.5,
+    'streaming': 0.5,
+    'capture_catalog': 0.5,
+    'time_index': 0.5,
+}
+LAZY_MODULES = ('pandas', 'matplotlib', 'pyshark', 'tqdm')
+REPEAT = 3
+
+
+def measure_import(module, repeat=REPEAT):
+    """
+    Returns:
+        dict: import_s (best cumulative import time), wall_s (best process wall time),
+            slowest [(seconds, name)] direct imports of the module, lazy_loaded [names]
+    """
+    code = f"import sys, {module}; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        wall = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{process.stderr[-2000:]}")
+        import_s = 0.0
+        children = []  # direct imports of the module, printed before the module's own line
+        slowest = []
+        for line in process.stderr.splitlines():
+            # "import time:  self [us] | cumulative | imported package", nesting indents the name by 2
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 1:
+                children.append((int(cumulative) / 1e6, name.strip()))
+            elif depth == 0:
+                if name.strip() == module:
+                    import_s = int(cumulative) / 1e6
+                    slowest = sorted(children, reverse=True)[:5]
+                children = []
+        result = {
+            'import_s': import_s,
+            'wall_s': wall,
+            'slowest': slowest,
+            'lazy_loaded': [name for name in process.stdout.strip().split(',') if name],
+        }
+        if best is None or result['import_s'] < best['import_s']:
+            best = result
+    return best
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Check the import time of the entry points against a budget.")
+    arg_parser.add_argument("modules", nargs="*", help=f"entry modules (default: {', '.join(ENTRY_POINTS)})")
+    arg_parser.add_argument("--budget", type=float, help="budget in seconds for every module (overrides the defaults)")
+    arg_parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per module, the best one counts")
+    args = arg_parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules or list(ENTRY_POINTS):
+        budget = args.budget or ENTRY_POINTS.get(module, 0.5)
+        result = measure_import(module, args.repeat)
+        over = result['import_s'] > budget
+        failed |= over or bool(result['lazy_loaded'])
+        status = "OVER BUDGET" if over else "ok"
+        print(f"{module}: import {result['import_s'] * 1000:.0f} ms (budget {budget * 1000:.0f} ms, "
+              f"process {result['wall_s'] * 1000:.0f} ms) {status}")
+        print("    slowest: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for seconds, name in result['slowest']))
+        if result['lazy_loaded']:
+            print(f"    [WARN] loaded at import time: {', '.join(result['lazy_loaded'])}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""
+Per-stage instrumentation of the analysis: where a run spends its time and memory.
+
+The analysis code marks its stages (extract, tshark, rate_gap, filter, rssid, windows, export,
+plots, ...) with stage() or @instrumented. Nothing is recorded unless an Instrumentation is active, and then
+every stage gets:
+- wall and CPU time;
+- frames in / out (out is what the stage produced: frames, RSSID log entries or windows);
+- dropped frames (filtered away) and unparseable frames (malformed records, dissection errors);
+- the process RSS and its peak when the stage ends.
+
+Nested stages get paths like "extract/tshark". Repeated stages (one per chunk) are summed up.
+
+    with Instrumentation(hooks=[print], profile=True) as instrumentation:
+        run_wifi_doctor()
+    instrumentation.write_json("metrics.json")
+
+hooks are called with the record (dict) of every finished stage, e.g. to feed a metrics system.
+profile=True starts a sampling profiler thread. It counts the functions on the stack of every
+other thread each interval, per stage as well, so the hot loops of a capture type show up
+without the overhead of a deterministic profiler.
+
+Worker processes are not traced. batch.py instruments each job in its worker and collects the
+reports. wifi_doctor.py reads WIFIDOCTOR_METRICS (report path) and WIFIDOCTOR_PROFILE=1.
+"""
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_INTERVAL_S = 0.005
+PROFILE_TOP = 20
+
+_active = None
+
+
+def _max_rss_bytes(who=None):
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _rss_bytes():
+    # current resident set, Linux only
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class Stage:
+    """One run of a stage, the `as` target of stage(). Set frames_out / dropped / unparseable on it."""
+
+    def __init__(self, name, path, frames_in=None):
+        self.name = name
+        self.path = path
+        self.frames_in = frames_in
+        self.frames_out = None
+        self.dropped = 0
+        self.unparseable = 0
+        self.notes = {}
+        self.wall_s = self.cpu_s = 0.0
+        self.rss_bytes = self.rss_peak_bytes = None
+
+    def note(self, **notes):
+        """Extra facts about the run (e.g. backend="tshark", cache="hit")."""
+        self.notes.update(notes)
+
+    def count(self, dropped=0, unparseable=0):
+        self.dropped += dropped
+        self.unparseable += unparseable
+
+    def as_dict(self):
+        return {
+            'stage': self.path, 'wall_s': self.wall_s, 'cpu_s': self.cpu_s, 'frames_in': self.frames_in,
+            'frames_out': self.frames_out, 'dropped': self.dropped, 'unparseable': self.unparseable,
+            'rss_bytes': self.rss_bytes, 'rss_peak_bytes': self.rss_peak_bytes, **self.notes,
+        }
+
+
+class _NullStage:
+    """What stage() hands out when nothing is recorded, attribute sets and calls are ignored."""
+
+    def __setattr__(self, name, value):
+        pass
+
+    def note(self, **notes):
+        pass
+
+    def count(self, dropped=0, unparseable=0):
+        pass
+
+
+class _NullContext:
+    def __enter__(self):
+        return _NULL_STAGE
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_NULL_CONTEXT = _NullContext()
+
+
+class _StageContext:
+    def __init__(self, instrumentation, name, frames_in):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.frames_in = frames_in
+
+    def __enter__(self):
+        stack = self.instrumentation._stacks.setdefault(threading.get_ident(), [])
+        path = "/".join([*(record.path for record in stack[-1:]), self.name])
+        self.record = Stage(self.name, path, self.frames_in)
+        stack.append(self.record)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self.record
+
+    def __exit__(self, exc_type, *exc_info):
+        record = self.record
+        record.wall_s = time.perf_counter() - self._wall
+        record.cpu_s = time.process_time() - self._cpu
+        record.rss_bytes = _rss_bytes()
+        record.rss_peak_bytes = _max_rss_bytes()
+        if exc_type is not None:
+            record.note(error=exc_type.__name__)
+        self.instrumentation._stacks[threading.get_ident()].pop()
+        self.instrumentation._finish(record)
+        return False
+
+
+def stage(name, frames_in=None):
+    """
+    Marks a stage of the analysis:
+
+        with stage("rate_gap", frames_in=len(table)) as record:
+            table = ...
+            record.frames_out = len(table)
+
+    Costs next to nothing while no Instrumentation is active.
+    """
+    if _active is None:
+        return _NULL_CONTEXT
+    return _StageContext(_active, name, frames_in)
+
+
+def instrumented(name, table_arg=None, filters=False):
+    """
+    Decorator, runs the function as stage `name`. frames_out is the length of its result.
+
+    Args:
+        table_arg (int): position of the argument whose length is frames_in
+        filters (bool): the function selects frames, the ones it left out count as dropped
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            table = args[table_arg] if table_arg is not None and len(args) > table_arg else None
+            with _StageContext(_active, name, _length(table)) as record:
+                result = function(*args, **kwargs)
+                record.frames_out = _length(result)
+                if filters and record.frames_in is not None and record.frames_out is not None:
+                    record.dropped += record.frames_in - record.frames_out
+            return result
+        return wrapper
+    return decorate
+
+
+def _length(value):
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def note(**notes):
+    """Notes on the innermost running stage of this thread (see Stage.note())."""
+    if _active is None:
+        return
+    stack = _active._stacks.get(threading.get_ident())
+    if stack:
+        stack[-1].note(**notes)
+
+
+def count(dropped=0, unparseable=0):
+    """Adds dropped / unparseable frames to the innermost running stage of this thread."""
+    if _active is None:
+        return
+    stack = _active._stacks.get(threading.get_ident())
+    if stack:
+        stack[-1].count(dropped, unparseable)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a daemon thread that looks at the stacks of the other threads every
+    interval and counts the functions on them.
+
+    Args:
+        stage_of (callable): thread id -> current stage path (or None), to split samples by stage;
+            when given, only threads inside a stage are sampled (not idle pool / event loop threads)
+        interval (float): seconds between samples
+    """
+
+    def __init__(self, stage_of=None, interval=PROFILE_INTERVAL_S):
+        self.stage_of = stage_of
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter()
+        self.inclusive_counts = Counter()
+        self.stage_counts = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(code, line=None):
+        filename = os.path.basename(code.co_filename)
+        return f"{filename}:{code.co_name}" if line is None else f"{filename}:{line}:{code.co_name}"
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            path = self.stage_of(thread_id) if self.stage_of else None
+            if self.stage_of and not path:
+                continue
+            self.samples += 1
+            leaf = self._label(frame.f_code, frame.f_lineno)
+            self.self_counts[leaf] += 1
+            seen = set()
+            while frame is not None:
+                label = self._label(frame.f_code)
+                if label not in seen:
+                    seen.add(label)
+                    self.inclusive_counts[label] += 1
+                frame = frame.f_back
+            if path:
+                self.stage_counts.setdefault(path, Counter())[leaf] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self, top=PROFILE_TOP):
+        """Most sampled lines (self) and functions (anywhere on the stack), share of all samples."""
+        def shares(counter, limit):
+            return [{'function': label, 'samples': samples, 'share': samples / self.samples}
+                    for label, samples in counter.most_common(limit)]
+        return {
+            'interval_s': self.interval,
+            'samples': self.samples,
+            'self': shares(self.self_counts, top),
+            'inclusive': shares(self.inclusive_counts, top),
+            'stages': {path: shares(counter, 5) for path, counter in self.stage_counts.items()},
+        } if self.samples else {'interval_s': self.interval, 'samples': 0}
+
+
+class Instrumentation:
+    """
+    Records the stages run while it is active (inside its with block).
+
+    Args:
+        hooks (list): callables taking the record dict of every finished stage
+        profile (bool): also run the SamplingProfiler
+        profile_interval (float): seconds between profiler samples
+    """
+
+    def __init__(self, hooks=(), profile=False, profile_interval=PROFILE_INTERVAL_S):
+        self.hooks = list(hooks)
+        self.records = []
+        self.profiler = SamplingProfiler(self._stage_of, profile_interval) if profile else None
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._previous = None
+        self._wall = self._cpu = None
+        self.wall_s = self.cpu_s = None
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _stage_of(self, thread_id):
+        stack = self._stacks.get(thread_id)
+        return stack[-1].path if stack else None
+
+    def _finish(self, record):
+        with self._lock:
+            self.records.append(record)
+        if self.hooks:
+            record_dict = record.as_dict()
+            for hook in self.hooks:
+                hook(record_dict)
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        if self.profiler:
+            self.profiler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        if self.profiler:
+            self.profiler.stop()
+        self.wall_s = time.perf_counter() - self._wall
+        self.cpu_s = time.process_time() - self._cpu
+        _active = self._previous
+        return False
+
+    def stages(self):
+        """Records summed up per stage path, in the order the stages first finished."""
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record.path, {
+                'stage': record.path, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'frames_in': None,
+                'frames_out': None, 'dropped': 0, 'unparseable': 0, 'rss_peak_bytes': None,
+            })
+            entry['calls'] += 1
+            entry['wall_s'] += record.wall_s
+            entry['cpu_s'] += record.cpu_s
+            for key in ('frames_in', 'frames_out'):
+                if getattr(record, key) is not None:
+                    entry[key] = (entry[key] or 0) + getattr(record, key)
+            entry['dropped'] += record.dropped
+            entry['unparseable'] += record.unparseable
+            if record.rss_peak_bytes is not None:
+                entry['rss_peak_bytes'] = max(entry['rss_peak_bytes'] or 0, record.rss_peak_bytes)
+            for key, value in record.notes.items():
+                entry.setdefault(key, value)
+        for entry in summary.values():
+            entry['frames_per_s'] = (entry['frames_in'] or entry['frames_out'] or 0) / entry['wall_s'] \
+                if entry['wall_s'] > 0 else None
+        return list(summary.values())
+
+    def report(self):
+        """The structured report: host, totals, per-stage summary and (when on) the profile."""
+        report = {
+            'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+            'wall_s': self.wall_s,
+            'cpu_s': self.cpu_s,
+            'rss_peak_bytes': _max_rss_bytes(),
+            'children_rss_peak_bytes': _max_rss_bytes(resource.RUSAGE_CHILDREN) if resource else None,
+            'stages': self.stages(),
+        }
+        if self.profiler:
+            report['profile'] = self.profiler.report()
+        return report
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+    def print_summary(self, file=sys.stderr):
+        print(f"\n[METRICS] {self.wall_s or 0:.2f}s wall, {self.cpu_s or 0:.2f}s CPU, "
+              f"peak RSS {(_max_rss_bytes() or 0) / 2**20:.0f} MiB", file=file)
+        for entry in self.stages():
+            frames = f"{entry['frames_in'] if entry['frames_in'] is not None else '-'} in, " \
+                     f"{entry['frames_out'] if entry['frames_out'] is not None else '-'} out"
+            lost = f", {entry['dropped']} dropped" if entry['dropped'] else ""
+            lost += f", {entry['unparseable']} unparseable" if entry['unparseable'] else ""
+            print(f"  {entry['stage']:<24} {entry['wall_s'] * 1000:9.1f} ms  cpu {entry['cpu_s'] * 1000:9.1f} ms  "
+                  f"{frames}{lost}", file=file)
+        if self.profiler and self.profiler.samples:
+            print(f"  hottest lines ({self.profiler.samples} samples):", file=file)
+            for label, samples in self.profiler.self_counts.most_common(5):
+                print(f"    {samples * 100 / self.profiler.samples:5.1f}%  {label}", file=file)
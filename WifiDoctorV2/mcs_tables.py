@@ -0,0 +1,123 @@
+"""
+Expected MCS for a given RSSI, as lookup tables instead of if/elif chains.
+
+EXPECTED_MCS[(phy, spatial_streams)] = (thresholds, mcs):
+thresholds are ascending RSSI values in dBm, a frame with rssi >= thresholds[i]
+expects mcs[i + 1] and one below thresholds[0] expects mcs[0].
+New PHYs / stream counts are new entries, the lookup itself does not change.
+"""
+import numpy as np
+from packet_table import MISSING_INT
+
+_RSSI_STEPS = [-79, -77, -74, -70, -66, -65, -64]
+
+EXPECTED_MCS = {
+    ('11n', 1): (_RSSI_STEPS, list(range(0, 8))),
+    ('11n', 2): (_RSSI_STEPS, list(range(8, 16))),
+    ('11n', 3): (_RSSI_STEPS, list(range(16, 24))),
+    ('11ac', 1): (_RSSI_STEPS, list(range(0, 8))),
+    ('11ac', 2): (_RSSI_STEPS + [-59, -57], list(range(0, 10))),
+    ('11ac', 3): (_RSSI_STEPS, list(range(16, 24))),
+}
+
+# (first MCS, last MCS, spatial streams) used when the capture does not carry the stream count
+SPATIAL_STREAMS_BY_MCS = [
+    (1, 7, 1),
+    (8, 15, 2),
+    (16, 23, 3),
+]
+
+
+def infer_spatial_streams(mcs_index):
+    """
+    Args:
+        mcs_index (numpy.ndarray): MCS column, MISSING_INT when unknown
+
+    Returns:
+        numpy.ndarray: spatial streams implied by the MCS index, MISSING_INT when none applies
+    """
+    conditions = [(mcs_index >= first) & (mcs_index <= last) for first, last, _ in SPATIAL_STREAMS_BY_MCS]
+    choices = [streams for _, _, streams in SPATIAL_STREAMS_BY_MCS]
+    return np.select(conditions, choices, MISSING_INT)
+
+
+def fill_spatial_streams(data_all):
+    """Fills the missing spatial_streams of a PacketTable from its MCS index, in place."""
+    mcs_index = data_all['mcs_index']
+    spatial_streams = data_all['spatial_streams']
+    missing = (spatial_streams == MISSING_INT) & (mcs_index != MISSING_INT)
+    data_all.set_column('spatial_streams', np.where(missing, infer_spatial_streams(mcs_index), spatial_streams))
+    return data_all
+
+
+def expected_mcs_index(phy, rssi, spatial_streams):
+    """
+    Vectorized expected MCS lookup.
+
+    Args:
+        phy (str): "11n" or "11ac"
+        rssi (numpy.ndarray): signal strength in dBm
+        spatial_streams (numpy.ndarray): spatial streams per frame
+
+    Returns:
+        numpy.ndarray: expected MCS as float, NaN where there is no table for (phy, spatial streams)
+    """
+    rssi = np.asarray(rssi)
+    spatial_streams = np.asarray(spatial_streams)
+    expected = np.full(rssi.shape, np.nan)
+    for (table_phy, streams), (thresholds, mcs) in EXPECTED_MCS.items():
+        if table_phy != phy:
+            continue
+        rows = spatial_streams == streams
+        if rows.any():
+            expected[rows] = np.asarray(mcs)[np.searchsorted(thresholds, rssi[rows], side='right')]
+    return expected
+
+
+def expected_mcs_for(phy, signal_strength, spatial_streams):
+    """Scalar version of expected_mcs_index(), None when there is no table."""
+    table = EXPECTED_MCS.get((phy, spatial_streams))
+    if table is None:
+        return None
+    thresholds, mcs = table
+    return mcs[int(np.searchsorted(thresholds, signal_strength, side='right'))]
+
+
+def rate_gap_for(phy, signal_strength, spatial_streams, mcs_index):
+    """
+    Scalar version of add_rate_gap() for one frame (streaming mode), None where it is undefined.
+    Missing values are None.
+    """
+    if signal_strength is None:
+        return None
+    if spatial_streams is None and mcs_index is not None:
+        spatial_streams = next((streams for first, last, streams in SPATIAL_STREAMS_BY_MCS
+                                if first <= mcs_index <= last), None)
+    expected = expected_mcs_for(phy, int(signal_strength), spatial_streams)
+    if expected is None:
+        return None
+    return expected - (mcs_index if mcs_index is not None else 0)
+
+
+def add_rate_gap(data_all, phy):
+    """
+    Fills spatial_streams (from the MCS index where missing) and rate_gap = expected MCS - actual MCS
+    for the whole table at once.
+
+    Args:
+        data_all (PacketTable): table with the extracted data
+        phy (str): "11n" or "11ac"
+
+    Returns:
+        PacketTable: the same table with the spatial_streams and rate_gap columns filled in
+    """
+    fill_spatial_streams(data_all)
+    mcs_index = data_all['mcs_index']
+    spatial_streams = data_all['spatial_streams']
+
+    rssi = np.trunc(data_all['signal_strength'])
+    expected = expected_mcs_index(phy, np.nan_to_num(rssi, nan=-np.inf), spatial_streams)
+    expected[np.isnan(rssi)] = np.nan
+    actual = np.where(mcs_index != MISSING_INT, mcs_index, 0)
+    data_all.set_column('rate_gap', expected - actual)
+    return data_all
@@ -0,0 +1,288 @@
+"""
+Output layer for the analysis tables (window summaries, RSSID series).
+
+Formats:
+    "csv"      plain text, what run_analysis() always wrote
+    "parquet"  columnar, zstd compressed, one row group per written batch
+    "arrow"    Arrow IPC file, lz4 compressed, one record batch per written batch
+
+Every column has a fixed type (COLUMN_TYPES), so a summary reads back with the same dtypes
+whatever capture it came from. Writers take rows one by one (a writer is a valid on_window
+callback of pipeline.LinkWindowConsumer), lists of rows or DataFrames. Rows are buffered and
+written every batch_rows rows, so a long run never builds the whole table in memory.
+
+DatasetWriter spreads batch results over one directory per capture (and link):
+    <root>/<capture>/<link>/part-0000.parquet
+pyarrow.dataset / read_output() load such a directory as one table.
+
+pyarrow is optional. It is imported only when a Parquet / Arrow writer is opened.
+"""
+import csv
+import math
+import os
+import re
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+BATCH_ROWS = 65536
+
+# column -> type of the written files, columns not listed are float64
+COLUMN_TYPES = {
+    'capture': 'string', 'parser': 'string',
+    'transmitter_mac': 'string', 'receiver_mac': 'string', 'bssid': 'string', 'station': 'string',
+    'channel': 'int32', 'packets': 'int64', 'samples': 'int64',
+}
+SUMMARY_COLUMNS = ['timestamp', 'avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap', 'theoretical_throughput']
+RSSID_COLUMNS = ['timestamp', 'channel', 'rssid']
+RSSID_SERIES_COLUMNS = ['timestamp', 'channel', 'mean', 'min', 'max', 'last', 'samples']
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet / Arrow output needs pyarrow (pip install pyarrow), use the csv format without it")
+    return pyarrow
+
+
+def format_of(path, fmt=None):
+    """fmt, or the format the extension of path stands for (csv by default)."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown output format {fmt!r}, expected one of {', '.join(FORMATS)}")
+        return fmt
+    extension = os.path.splitext(str(path))[1].lower()
+    return next((name for name, suffix in FORMATS.items() if suffix == extension), "csv")
+
+
+def arrow_schema(columns):
+    pa = _pyarrow()
+    types = {'string': pa.string(), 'int32': pa.int32(), 'int64': pa.int64(), 'float64': pa.float64()}
+    return pa.schema([(column, types[COLUMN_TYPES.get(column, 'float64')]) for column in columns])
+
+
+class TableWriter:
+    """
+    Buffered row writer, use open_writer() to get the one of a format.
+
+    Args:
+        path (str): output file
+        columns (list): column names in file order
+        batch_rows (int): rows buffered before they are written out
+    """
+    extension = None
+
+    def __init__(self, path, columns, batch_rows=BATCH_ROWS):
+        self.path = str(path)
+        self.columns = list(columns)
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._pending = []
+
+    def write(self, row):
+        """One row, a dict keyed by column or a tuple in column order."""
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_rows:
+            self.flush()
+
+    __call__ = write
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def write_frame(self, frame):
+        """A DataFrame with (at least) the writer's columns."""
+        self.flush()
+        for start in range(0, len(frame), self.batch_rows):
+            self._write_frame(frame.iloc[start:start + self.batch_rows])
+            self.rows += min(self.batch_rows, len(frame) - start)
+
+    def _columns(self, rows):
+        if isinstance(rows[0], dict):
+            return [[row.get(column) for row in rows] for column in self.columns]
+        return [list(values) for values in zip(*rows)]
+
+    def flush(self):
+        if self._pending:
+            rows, self._pending = self._pending, []
+            self._write_columns(self._columns(rows))
+            self.rows += len(rows)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _csv_value(value):
+    # pandas.to_csv conventions: None / NaN are empty fields, floats keep their repr
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return value
+
+
+class CsvWriter(TableWriter):
+    extension = ".csv"
+
+    def __init__(self, path, columns, batch_rows=BATCH_ROWS):
+        super().__init__(path, columns, batch_rows)
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(self.columns)
+
+    def _write_columns(self, columns):
+        self._writer.writerows(zip(*([_csv_value(value) for value in values] for values in columns)))
+
+    def _write_frame(self, frame):
+        frame[self.columns].to_csv(self._file, header=False, index=False, lineterminator='\n')
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class _ArrowTableWriter(TableWriter):
+    def __init__(self, path, columns, batch_rows=BATCH_ROWS):
+        super().__init__(path, columns, batch_rows)
+        self.schema = arrow_schema(self.columns)
+
+    def _write_columns(self, columns):
+        pa = _pyarrow()
+        # from_pandas: NaN becomes null like None
+        arrays = [pa.array(values, type=field.type, from_pandas=True) for values, field in zip(columns, self.schema)]
+        self._write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def _write_frame(self, frame):
+        pa = _pyarrow()
+        self._write_batch(pa.RecordBatch.from_pandas(frame[self.columns], schema=self.schema, preserve_index=False))
+
+
+class ParquetWriter(_ArrowTableWriter):
+    extension = ".parquet"
+
+    def __init__(self, path, columns, batch_rows=BATCH_ROWS, compression="zstd"):
+        super().__init__(path, columns, batch_rows)
+        import pyarrow.parquet as pq
+        self._writer = pq.ParquetWriter(self.path, self.schema, compression=compression)
+
+    def _write_batch(self, batch):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        super().close()
+        self._writer.close()
+
+
+class ArrowWriter(_ArrowTableWriter):
+    extension = ".arrow"
+
+    def __init__(self, path, columns, batch_rows=BATCH_ROWS, compression="lz4"):
+        super().__init__(path, columns, batch_rows)
+        pa = _pyarrow()
+        self._sink = pa.OSFile(self.path, 'wb')
+        self._writer = pa.ipc.new_file(self._sink, self.schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    def _write_batch(self, batch):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        super().close()
+        self._writer.close()
+        self._sink.close()
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter, "arrow": ArrowWriter}
+
+
+def open_writer(path, columns, fmt=None, batch_rows=BATCH_ROWS):
+    """
+    Args:
+        path (str): output file, its extension is added when missing
+        columns (list): column names in file order
+        fmt (str): "csv", "parquet" or "arrow" (defaults to the extension of path, then csv)
+
+    Returns:
+        TableWriter: close it (or use it as a context manager) to finish the file
+    """
+    fmt = format_of(path, fmt)
+    path = str(path)
+    if not path.lower().endswith(FORMATS[fmt]):
+        path += FORMATS[fmt]
+    return WRITERS[fmt](path, columns, batch_rows)
+
+
+def write_rows(path, rows, columns, fmt=None):
+    """Writes rows (dicts or tuples) to one file, returns its path."""
+    with open_writer(path, columns, fmt) as writer:
+        writer.write_rows(rows)
+    return writer.path
+
+
+def _partition_name(value):
+    return re.sub(r'[^\w.-]+', '_', os.path.basename(str(value))) or "_"
+
+
+class DatasetWriter:
+    """
+    Writes DataFrames into <root>/<capture>/<link ...>/part-NNNN.<ext>, a new part per write so
+    results can go out job by job (slices of one capture become parts of its directory).
+
+    Args:
+        root (str): dataset directory
+        fmt (str): "csv", "parquet" or "arrow"
+        partition_by (list): columns that pick the directory, the ones a frame lacks are skipped
+    """
+
+    def __init__(self, root, fmt="parquet", partition_by=('capture',)):
+        self.root = str(root)
+        self.fmt = format_of(root, fmt)
+        self.partition_by = list(partition_by)
+        self.files = []
+        self._parts = {}
+
+    def write_frame(self, frame):
+        keys = [column for column in self.partition_by if column in frame.columns]
+        groups = frame.groupby(keys, sort=False) if keys and len(frame) else [((), frame)]
+        for key, rows in groups:
+            key = key if isinstance(key, tuple) else (key,)
+            directory = os.path.join(self.root, *(_partition_name(value) for value in key))
+            os.makedirs(directory, exist_ok=True)
+            part = self._parts.get(directory, 0)
+            self._parts[directory] = part + 1
+            path = os.path.join(directory, f"part-{part:04d}{FORMATS[self.fmt]}")
+            with open_writer(path, list(rows.columns), self.fmt) as writer:
+                writer.write_frame(rows)
+            self.files.append(path)
+
+
+def read_output(path):
+    """
+    Loads a file or dataset directory written here back into a DataFrame.
+    """
+    path = str(path)
+    fmt = format_of(path)
+    if os.path.isdir(path):
+        files = sorted(os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names
+                       if os.path.splitext(name)[1] in FORMATS.values())
+        if not files:
+            raise FileNotFoundError(f"no output files under {path}")
+        fmt = format_of(files[0])
+        if fmt == "csv":
+            import pandas as pd
+            return pd.concat([pd.read_csv(file) for file in files], ignore_index=True)
+        import pyarrow.dataset as ds
+        return ds.dataset(files, format="ipc" if fmt == "arrow" else fmt).to_table().to_pandas()
+    if fmt == "csv":
+        import pandas as pd
+        return pd.read_csv(path)
+    pa = _pyarrow()
+    if fmt == "arrow":
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    import pyarrow.parquet as pq
+    return pq.read_table(path).to_pandas()
@@ -0,0 +1,401 @@
+from array import array
+from datetime import datetime
+import numpy as np
+
+# Missing values: integer columns use -1, float columns use NaN,
+# categorical columns use code -1 and time columns use MISSING_TIME.
+MISSING_INT = -1
+MISSING_TIME = np.iinfo(np.int64).min
+
+# column name -> storage kind
+SCHEMA = {
+    'bssid': 'category',
+    'transmitter_mac': 'category',
+    'receiver_mac': 'category',
+    'frame_type_subtype': 'category',
+    'phy_type': 'int8',
+    'mcs_index': 'int16',
+    'bandwidth': 'category',
+    'spatial_streams': 'int8',
+    'short_gi': 'flag',
+    'data_rate': 'float64',
+    'rate_gap': 'float32',
+    'channel': 'int16',
+    'frequency': 'int32',
+    'signal_strength': 'float32',
+    'retry_flag': 'flag',
+    'snr': 'float32',
+    'ssid': 'category',
+    'timestamp': 'int64',
+    'tsf_timestamp': 'int64',
+    'frame_length': 'int32',
+    'radiotap_length': 'int32',
+    'wlan_header_length': 'int32',
+    'payload_length': 'int32',
+    'sniff_time': 'time',
+}
+
+# the columns add_rate_gap(), filter_for_1_2() and wifi_analysis_engine read, extracting only
+# these (fields=ANALYSIS_FIELDS) drops phy_type, bandwidth, short_gi, snr, the radiotap / beacon
+# timestamps and the header lengths from the table
+ANALYSIS_FIELDS = [
+    'bssid', 'transmitter_mac', 'receiver_mac', 'frame_type_subtype', 'mcs_index', 'spatial_streams',
+    'data_rate', 'rate_gap', 'channel', 'signal_strength', 'retry_flag', 'ssid', 'frame_length',
+    'payload_length', 'sniff_time',
+]
+
+# storage kind -> (array.array typecode, numpy dtype)
+_KIND_TYPES = {
+    'category': ('i', np.int32),
+    'flag': ('b', np.int8),
+    'int8': ('b', np.int8),
+    'int16': ('h', np.int16),
+    'int32': ('i', np.int32),
+    'int64': ('q', np.int64),
+    'float32': ('f', np.float32),
+    'float64': ('d', np.float64),
+    'time': ('q', np.int64),
+}
+
+
+def dtype_of(name):
+    """NumPy dtype used to store column name."""
+    return _KIND_TYPES[SCHEMA[name]][1]
+
+
+def missing_value(name):
+    kind = SCHEMA[name]
+    if kind.startswith('float'):
+        return np.nan
+    if kind == 'time':
+        return MISSING_TIME
+    return MISSING_INT
+
+
+def _to_int(value):
+    if type(value) is int:
+        return value
+    if value is None or value == '':
+        return MISSING_INT
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(value, 0)
+    except (TypeError, ValueError):
+        return MISSING_INT
+
+
+def _to_float(value):
+    if type(value) is float:
+        return value
+    if value is None or value == '':
+        return float('nan')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _to_flag(value):
+    if value is None:
+        return MISSING_INT
+    if value in ('1', 'True', 'true', True, 1):
+        return 1
+    if value in ('0', 'False', 'false', False, 0):
+        return 0
+    return MISSING_INT
+
+
+def _to_time(value):
+    """sniff_time from pyshark is a datetime, the native readers give int nanoseconds."""
+    if type(value) is int:
+        return value
+    if value is None:
+        return MISSING_TIME
+    if isinstance(value, datetime):
+        return round(value.timestamp() * 1e6) * 1000
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    try:
+        return round(float(value) * 1e9)
+    except (TypeError, ValueError):
+        return MISSING_TIME
+
+
+_CONVERTERS = {
+    'flag': _to_flag,
+    'int8': _to_int,
+    'int16': _to_int,
+    'int32': _to_int,
+    'int64': _to_int,
+    'float32': _to_float,
+    'float64': _to_float,
+    'time': _to_time,
+}
+
+
+class PacketTableBuilder:
+    """
+    Collects frames one at a time into typed buffers and turns them into a PacketTable.
+    The parsers append raw values (strings from pyshark or numbers from the native readers),
+    they are converted once here so the analysis never has to call int()/float() again.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields) if fields is not None else list(SCHEMA)
+        self._buffers = {name: array(_KIND_TYPES[SCHEMA[name]][0]) for name in self.fields}
+        self._lookup = {name: {} for name in self.fields if SCHEMA[name] == 'category'}
+        # (column, buffer append, converter) resolved once instead of per frame
+        self._appenders = [
+            (name, self._buffers[name].append,
+             self._encoder(self._lookup[name]) if SCHEMA[name] == 'category' else _CONVERTERS[SCHEMA[name]])
+            for name in self.fields
+        ]
+
+    def __len__(self):
+        return len(self._buffers[self.fields[0]]) if self.fields else 0
+
+    @staticmethod
+    def _encoder(lookup):
+        def encode(value):
+            if value is None:
+                return MISSING_INT
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(lookup)
+            return code
+        return encode
+
+    def append(self, packet: dict):
+        """
+        Args:
+            packet (dict): one frame, keyed like the dictionaries extract_all_data() used to return,
+                keys outside self.fields are ignored
+        """
+        get = packet.get
+        for name, append, convert in self._appenders:
+            append(convert(get(name)))
+
+    def build(self):
+        """
+        The buffers are handed to NumPy without a copy, so the builder can not be appended to afterwards.
+        """
+        columns = {}
+        for name in self.fields:
+            dtype = _KIND_TYPES[SCHEMA[name]][1]
+            columns[name] = np.frombuffer(self._buffers[name], dtype=dtype) if len(self._buffers[name]) \
+                else np.empty(0, dtype=dtype)
+        categories = {name: list(lookup) for name, lookup in self._lookup.items()}
+        return PacketTable(columns, categories)
+
+
+class PacketTable:
+    """
+    Columnar packet store: one NumPy array per field.
+    MAC addresses, subtypes, bandwidth and SSIDs are kept as categorical codes
+    (index into self.categories[name], -1 when missing) and sniff_time is int64 nanoseconds.
+    """
+
+    def __init__(self, columns: dict, categories: dict = None):
+        self.columns = columns
+        self.categories = categories or {}
+
+    @classmethod
+    def from_records(cls, records, fields=None):
+        """
+        Args:
+            records (list): list of packet dictionaries in the old extract_all_data() format
+
+        Returns:
+            PacketTable: the same packets in columnar form
+        """
+        builder = PacketTableBuilder(fields)
+        for record in records:
+            builder.append(record)
+        return builder.build()
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Joins tables row-wise (in the given order), categorical codes are remapped
+        onto the union of the categories.
+
+        Args:
+            tables (list): PacketTables with the same columns
+
+        Returns:
+            PacketTable: one table with all the rows
+        """
+        tables = list(tables)
+        if not tables:
+            return PacketTableBuilder().build()
+        if len(tables) == 1:
+            return tables[0]
+        columns = {}
+        categories = {}
+        for name in tables[0].columns:
+            if SCHEMA[name] != 'category':
+                columns[name] = np.concatenate([table.columns[name] for table in tables])
+                continue
+            lookup = {}
+            parts = []
+            for table in tables:
+                # last slot maps the missing code -1 back to -1
+                remap = np.empty(len(table.categories[name]) + 1, dtype=np.int32)
+                remap[-1] = MISSING_INT
+                for i, value in enumerate(table.categories[name]):
+                    remap[i] = lookup.setdefault(value, len(lookup))
+                parts.append(remap[table.columns[name]])
+            columns[name] = np.concatenate(parts)
+            categories[name] = list(lookup)
+        return cls(columns, categories)
+
+    def __len__(self):
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+    def ensure_columns(self, names):
+        """Adds the columns in names that the table does not have yet, filled with missing values."""
+        for name in names:
+            if name not in self.columns:
+                self.columns[name] = np.full(len(self), missing_value(name), dtype=dtype_of(name))
+                if SCHEMA[name] == 'category':
+                    self.categories[name] = []
+        return self
+
+    def set_column(self, name, values):
+        dtype = _KIND_TYPES[SCHEMA[name]][1]
+        self.columns[name] = np.asarray(values, dtype=dtype)
+
+    def code(self, name, value):
+        """Categorical code for value in column name, -1 if the value never appears."""
+        try:
+            return self.categories[name].index(value)
+        except ValueError:
+            return MISSING_INT
+
+    def equals(self, name, value):
+        """Boolean mask of the rows whose categorical column name holds value."""
+        code = self.code(name, value)
+        if code == MISSING_INT:
+            return np.zeros(len(self), dtype=bool)
+        return self.columns[name] == code
+
+    def decode(self, name):
+        """Object array with the original values of a categorical column (None when missing)."""
+        lookup = np.array(self.categories[name] + [None], dtype=object)
+        return lookup[self.columns[name]]
+
+    def seconds(self, name='sniff_time'):
+        """Time column as float seconds since the epoch, NaN when missing."""
+        values = self.columns[name]
+        result = values.astype(np.float64) / 1e9
+        result[values == MISSING_TIME] = np.nan
+        return result
+
+    def take(self, index):
+        """
+        Args:
+            index: slice, boolean mask or integer indices
+
+        Returns:
+            PacketTable: new table with the selected rows, categories are shared
+        """
+        return PacketTable({name: values[index] for name, values in self.columns.items()}, self.categories)
+
+    def select(self, names):
+        """Table with only the columns in names that it has (no copy), categories are shared."""
+        return PacketTable({name: self.columns[name] for name in names if name in self.columns},
+                           {name: self.categories[name] for name in names if name in self.categories})
+
+    def sort_by(self, name):
+        return self.take(np.argsort(self.columns[name], kind='stable'))
+
+    def _value(self, name, i):
+        value = self.columns[name][i]
+        kind = SCHEMA[name]
+        if kind == 'category':
+            return self.categories[name][value] if value >= 0 else None
+        if kind == 'time':
+            return int(value) if value != MISSING_TIME else None
+        if kind.startswith('float'):
+            return float(value) if not np.isnan(value) else None
+        return int(value) if value != MISSING_INT else None
+
+    def row(self, i):
+        return {name: self._value(name, i) for name in self.columns}
+
+    def to_records(self):
+        return [self.row(i) for i in range(len(self))]
+
+    def to_dataframe(self):
+        import pandas as pd
+        data = {}
+        for name, values in self.columns.items():
+            kind = SCHEMA[name]
+            if kind == 'category':
+                data[name] = pd.Categorical.from_codes(values, categories=self.categories[name])
+            elif kind == 'time':
+                data[name] = pd.to_datetime(values, unit='ns')
+            else:
+                data[name] = values
+        return pd.DataFrame(data)
+
+    def save_npz(self, path):
+        """
+        Writes the table to an uncompressed .npz (no pickled objects, loads with allow_pickle=False).
+        Categories are stored as their UTF-8 bytes plus offsets, a NumPy string array would drop
+        trailing NULs (SSIDs can end in them).
+        """
+        arrays = {f"col:{name}": values for name, values in self.columns.items()}
+        for name, values in self.categories.items():
+            encoded = [str(value).encode('utf-8', 'surrogatepass') for value in values]
+            arrays[f"cat:{name}"] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            arrays[f"off:{name}"] = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load_npz(cls, path):
+        """
+        Raises:
+            ValueError: not a table written by save_npz() (including the older string category format,
+                capture_cache then extracts the capture again)
+        """
+        columns = {}
+        categories = {}
+        with np.load(path, allow_pickle=False) as data:
+            for key in data.files:
+                kind, name = key.split(':', 1)
+                if kind == 'col':
+                    columns[name] = data[key]
+                elif kind == 'cat':
+                    if f"off:{name}" not in data.files:
+                        raise ValueError(f"{path}: categories of {name} without offsets")
+                    raw = data[key].tobytes()
+                    offsets = data[f"off:{name}"].tolist()
+                    categories[name] = [raw[start:stop].decode('utf-8', 'surrogatepass')
+                                        for start, stop in zip(offsets[:-1], offsets[1:])]
+        return cls(columns, categories)
+
+
+def as_packet_table(packets):
+    """Accepts either a PacketTable or the old list-of-dicts format."""
+    if isinstance(packets, PacketTable):
+        return packets
+    return PacketTable.from_records(packets)
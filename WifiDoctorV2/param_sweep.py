@@ -0,0 +1,295 @@
+"""
+Parameter sweep of the throughput model over one extracted capture.
+
+The model has empirical constants: PENALTY_SLOPE and PENALTY_FLOOR of the rate gap penalty,
+decay_rate and the WMA window of the RSSID tracker, and WINDOW_SIZE_S. Instead of editing them
+and re-running wifi_doctor for every combination, the sweep evaluates a whole grid on the
+already extracted, rate-gap annotated capture (served from the extraction cache):
+
+    window aggregates   once per window size
+    RSSID series        once per (decay_rate, rssid_window), in worker processes since the
+                        tracker is the only per-frame loop
+    penalty slope/floor broadcast over all windows in one NumPy expression
+
+Every configuration is compared with the SpeedTest server output (server.c prints a line like
+"[SERVER]  0– 2s: Received 93.41 Mbps" every INTERVAL seconds): the estimate of a server interval
+is the time-weighted mean throughput of the windows overlapping it.
+
+    python param_sweep.py pcap_files/test.pcap --server-log server.txt -o sweep.csv
+    python param_sweep.py test.pcap --server-log server.txt --penalty-slope 0.03:0.12:10 --window-size 1,2,4
+"""
+import argparse
+import itertools
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from instrumentation import instrumented
+from packet_table import ANALYSIS_FIELDS, MISSING_INT, MISSING_TIME, as_packet_table
+from wifi_analysis_engine import (
+    compute_rssid_series, compute_theoretical_throughput_array, MAX_DURATION_S, PENALTY_FLOOR, PENALTY_SLOPE,
+    RSSID_RESOLUTION_S, WINDOW_SIZE_S,
+)
+from windowing import window_aggregates
+
+# parameter -> values of the default grid (5 x 4 x 2 x 5 x 5 = 1000 configurations), the
+# current constants included
+DEFAULT_GRID = {
+    'window_size': [1, WINDOW_SIZE_S, 3, 4, 5],
+    'decay_rate': [0.05, 0.1, 0.5, 1.0],
+    'rssid_window': [5, 10],
+    'penalty_slope': [0.05, 0.06, PENALTY_SLOPE, 0.08, 0.09],
+    'penalty_floor': [0.2, 0.25, PENALTY_FLOOR, 0.35, 0.4],
+}
+CURRENT = {'window_size': WINDOW_SIZE_S, 'decay_rate': 0.1, 'rssid_window': 10,
+           'penalty_slope': PENALTY_SLOPE, 'penalty_floor': PENALTY_FLOOR}
+ERROR_COLUMNS = ['intervals', 'mae', 'rmse', 'bias', 'correlation']
+
+SERVER_LINE = re.compile(r"\[SERVER\]\s*(\d+)\s*[–-]\s*(\d+)s: Received ([\d.]+) Mbps")
+
+
+def parse_server_log(lines):
+    """
+    The per-interval lines of a SpeedTest server output.
+
+    Args:
+        lines (iterable): lines of the output (a file object works)
+
+    Returns:
+        numpy.ndarray: one (start s, end s, Mbps) row per interval
+    """
+    intervals = [tuple(map(float, match.groups())) for match in map(SERVER_LINE.search, lines) if match]
+    return np.array(intervals, dtype=np.float64).reshape(-1, 3)
+
+
+def parse_values(spec):
+    """"0.05,0.07,0.1" or "start:stop:count" (evenly spaced, both ends included) -> list of floats."""
+    if ':' in spec:
+        start, stop, count = spec.split(':')
+        return np.linspace(float(start), float(stop), int(count)).round(10).tolist()
+    return [float(value) for value in spec.split(',')]
+
+
+def interval_weights(starts, ends, intervals, offset_s=0.0):
+    """
+    Overlap in seconds of every server interval (rows) with every window (columns).
+
+    Args:
+        starts, ends (numpy.ndarray): window bounds in seconds after the first link frame
+        intervals (numpy.ndarray): parse_server_log() rows
+        offset_s (float): server time 0 is this many seconds after the first link frame
+    """
+    interval_starts = intervals[:, :1] + offset_s
+    interval_ends = intervals[:, 1:2] + offset_s
+    return np.maximum(np.minimum(interval_ends, ends[None, :]) - np.maximum(interval_starts, starts[None, :]), 0.0)
+
+
+def _rssid_job(beacons, decay_rate, rssid_window, resolution):
+    return compute_rssid_series(beacons, decay_rate, int(rssid_window), resolution)
+
+
+def _rssid_series(beacons, pairs, resolution, jobs):
+    # (decay_rate, rssid_window) -> RssidSeries
+    if not jobs or jobs <= 1 or len(pairs) <= 1:
+        return {pair: _rssid_job(beacons, *pair, resolution) for pair in pairs}
+    with ProcessPoolExecutor(max_workers=min(jobs, len(pairs))) as pool:
+        futures = {pair: pool.submit(_rssid_job, beacons, *pair, resolution) for pair in pairs}
+        return {pair: future.result() for pair, future in futures.items()}
+
+
+def _errors(estimates, measured):
+    # estimates (configurations, intervals) against measured (intervals,), every column covered
+    if not estimates.shape[1]:
+        return {name: np.full(len(estimates), 0 if name == 'intervals' else np.nan) for name in ERROR_COLUMNS}
+    errors = estimates - measured[None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centered = estimates - estimates.mean(axis=1, keepdims=True)
+        reference = measured - measured.mean()
+        correlation = (centered @ reference) / (np.sqrt((centered ** 2).sum(axis=1)) * np.sqrt((reference ** 2).sum()))
+    return {
+        'intervals': np.full(len(estimates), estimates.shape[1]),
+        'mae': np.abs(errors).mean(axis=1),
+        'rmse': np.sqrt((errors ** 2).mean(axis=1)),
+        'bias': errors.mean(axis=1),
+        'correlation': correlation,
+    }
+
+
+@instrumented("sweep", table_arg=0)
+def run_sweep(packet_data, rssid_packets=None, grid=None, server_intervals=None, max_duration=MAX_DURATION_S, offset_s=0.0,
+              jobs=None, rssid_resolution=RSSID_RESOLUTION_S):
+    """
+    Evaluates the throughput model for every combination of the grid.
+
+    Args:
+        packet_data (PacketTable): the link frames (output of filter_for_1_2), like run_analysis()
+        rssid_packets (PacketTable): frames with the beacons for the RSSID (defaults to packet_data)
+        grid (dict): parameter -> values for window_size, decay_rate, rssid_window, penalty_slope and
+            penalty_floor, missing parameters keep their current value (see DEFAULT_GRID)
+        server_intervals (numpy.ndarray): parse_server_log() rows to compare with, None = no comparison
+        max_duration (float): analyze only this many seconds after the first link frame (None = all)
+        offset_s (float): server time 0 is this many seconds after the first link frame
+        jobs (int): processes computing the RSSID series (None / 1 = in this process)
+        rssid_resolution (float): seconds per bucket of the RSSID series
+
+    Returns:
+        tuple: (pandas.DataFrame with one row per configuration: the parameters, windows, mean_estimate
+            and, with server intervals, intervals / mae / rmse / bias / correlation, sorted by rmse;
+            pandas.DataFrame of the estimate of every configuration per server interval, None without them)
+    """
+    import pandas as pd
+    grid = {name: list(grid.get(name, [value])) if grid else list(DEFAULT_GRID[name]) for name, value in CURRENT.items()}
+    packet_data = as_packet_table(packet_data)
+    usable = (packet_data['sniff_time'] != MISSING_TIME) & ~np.isnan(packet_data['signal_strength'])
+    link = packet_data.take(usable).sort_by('sniff_time')
+    if len(link) == 0:
+        raise ValueError("no usable link frames to sweep over")
+    sniff_times = link['sniff_time']
+    timestamps = (sniff_times - sniff_times[0]) / 1e9
+    origin_s = int(sniff_times[0]) / 1e9
+    channel = int(link['channel'][0]) if link['channel'][0] != MISSING_INT else 1
+
+    # only the SSID frames matter for the RSSID, and they are what the workers get
+    rssid_packets = as_packet_table(packet_data if rssid_packets is None else rssid_packets)
+    beacons = rssid_packets.take(rssid_packets['ssid'] >= 0)
+    series = _rssid_series(beacons, list(itertools.product(grid['decay_rate'], grid['rssid_window'])),
+                           rssid_resolution, jobs)
+
+    # slope x floor, broadcast as (configurations, 1) against the windows
+    slopes, floors = (values.reshape(-1, 1) for values in np.meshgrid(grid['penalty_slope'], grid['penalty_floor'],
+                                                                      indexing='ij'))
+    measured = server_intervals[:, 2] if server_intervals is not None else None
+    tables, interval_tables = [], []
+    for window_size in grid['window_size']:
+        windows = window_aggregates(link, timestamps, window_size, None, max_duration)
+        # windows without a rate have no throughput, every configuration shares them
+        valid = (windows['packets'] > 0) & ~np.isnan(windows['avg_rate'])
+        if server_intervals is not None:
+            weights = interval_weights(windows['start'], windows['end'], server_intervals, offset_s) * valid
+            covered = weights.sum(axis=1) > 0
+            weights = weights[covered] / weights[covered].sum(axis=1, keepdims=True)
+        for (decay_rate, rssid_window), rssid_series in series.items():
+            rssid = rssid_series.window_values(channel, origin_s + windows['start'], origin_s + windows['end'])
+            throughput = compute_theoretical_throughput_array(
+                windows['avg_rate'][valid], windows['frame_loss'][valid], windows['rate_gap'][valid], rssid[valid],
+                windows['avg_payload'][valid], windows['avg_total'][valid], slopes, floors)
+            table = {
+                'window_size': window_size, 'decay_rate': decay_rate, 'rssid_window': rssid_window,
+                'penalty_slope': slopes[:, 0], 'penalty_floor': floors[:, 0],
+                'windows': int(valid.sum()),
+                'mean_estimate': throughput.mean(axis=1) if valid.any() else np.nan,
+            }
+            if server_intervals is not None:
+                estimates = throughput @ weights[:, valid].T
+                table.update(_errors(estimates, measured[covered]))
+                interval_tables.append((len(slopes), server_intervals[covered], estimates))
+            tables.append(pd.DataFrame(table, index=range(len(slopes))))
+
+    summary = pd.concat(tables, ignore_index=True)
+    summary.insert(0, 'configuration', np.arange(len(summary)))
+    if server_intervals is None:
+        return summary, None
+
+    # per server interval: every configuration of a block repeats the block's covered intervals
+    configuration = summary['configuration'].to_numpy()
+    offsets = np.cumsum([0] + [count for count, _, _ in interval_tables])
+    intervals = pd.DataFrame({
+        'configuration': np.concatenate([np.repeat(configuration[first:first + count], len(covered))
+                                         for first, (count, covered, _) in zip(offsets, interval_tables)]),
+        'interval_start': np.concatenate([np.tile(covered[:, 0], count) for count, covered, _ in interval_tables]),
+        'interval_end': np.concatenate([np.tile(covered[:, 1], count) for count, covered, _ in interval_tables]),
+        'measured': np.concatenate([np.tile(covered[:, 2], count) for count, covered, _ in interval_tables]),
+        'estimate': np.concatenate([estimates.ravel() for _, _, estimates in interval_tables]),
+    })
+    return summary.sort_values('rmse', kind='stable', ignore_index=True), intervals
+
+
+def _describe(row):
+    return (f"window {row['window_size']:g}s, decay {row['decay_rate']:g}, RSSID window {row['rssid_window']:g}, "
+            f"slope {row['penalty_slope']:g}, floor {row['penalty_floor']:g}")
+
+
+def main(argv=None):
+    from wifi_doctor import PARSERS
+    from capture_cache import DEFAULT_CACHE_DIR, CaptureCache, load_or_extract
+    from frame_filter import FrameFilter, mac_to_bytes
+    from output_writers import open_writer
+    from pcap_reader import detect_phy
+
+    arg_parser = argparse.ArgumentParser(description="Sweep the throughput model constants over one capture.")
+    arg_parser.add_argument("capture")
+    arg_parser.add_argument("--parser", choices=["auto", "11n", "11ac"], default="auto")
+    arg_parser.add_argument("--ta", help="link transmitter MAC (defaults to the one wifi_doctor uses for the parser)")
+    arg_parser.add_argument("--ra", help="link receiver MAC")
+    arg_parser.add_argument("--subtype", default="0x0028")
+    arg_parser.add_argument("--server-log", metavar="FILE", help='SpeedTest server output to compare with ("-" = stdin)')
+    arg_parser.add_argument("--offset", type=float, default=0.0,
+                            help="seconds from the first link frame to the server's time 0")
+    arg_parser.add_argument("--max-duration", type=float, default=MAX_DURATION_S,
+                            help="seconds analyzed after the first link packet, 0 = whole capture")
+    for name in CURRENT:
+        arg_parser.add_argument(f"--{name.replace('_', '-')}", type=parse_values, metavar="VALUES",
+                                help=f"comma separated values or start:stop:count "
+                                     f"(default {','.join(f'{value:g}' for value in DEFAULT_GRID[name])})")
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="processes computing the RSSID series")
+    arg_parser.add_argument("--cache-dir", help="extraction cache directory (default: the wifi_doctor cache)")
+    arg_parser.add_argument("--no-cache", action="store_true", help="extract the capture without the cache")
+    arg_parser.add_argument("-o", "--output", default="param_sweep.csv", help="one row per configuration, "
+                                                                             ".csv / .parquet / .arrow")
+    arg_parser.add_argument("--intervals", metavar="FILE", help="also save the estimate of every configuration "
+                                                                "per server interval")
+    arg_parser.add_argument("--top", type=int, default=5, help="configurations printed")
+    args = arg_parser.parse_args(argv)
+
+    phy = detect_phy(args.capture) if args.parser == "auto" else args.parser
+    parsers = {parser.PHY: (parser, ta, ra) for parser, _, ta, ra in PARSERS.values()}
+    parser, default_ta, default_ra = parsers[phy]
+    transmitter_mac = args.ta or default_ta
+    receiver_mac = args.ra or default_ra
+    for mac in (transmitter_mac, receiver_mac):
+        try:
+            mac_to_bytes(mac)
+        except ValueError:
+            arg_parser.error(f"invalid MAC address {mac!r}")
+    server_intervals = None
+    if args.server_log:
+        f = sys.stdin if args.server_log == "-" else open(args.server_log, encoding='utf-8', errors='replace')
+        with f:
+            server_intervals = parse_server_log(f)
+        if not len(server_intervals):
+            arg_parser.error(f"no [SERVER] interval lines in {args.server_log}")
+    grid = {name: getattr(args, name) or DEFAULT_GRID[name] for name in CURRENT}
+
+    frame_filter = FrameFilter(transmitter_mac, receiver_mac, args.subtype, keep_beacons=True)
+    packets = load_or_extract(args.capture, parser, frame_filter=frame_filter, fields=ANALYSIS_FIELDS,
+                              cache=None if args.no_cache else CaptureCache(args.cache_dir or DEFAULT_CACHE_DIR))
+    link_packets = parser.filter_for_1_2(packets, transmitter_mac, receiver_mac, args.subtype)
+    points = int(np.prod([len(values) for values in grid.values()]))
+    print(f"[INFO] {points} configurations on {args.capture}, link {transmitter_mac} -> {receiver_mac}", file=sys.stderr)
+    summary, intervals = run_sweep(link_packets, packets, grid, server_intervals, args.max_duration or None, args.offset,
+                                   args.jobs)
+
+    with open_writer(args.output, list(summary.columns)) as writer:
+        writer.write_frame(summary)
+    print(f"[INFO] Saved {len(summary)} configurations to {writer.path}")
+    if args.intervals and intervals is not None:
+        with open_writer(args.intervals, list(intervals.columns)) as writer:
+            writer.write_frame(intervals)
+        print(f"[INFO] Saved the per-interval estimates to {writer.path}")
+
+    if intervals is None:
+        for _, row in summary.head(args.top).iterrows():
+            print(f"{_describe(row)}: mean {row['mean_estimate']:.2f} Mbps")
+        return 0
+    print(f"Server: {len(server_intervals)} intervals, mean {server_intervals[:, 2].mean():.2f} Mbps")
+    current = summary[np.logical_and.reduce([np.isclose(summary[name], value) for name, value in CURRENT.items()])]
+    for label, rows in (("best", summary.head(args.top)), ("current", current)):
+        for _, row in rows.iterrows():
+            print(f"{label:8s}{_describe(row)}: rmse {row['rmse']:.2f}, mae {row['mae']:.2f}, bias {row['bias']:+.2f} Mbps, "
+                  f"r {row['correlation']:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
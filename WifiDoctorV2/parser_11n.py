@@ -1,11 +1,45 @@
-import pyshark
-from tqdm import tqdm
 import pathlib
 import sys
-
-def extract_all_data(pcap_file: str) -> list:
+import instrumentation
+from packet_table import PacketTable, PacketTableBuilder, as_packet_table
+from pcap_reader import read_radiotap, PcapFormatError
+from mcs_tables import add_rate_gap as add_rate_gap_column, expected_mcs_for, fill_spatial_streams
+
+PHY = "11n"
+
+# bump when the output of extract_all_data / add_rate_gap changes, it invalidates capture_cache entries
+PARSER_VERSION = "4"
+
+# column -> tshark field, the same fields the pyshark loop below reads (used by the tshark backend).
+# wlan_radio has no 11n stream count, spatial_streams comes from the MCS in add_rate_gap()
+TSHARK_FIELDS = {
+    'bssid': 'wlan.bssid',
+    'transmitter_mac': 'wlan.ta',
+    'receiver_mac': 'wlan.ra',
+    'frame_type_subtype': 'wlan.fc.type_subtype',
+    'retry_flag': 'wlan.fc.retry',
+    'phy_type': 'wlan_radio.phy',
+    'mcs_index': 'wlan_radio.11n.mcs_index',
+    'bandwidth': 'wlan_radio.11n.bandwidth',
+    'short_gi': 'wlan_radio.11n.short_gi',
+    'data_rate': 'wlan_radio.data_rate',
+    'channel': 'wlan_radio.channel',
+    'signal_strength': 'wlan_radio.signal_dbm',
+    'snr': 'wlan_radio.snr',
+    'tsf_timestamp': 'wlan_radio.timestamp',
+    'frequency': 'radiotap.channel.freq',
+    'radiotap_length': 'radiotap.length',
+    'frame_length': 'frame.len',
+    'payload_length': 'data.len',
+    'ssid': 'wlan.ssid',
+    'timestamp': 'wlan.fixed.timestamp',
+    'sniff_time': 'frame.time_epoch',
+}
+
+@instrumentation.instrumented("extract")
+def extract_all_data(pcap_file: str, backend: str = "auto", frame_filter=None, workers: int = None, fields=None) -> PacketTable:
     """
-    Using pyshark this method applies no filter into the pcap file
+    Without a frame_filter this method applies no filter into the pcap file
     and tries to extract various information from those packets such as:
     ->BSSID
     ->Transmitter MAC address
@@ -23,21 +57,51 @@ def extract_all_data(pcap_file: str) -> list:
     ->Signal Strength 
     ->Signal/Noise Ratio (SNR)
 
+    The "native" backend decodes radiotap pcap/pcapng files directly (see pcap_reader),
+    "tshark" runs one tshark field export over TSHARK_FIELDS (see tshark_backend),
+    "pyshark" walks pyshark packet objects and "auto" tries them in that order.
+
     Args:
         pcap_file (str): path to the pcap file
+        backend (str): "auto", "native", "tshark" or "pyshark"
+        frame_filter (FrameFilter): optional TA/RA/subtype/time predicate applied during extraction,
+            frames that do not match are skipped before they are dissected (beacons are kept)
+        workers (int): native backend only, decode the capture in chunks over this many processes
+        fields (list): columns to extract, e.g. packet_table.ANALYSIS_FIELDS for what the
+            analysis needs (None = every column)
 
     Returns:
-       List: Contains a dictionary for each packet in the pcap_file
+       PacketTable: columnar table with one row for each packet in the pcap_file
     """
 
-    capture = pyshark.FileCapture(pcap_file)  #=
-    extracted_data_all = []
+    if backend in ("auto", "native"):
+        try:
+            instrumentation.note(backend="native")
+            return read_radiotap(pcap_file, phy=PHY, frame_filter=frame_filter, workers=workers, fields=fields)
+        except PcapFormatError as error:
+            if backend == "native":
+                raise
+            print(f"[INFO] Native reader cannot decode {pcap_file} ({error}), falling back to tshark")
+
+    if backend in ("auto", "tshark"):
+        # pandas / pyshark / tqdm are only imported by the backend that needs them
+        from tshark_backend import read_fields, select_fields, TsharkError
+        try:
+            display_filter = frame_filter.display_filter() if frame_filter else None
+            instrumentation.note(backend="tshark")
+            return read_fields(pcap_file, select_fields(TSHARK_FIELDS, fields), display_filter, columns=fields)
+        except TsharkError as error:
+            if backend == "tshark":
+                raise
+            print(f"[INFO] tshark field export failed ({error}), falling back to pyshark")
+
+    import pyshark
+    instrumentation.note(backend="pyshark")
+    from tqdm import tqdm
+    capture = pyshark.FileCapture(pcap_file, display_filter=frame_filter.display_filter() if frame_filter else None)
+    extracted_data_all = PacketTableBuilder(fields)
 
-    i = 0
     for packet in tqdm(capture, desc="Extracting Data", unit="packet"):
-        #if i == 20000:
-        #    return extracted_data_all
-        #i += 1
         packet_data_all = {
             'bssid': None,
             'transmitter_mac': None,
@@ -133,163 +197,73 @@ def extract_all_data(pcap_file: str) -> list:
         extracted_data_all.append(packet_data_all)
 
     capture.close()
-    return extracted_data_all
+    return extracted_data_all.build()
 
 
-def filter_beacon_frames(data_all: list) -> list:
+def filter_beacon_frames(data_all) -> PacketTable:
     """
     This Method takes the frame_type_subtype and checks if it is a beacon frame, then adds it
-    to a diffrent list with only beacon frames (1.1)
+    to a diffrent table with only beacon frames (1.1)
 
     Args:
-        data_all (list): list of dictionaries with the extracted data from extract_all_data()
+        data_all (PacketTable): table with the extracted data from extract_all_data()
 
     Returns:
-        List: a new list with only beacon frames.
+        PacketTable: a new table with only beacon frames.
     """
-    beacon_frames = []
-
-    for packet in data_all:
-        if "frame_type_subtype" in packet and packet["frame_type_subtype"] == "0x0008":  
-            beacon_frames.append(packet)
+    data_all = as_packet_table(data_all)
+    return data_all.take(data_all.equals('frame_type_subtype', '0x0008'))
 
-    return beacon_frames
 
-
-def find_spatial_streams(data_all: list) -> list:
+def find_spatial_streams(data_all) -> PacketTable:
     """
     If the spatial streams inforamtion is missing, find the spatial streams based on table[4]
     with MCS index.
 
     Args:
-        data_all (list): list of dictionaries with the extracted data from extract_all_data()
+        data_all (PacketTable): table with the extracted data from extract_all_data()
 
     Returns:
-        List: new list with assigned spatial stream values.
+        PacketTable: the same table with assigned spatial stream values.
     """
-    for packet in data_all:
-        if packet.get('spatial_streams') is None and packet.get('mcs_index') is not None:
-            try:
-                mcs_index = int(packet['mcs_index'])  
-                if 1 <= mcs_index <= 7:
-                    packet['spatial_streams'] = 1
-                elif 8 <= mcs_index <= 15:
-                    packet['spatial_streams'] = 2
-                elif 16 <= mcs_index <= 23:
-                    packet['spatial_streams'] = 3
-            except ValueError:
-                pass  
-
-    return data_all
+    return fill_spatial_streams(as_packet_table(data_all))
 
 #briskei to expected mcs index basei to rssi tou pinaka
 def find_expected_mcs_index(signal_strength, spatial_streams):
+    # thresholds live in mcs_tables.EXPECTED_MCS
+    return expected_mcs_for(PHY, signal_strength, spatial_streams)
 
-    if spatial_streams == 1:          
-        if signal_strength >= -64:
-            return 7  
-        elif -65 <= signal_strength < -64:
-            return 6 
-        elif -66 <= signal_strength < -65:
-            return 5
-        elif -70 <= signal_strength < -66:
-            return 4
-        elif -74 <= signal_strength < -70:
-            return 3
-        elif -77 <= signal_strength < -74:
-            return 2
-        elif -79 <= signal_strength < -77:
-            return 1
-        else:
-            return 0
-    if spatial_streams == 2:
-        if signal_strength >= -64:
-            return 15   
-        elif -65 <= signal_strength < -64:
-            return 14 
-        elif -66 <= signal_strength < -65:
-            return 13
-        elif -70 <= signal_strength < -66:
-            return 12
-        elif -74 <= signal_strength < -70:
-            return 11
-        elif -77 <= signal_strength < -74:
-            return 10
-        elif -79 <= signal_strength < -77:
-            return 9
-        else:
-            return 8
-    if spatial_streams == 3:
-        if signal_strength >= -64:
-            return 23  
-        elif -65 <= signal_strength < -64:
-            return 22 
-        elif -66 <= signal_strength < -65:
-            return 21
-        elif -70 <= signal_strength < -66:
-            return 20
-        elif -74 <= signal_strength < -70:
-            return 19
-        elif -77 <= signal_strength < -74:
-            return 18
-        elif -79 <= signal_strength < -77:
-            return 17
-        else:
-            return 16
-
-
-#bazei rate gap sto data[dict]
-def add_rate_gap(data_all: list) -> list:
-
-    for packet in data_all:
-        if packet.get('spatial_streams') is None and packet.get('mcs_index') is not None:
-            try:
-                mcs_index = int(packet['mcs_index'])
-                if 1 <= mcs_index <= 7:
-                    packet['spatial_streams'] = 1
-                elif 8 <= mcs_index <= 15:
-                    packet['spatial_streams'] = 2
-                elif 16 <= mcs_index <= 23:
-                    packet['spatial_streams'] = 3
-                else:
-                    packet['spatial_streams'] = None
-            except ValueError:
-                packet['spatial_streams'] = None
-        
-        if packet.get('signal_strength') is not None and packet.get('spatial_streams') is not None:
-            try:
-                signal_strength = int(packet['signal_strength'])
-                spatial_streams = int(packet['spatial_streams'])
-                expected_mcs_index = find_expected_mcs_index(signal_strength, spatial_streams)
-                actual_mcs_index = int(packet['mcs_index']) if packet.get('mcs_index') is not None else 0
-                packet['rate_gap'] = find_rate_gap(expected_mcs_index, actual_mcs_index)
 
-            except (ValueError, TypeError):
-                packet['rate_gap'] = None  
+#bazei rate gap sto rate_gap column
+@instrumentation.instrumented("rate_gap", table_arg=0)
+def add_rate_gap(data_all) -> PacketTable:
 
-    return data_all
+    return add_rate_gap_column(as_packet_table(data_all), PHY)
 
 def find_rate_gap(expected_mcs_index, actual_mcs_index):
 
     return expected_mcs_index-actual_mcs_index
 
-def filter_for_1_2(data_all: list, source_mac: str, dest_mac: str, filter) -> list:
+@instrumentation.instrumented("filter", table_arg=0, filters=True)
+def filter_for_1_2(data_all, source_mac: str, dest_mac: str, filter) -> PacketTable:
     """
     filters the packets with the corresponding sa mac and ta mac with a specific filter 
 
     Args:
-        data_all (list): list of dictionaries with the extracted data from extract_all_data()
+        data_all (PacketTable): table with the extracted data from extract_all_data()
         source_mac (str): The sa MAC address to filter.
         dest_mac (str): The ta MAC address to filter.
 
     Returns:
-        List: filtered list with only packets matching the source and destination MAC addresses.
+        PacketTable: filtered table with only packets matching the source and destination MAC addresses.
     """
-    filtered_packets = [
-        packet for packet in data_all
-        if packet.get("transmitter_mac") == source_mac and packet.get("receiver_mac") == dest_mac and packet.get("frame_type_subtype") == filter
-    ]
-    return filtered_packets
+    data_all = as_packet_table(data_all)
+    mask = (
+        data_all.equals('transmitter_mac', source_mac)
+        & data_all.equals('receiver_mac', dest_mac)
+        & data_all.equals('frame_type_subtype', filter)
+    )
+    return data_all.take(mask)
 
 
 if __name__ == "__main__":
@@ -300,19 +274,13 @@ if __name__ == "__main__":
         print(f"[ERROR] Could not find directory: {pcap_dir}")
         sys.exit(0)
 
-    pcap_file = pcap_dir+'/faye_bad_5.pcap'  
-    data = extract_all_data(pcap_file)
+    pcap_file = pcap_dir / 'faye_bad_5.pcap'
+    data = extract_all_data(str(pcap_file))
     data = add_rate_gap(data)
-    
-    #data = find_spatial_streams(data)
-    #filter beacon frames
-    #beacon_frame_data = filter_beacon_frames(data)
 
     communication_packets = filter_for_1_2(data, "2c:f8:9b:dd:06:a0", "00:20:a6:fc:b0:36", "0x0028")
-    
 
-    print("\nBeacon Frames:")
-    for i, packet_info in enumerate(communication_packets):
-        #if((packet_info['mcs_index'] != '130') and (packet_info['short_gi'] == False)):
+    print("\nQoS data frames of the link:")
+    for i, packet_info in enumerate(communication_packets.to_records()):
         print(f"Packet #{i+1}: {packet_info}")
 
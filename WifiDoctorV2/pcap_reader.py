@@ -0,0 +1,647 @@
+"""
+Native pcap / pcapng reader for captures with the radiotap link type.
+It memory-maps the file and decodes only the radiotap and 802.11 header fields
+WifiDoctor needs, so no tshark / pyshark round trip is involved.
+The output has the same columns as the pyshark path of extract_all_data().
+"""
+import mmap
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import instrumentation
+from packet_table import PacketTable, PacketTableBuilder, MISSING_TIME
+
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+
+# radiotap presence bit -> (alignment, size), see https://www.radiotap.org/fields/defined
+RADIOTAP_FIELDS = {
+    0: (8, 8),    # TSFT
+    1: (1, 1),    # Flags
+    2: (1, 1),    # Rate
+    3: (2, 4),    # Channel
+    4: (1, 2),    # FHSS
+    5: (1, 1),    # dBm antenna signal
+    6: (1, 1),    # dBm antenna noise
+    7: (2, 2),    # Lock quality
+    8: (2, 2),    # TX attenuation
+    9: (2, 2),    # dB TX attenuation
+    10: (1, 1),   # dBm TX power
+    11: (1, 1),   # Antenna
+    12: (1, 1),   # dB antenna signal
+    13: (1, 1),   # dB antenna noise
+    14: (2, 2),   # RX flags
+    15: (2, 2),   # TX flags
+    16: (1, 1),   # RTS retries
+    17: (1, 1),   # data retries
+    18: (4, 8),   # XChannel
+    19: (1, 3),   # MCS
+    20: (4, 8),   # A-MPDU status
+    21: (2, 12),  # VHT
+    22: (8, 12),  # timestamp
+    23: (2, 12),  # HE
+    24: (2, 12),  # HE-MU
+    25: (2, 6),   # HE-MU-other-user
+    26: (1, 1),   # 0-length-PSDU
+    27: (2, 4),   # L-SIG
+}
+
+RADIOTAP_FLAG_FCS = 0x10
+CHANNEL_FLAG_CCK = 0x0020
+CHANNEL_FLAG_OFDM = 0x0040
+CHANNEL_FLAG_2GHZ = 0x0080
+CHANNEL_FLAG_5GHZ = 0x0100
+
+# wlan_radio.phy values used by wireshark
+PHY_11B = 4
+PHY_11A = 5
+PHY_11G = 6
+PHY_11N = 7
+PHY_11AC = 8
+
+# (bits per subcarrier, coding rate) for MCS % 8 (HT) or the VHT MCS
+MODULATION = [(1, 1 / 2), (2, 1 / 2), (2, 3 / 4), (4, 1 / 2), (4, 3 / 4), (6, 2 / 3), (6, 3 / 4), (6, 5 / 6), (8, 3 / 4), (8, 5 / 6)]
+DATA_SUBCARRIERS = {20: 52, 40: 108, 80: 234, 160: 468}
+HT_BANDWIDTH = {0: 20, 1: 40, 2: 20, 3: 20}
+# radiotap VHT bandwidth code -> MHz actually used by the frame, the side-band codes (20L, 40U,
+# 20LL, ...) name a part of a wider channel, see https://www.radiotap.org/fields/VHT
+VHT_BANDWIDTH = {
+    0: 20, 1: 40, 2: 20, 3: 20,
+    4: 80, 5: 40, 6: 40, 7: 20, 8: 20, 9: 20, 10: 20,
+    11: 160, 12: 80, 13: 80, 14: 40, 15: 40, 16: 40, 17: 40,
+    18: 20, 19: 20, 20: 20, 21: 20, 22: 20, 23: 20, 24: 20, 25: 20,
+}
+
+# management subtypes whose body carries tagged parameters -> length of the fixed parameters
+MGMT_FIXED_LENGTH = {0x0: 4, 0x1: 6, 0x2: 10, 0x3: 6, 0x4: 0, 0x5: 12, 0x8: 12}
+
+_U16 = {'<': struct.Struct('<H'), '>': struct.Struct('>H')}
+_U32 = {'<': struct.Struct('<I'), '>': struct.Struct('>I')}
+_PCAP_RECORD = {'<': struct.Struct('<IIII'), '>': struct.Struct('>IIII')}
+_EPB = {'<': struct.Struct('<IIIII'), '>': struct.Struct('>IIIII')}
+_PB = {'<': struct.Struct('<HHIIII'), '>': struct.Struct('>HHIIII')}
+_RADIOTAP_HEADER = struct.Struct('<BBHI')
+_LE_U16 = struct.Struct('<H')
+_LE_U32 = struct.Struct('<I')
+_LE_U64 = struct.Struct('<Q')
+_CHANNEL = struct.Struct('<HH')
+_VHT = struct.Struct('<HBBBBBBBBH')
+
+# read_radiotap(workers=...) stays serial unless every worker gets at least this much of the
+# file, below that the split pass and the process start cost more than they save
+MIN_BYTES_PER_WORKER = 16 * 1024 ** 2
+
+
+class PcapFormatError(ValueError):
+    """The file is not a pcap/pcapng capture the native reader can decode."""
+
+
+def rate_from_mcs(mcs, nss, bandwidth_mhz, short_gi):
+    """
+    Data rate in Mbps for an HT/VHT MCS, rounded like wireshark shows wlan_radio.data_rate.
+    """
+    if mcs is None or nss is None or not 0 <= mcs < len(MODULATION) or nss < 1:
+        return None
+    subcarriers = DATA_SUBCARRIERS.get(bandwidth_mhz)
+    if subcarriers is None:
+        return None
+    bits, coding = MODULATION[mcs]
+    symbol_time = 3.6 if short_gi else 4.0
+    return round(subcarriers * bits * coding * nss / symbol_time, 1)
+
+
+def channel_from_frequency(frequency):
+    if frequency == 2484:
+        return 14
+    if 2412 <= frequency < 2484:
+        return (frequency - 2407) // 5
+    if 5000 <= frequency < 5925:
+        return (frequency - 5000) // 5
+    if 5955 <= frequency <= 7115:
+        return (frequency - 5950) // 5
+    return None
+
+
+def format_mac(buf, offset):
+    return bytes(buf[offset:offset + 6]).hex(':')
+
+
+def _timestamp_scale(tsresol):
+    """pcapng if_tsresol -> (numerator, denominator) that converts a timestamp to nanoseconds"""
+    if tsresol & 0x80:
+        units = 2 ** (tsresol & 0x7f)
+    else:
+        units = 10 ** tsresol
+    if 10 ** 9 % units == 0:
+        return 10 ** 9 // units, 1
+    return 10 ** 9, units
+
+
+def _parse_idb(buf, offset, body_end, endian):
+    linktype = _U16[endian].unpack_from(buf, offset)[0]
+    tsresol = 6
+    tsoffset = 0
+    pos = offset + 8
+    while pos + 4 <= body_end:
+        code, length = struct.unpack_from(endian + 'HH', buf, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            tsresol = buf[pos + 4]
+        elif code == 14 and length >= 8:
+            tsoffset = struct.unpack_from(endian + 'q', buf, pos + 4)[0]
+        pos += 4 + ((length + 3) & ~3)
+    multiplier, divisor = _timestamp_scale(tsresol)
+    return linktype, multiplier, divisor, tsoffset * 10 ** 9
+
+
+def iter_pcap_records(buf, start=0, stop=None):
+    """
+    Generator over the records of a classic pcap file.
+
+    Yields:
+        tuple: (sniff_time_ns, data_offset, captured_length, original_length, linktype, record_offset)
+    """
+    if len(buf) < 24:
+        raise PcapFormatError("file too short for a pcap header")
+    magic = _LE_U32.unpack_from(buf, 0)[0]
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        endian = '<'
+    else:
+        endian = '>'
+        magic = _U32['>'].unpack_from(buf, 0)[0]
+    if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        raise PcapFormatError("not a pcap file")
+    frac_ns = 1 if magic == PCAP_MAGIC_NS else 1000
+    linktype = _U32[endian].unpack_from(buf, 20)[0] & 0xffff
+    record = _PCAP_RECORD[endian]
+
+    end = len(buf) if stop is None else min(stop, len(buf))
+    pos = max(start, 24)
+    while pos + 16 <= end:
+        ts_sec, ts_frac, caplen, origlen = record.unpack_from(buf, pos)
+        data = pos + 16
+        if data + caplen > len(buf):
+            break
+        yield ts_sec * 1_000_000_000 + ts_frac * frac_ns, data, caplen, origlen, linktype, pos
+        pos = data + caplen
+
+
+def iter_pcapng_records(buf, start=0, stop=None, state=None):
+    """
+    Generator over the packet blocks of a pcapng file, same tuples as iter_pcap_records().
+
+    Args:
+        state (dict): section state ('endian', 'interfaces') in effect at start, the walk then
+            begins at start instead of at the first section header. An empty dict is filled in
+            and kept up to date while iterating (see time_index).
+    """
+    if len(buf) < 28 or _LE_U32.unpack_from(buf, 0)[0] != PCAPNG_SHB:
+        raise PcapFormatError("not a pcapng file")
+    end = len(buf) if stop is None else min(stop, len(buf))
+    if state:
+        endian, interfaces, pos = state['endian'], list(state['interfaces']), start
+    else:
+        endian, interfaces, pos = '<', [], 0
+    if state is not None:
+        state.update(endian=endian, interfaces=interfaces)
+    while pos + 12 <= len(buf):
+        block_type = _U32[endian].unpack_from(buf, pos)[0]
+        if block_type == PCAPNG_SHB:
+            endian = '<' if _LE_U32.unpack_from(buf, pos + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+            if state is not None:
+                state.update(endian=endian, interfaces=interfaces)
+        block_length = _U32[endian].unpack_from(buf, pos + 4)[0]
+        if block_length < 12 or pos + block_length > len(buf):
+            break
+        body = pos + 8
+        body_end = pos + block_length - 4
+
+        if block_type == PCAPNG_IDB:
+            interfaces.append(_parse_idb(buf, body, body_end, endian))
+        elif pos >= start and pos < end:
+            if block_type == PCAPNG_EPB:
+                interface, ts_high, ts_low, caplen, origlen = _EPB[endian].unpack_from(buf, body)
+                data = body + 20
+            elif block_type == PCAPNG_PB:
+                interface, _, ts_high, ts_low, caplen, origlen = _PB[endian].unpack_from(buf, body)
+                data = body + 20
+            elif block_type == PCAPNG_SPB:
+                interface, ts_high, ts_low = 0, None, None
+                origlen = _U32[endian].unpack_from(buf, body)[0]
+                data = body + 4
+                caplen = min(origlen, body_end - data)
+            else:
+                data = None
+            if data is not None and interface < len(interfaces):
+                linktype, multiplier, divisor, tsoffset = interfaces[interface]
+                if ts_high is None:
+                    sniff_time = MISSING_TIME
+                else:
+                    sniff_time = ((ts_high << 32) | ts_low) * multiplier // divisor + tsoffset
+                yield sniff_time, data, caplen, origlen, linktype, pos
+        elif pos >= end:
+            break
+        pos += block_length
+
+
+def iter_records(buf, start=0, stop=None, state=None):
+    """Picks the pcap or pcapng record iterator from the file magic (state: see iter_pcapng_records)."""
+    if len(buf) >= 4 and _LE_U32.unpack_from(buf, 0)[0] == PCAPNG_SHB:
+        return iter_pcapng_records(buf, start, stop, state)
+    return iter_pcap_records(buf, start, stop)
+
+
+def decode_radiotap(buf, offset, caplen, phy, frame):
+    """
+    Decodes the radiotap header at offset into frame (dict keyed like PacketTable columns).
+
+    Args:
+        phy (str): "11n" takes MCS / bandwidth / GI from the HT field, "11ac" from the VHT field
+
+    Returns:
+        tuple: (radiotap length, radiotap flags)
+    """
+    if caplen < 8:
+        raise PcapFormatError("truncated radiotap header")
+    version, _, length, present = _RADIOTAP_HEADER.unpack_from(buf, offset)
+    if version != 0 or length > caplen:
+        raise PcapFormatError("bad radiotap header")
+
+    # skip the extended presence words, only the first one is decoded
+    pos = offset + 8
+    word = present
+    while word & 0x80000000 and pos + 4 <= offset + length:
+        word = _LE_U32.unpack_from(buf, pos)[0]
+        pos += 4
+
+    flags = 0
+    legacy_rate = None
+    frequency = None
+    channel_flags = 0
+    noise = None
+    ht = None
+    vht = None
+    for bit in range(28):
+        if not present & (1 << bit):
+            continue
+        align, size = RADIOTAP_FIELDS[bit]
+        pos = offset + ((pos - offset + align - 1) & ~(align - 1))
+        if pos + size > offset + length:
+            break
+        if bit == 0:
+            frame['tsf_timestamp'] = _LE_U64.unpack_from(buf, pos)[0]
+        elif bit == 1:
+            flags = buf[pos]
+        elif bit == 2:
+            legacy_rate = buf[pos] / 2
+        elif bit == 3:
+            frequency, channel_flags = _CHANNEL.unpack_from(buf, pos)
+        elif bit == 5:
+            frame['signal_strength'] = buf[pos] - 256 if buf[pos] > 127 else buf[pos]
+        elif bit == 6:
+            noise = buf[pos] - 256 if buf[pos] > 127 else buf[pos]
+        elif bit == 19:
+            ht = (buf[pos], buf[pos + 1], buf[pos + 2])
+        elif bit == 21:
+            vht = _VHT.unpack_from(buf, pos)
+        pos += size
+
+    if frequency:
+        frame['frequency'] = frequency
+        frame['channel'] = channel_from_frequency(frequency)
+    if frame.get('signal_strength') is not None and noise is not None:
+        frame['snr'] = frame['signal_strength'] - noise
+
+    ht_rate = vht_rate = None
+    if ht is not None:
+        known, ht_flags, mcs = ht
+        bandwidth = ht_flags & 0x03 if known & 0x01 else 0
+        short_gi = (ht_flags >> 2) & 1 if known & 0x04 else None
+        if mcs < 32:
+            ht_rate = rate_from_mcs(mcs % 8, mcs // 8 + 1, HT_BANDWIDTH[bandwidth], short_gi)
+        if phy == '11n':
+            frame['mcs_index'] = mcs
+            frame['bandwidth'] = "20 MHz" if bandwidth == 0 else str(bandwidth)
+            frame['short_gi'] = short_gi
+    if vht is not None:
+        known, vht_flags, bandwidth, mcs_nss = vht[0], vht[1], vht[2], vht[3]
+        mcs, nss = mcs_nss >> 4, mcs_nss & 0x0f
+        short_gi = (vht_flags >> 2) & 1 if known & 0x0004 else None
+        vht_rate = rate_from_mcs(mcs, nss, VHT_BANDWIDTH.get(bandwidth), short_gi)
+        if phy == '11ac' and nss:
+            frame['mcs_index'] = mcs
+            frame['spatial_streams'] = nss
+            frame['bandwidth'] = "20 MHz" if bandwidth == 0 else str(bandwidth)
+            frame['short_gi'] = short_gi
+
+    if vht is not None:
+        frame['phy_type'] = PHY_11AC
+        frame['data_rate'] = vht_rate
+    elif ht is not None:
+        frame['phy_type'] = PHY_11N
+        frame['data_rate'] = ht_rate
+    else:
+        if channel_flags & CHANNEL_FLAG_CCK:
+            frame['phy_type'] = PHY_11B
+        elif channel_flags & CHANNEL_FLAG_OFDM:
+            frame['phy_type'] = PHY_11A if channel_flags & CHANNEL_FLAG_5GHZ else PHY_11G
+        frame['data_rate'] = legacy_rate
+    return length, flags
+
+
+def peek_radiotap(buf, offset, caplen):
+    """
+    The few radiotap facts a catalog needs, without walking every field like decode_radiotap().
+
+    Returns:
+        tuple: (radiotap length, PHY_11AC / PHY_11N / None from the VHT / HT presence bits,
+            channel frequency in MHz or None)
+    """
+    if caplen < 8:
+        raise PcapFormatError("truncated radiotap header")
+    version, _, length, present = _RADIOTAP_HEADER.unpack_from(buf, offset)
+    if version != 0 or length > caplen:
+        raise PcapFormatError("bad radiotap header")
+    phy_type = PHY_11AC if present & (1 << 21) else PHY_11N if present & (1 << 19) else None
+    frequency = None
+    if present & (1 << 3):
+        pos = offset + 8
+        word = present
+        while word & 0x80000000 and pos + 4 <= offset + length:
+            word = _LE_U32.unpack_from(buf, pos)[0]
+            pos += 4
+        # TSFT, Flags and Rate are the only fields in front of Channel
+        if present & 1:
+            pos = offset + ((pos - offset + 7) & ~7) + 8
+        pos += bool(present & 2) + bool(present & 4)
+        pos = offset + ((pos - offset + 1) & ~1)
+        if pos + 4 <= offset + length:
+            frequency = _LE_U16.unpack_from(buf, pos)[0]
+    return length, phy_type, frequency
+
+
+def decode_80211(buf, offset, end, frame):
+    """
+    Decodes the 802.11 MAC header (and the SSID of management frames) between offset and end.
+
+    Returns:
+        int: header length, 0 if the frame is too short
+    """
+    if end - offset < 10:
+        return 0
+    fc0, fc1 = buf[offset], buf[offset + 1]
+    frame_type = (fc0 >> 2) & 0x3
+    subtype = (fc0 >> 4) & 0xf
+    frame['frame_type_subtype'] = f"0x{(frame_type << 4) | subtype:04x}"
+    frame['retry_flag'] = 1 if fc1 & 0x08 else 0
+    to_ds, from_ds = fc1 & 0x01, fc1 & 0x02
+    order = fc1 & 0x80
+
+    if frame_type == 1:
+        header_length = 10 if subtype in (0xc, 0xd) else 16
+    else:
+        header_length = 24
+        if frame_type == 2:
+            if to_ds and from_ds:
+                header_length += 6
+            if subtype & 0x08:
+                header_length += 2
+                if order:
+                    header_length += 4
+        elif order:
+            header_length += 4
+    if end - offset < header_length:
+        return 0
+
+    frame['receiver_mac'] = format_mac(buf, offset + 4)
+    if header_length >= 16:
+        frame['transmitter_mac'] = format_mac(buf, offset + 10)
+    if frame_type == 0:
+        frame['bssid'] = format_mac(buf, offset + 16)
+    elif frame_type == 2:
+        if not to_ds and not from_ds:
+            frame['bssid'] = format_mac(buf, offset + 16)
+        elif to_ds and not from_ds:
+            frame['bssid'] = frame['receiver_mac']
+        elif from_ds and not to_ds:
+            frame['bssid'] = frame['transmitter_mac']
+
+    if frame_type == 0 and subtype in MGMT_FIXED_LENGTH:
+        body = offset + header_length
+        if subtype in (0x5, 0x8) and body + 8 <= end:
+            frame['timestamp'] = _LE_U64.unpack_from(buf, body)[0]
+        pos = body + MGMT_FIXED_LENGTH[subtype]
+        while pos + 2 <= end:
+            tag, tag_length = buf[pos], buf[pos + 1]
+            if tag == 0:
+                if tag_length and pos + 2 + tag_length <= end:
+                    frame['ssid'] = bytes(buf[pos + 2:pos + 2 + tag_length]).decode('utf-8', 'replace')
+                break
+            pos += 2 + tag_length
+    return header_length
+
+
+def decode_frame(buf, offset, caplen, origlen, phy):
+    """
+    Decodes one radiotap + 802.11 record.
+
+    Returns:
+        dict: frame fields keyed like the PacketTable columns
+    """
+    frame = {'frame_length': origlen}
+    radiotap_length, flags = decode_radiotap(buf, offset, caplen, phy, frame)
+    frame['radiotap_length'] = radiotap_length
+    end = offset + caplen
+    if flags & RADIOTAP_FLAG_FCS:
+        end -= 4
+    header_length = decode_80211(buf, offset + radiotap_length, end, frame)
+    if header_length:
+        frame['wlan_header_length'] = header_length
+    frame['payload_length'] = max(origlen - radiotap_length - header_length, 0)
+    return frame
+
+
+def detect_phy(pcap_file, max_records=5000):
+    """
+    Guesses the parser for a capture from the radiotap headers of its first records:
+    "11ac" when VHT fields show up, "11n" when only HT ones do, otherwise by band (5 GHz -> "11ac").
+    """
+    phy_types = set()
+    frequencies = set()
+    with open(pcap_file, 'rb') as f, _open_mmap(f) as buf:
+        for count, (_, data, caplen, _, linktype, _) in enumerate(iter_records(buf)):
+            if count >= max_records or PHY_11AC in phy_types:
+                break
+            if linktype != LINKTYPE_IEEE802_11_RADIOTAP:
+                raise PcapFormatError(f"unsupported link type {linktype}")
+            frame = {}
+            try:
+                decode_radiotap(buf, data, caplen, '11n', frame)
+            except PcapFormatError:
+                continue
+            phy_types.add(frame.get('phy_type'))
+            frequencies.add(frame.get('frequency'))
+    if PHY_11AC in phy_types:
+        return '11ac'
+    if PHY_11N in phy_types:
+        return '11n'
+    return '11ac' if any(frequency and frequency >= 5000 for frequency in frequencies) else '11n'
+
+
+def _section(state):
+    # copy of the pcapng section state at this point of the walk, None for classic pcap
+    return {'endian': state['endian'], 'interfaces': list(state['interfaces'])} if state else None
+
+
+def split_records(buf, chunks):
+    """
+    Cuts the capture into about `chunks` byte ranges that start and end on record boundaries.
+
+    Returns:
+        list: (start, stop, state) with stop None for the last range and state the pcapng section
+            state at start (None for classic pcap), so a worker parses from start right away
+    """
+    target = max(len(buf) // max(chunks, 1), 1)
+    ranges = []
+    start = start_state = None
+    boundary = target
+    state = {}
+    for _, _, _, _, _, record_offset in iter_records(buf, state=state):
+        if start is None:
+            start, start_state = record_offset, _section(state)
+        elif record_offset >= boundary:
+            ranges.append((start, record_offset, start_state))
+            start, start_state = record_offset, _section(state)
+            boundary = record_offset + target
+    if start is not None:
+        ranges.append((start, None, start_state))
+    return ranges
+
+
+def worker_count(size, workers):
+    """Processes worth starting for size bytes: at most workers, and serial below MIN_BYTES_PER_WORKER each."""
+    return max(1, min(workers or 1, size // MIN_BYTES_PER_WORKER))
+
+
+def first_record_time(buf):
+    """Time (ns) of the first record with a timestamp, the origin of FrameFilter time ranges (None if there is none)."""
+    for sniff_time, *_ in iter_records(buf):
+        if sniff_time != MISSING_TIME:
+            return sniff_time
+    return None
+
+
+def _decode_records(buf, phy, frame_filter, first_time, start=0, stop=None, fields=None, state=None, counts=None):
+    # counts (dict): gets the 'dropped' (filtered out) and 'unparseable' (malformed radiotap) records added
+    builder = PacketTableBuilder(fields)
+    dropped = unparseable = 0
+    for sniff_time, data, caplen, origlen, linktype, _ in iter_records(buf, start, stop, state):
+        if linktype != LINKTYPE_IEEE802_11_RADIOTAP:
+            raise PcapFormatError(f"unsupported link type {linktype}")
+        if frame_filter is not None:
+            if not frame_filter.matches_time(sniff_time, first_time):
+                dropped += 1
+                continue
+            radiotap_length = _LE_U16.unpack_from(buf, data + 2)[0] if caplen >= 4 else caplen
+            if not frame_filter.matches_header(buf, data + radiotap_length, data + caplen):
+                dropped += 1
+                continue
+        try:
+            frame = decode_frame(buf, data, caplen, origlen, phy)
+        except PcapFormatError:
+            # malformed radiotap header, keep the frame with what the record header tells us
+            frame = {'frame_length': origlen}
+            unparseable += 1
+        frame['sniff_time'] = sniff_time
+        builder.append(frame)
+    if counts is not None:
+        counts['dropped'] = counts.get('dropped', 0) + dropped
+        counts['unparseable'] = counts.get('unparseable', 0) + unparseable
+    return builder.build()
+
+
+def _open_mmap(f):
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        raise PcapFormatError("empty file")
+
+
+def _read_range(pcap_file, phy, frame_filter, first_time, start, stop, fields=None, state=None):
+    """Process pool worker: decodes the records in [start, stop) of pcap_file, returns (table, counts)."""
+    counts = {}
+    with open(pcap_file, 'rb') as f, _open_mmap(f) as buf:
+        return _decode_records(buf, phy, frame_filter, first_time, start, stop, fields, state, counts), counts
+
+
+def _joined(results):
+    """Tables of _read_range() workers in file order, their drop counts go to the running stage."""
+    for _, counts in results:
+        instrumentation.count(**counts)
+    return PacketTable.concat([table for table, _ in results])
+
+
+def read_radiotap(pcap_file: str, phy: str = "11n", frame_filter=None, workers: int = None, fields=None) -> PacketTable:
+    """
+    Reads a pcap/pcapng file with the radiotap link type straight into a PacketTable.
+
+    Args:
+        pcap_file (str): path to the pcap file
+        phy (str): "11n" or "11ac", decides where MCS / spatial streams / bandwidth come from
+        frame_filter (FrameFilter): optional predicate checked on the record time and the raw
+            802.11 header before the frame is decoded
+            (with a time range only the part of the file it covers is read, see time_index)
+        workers (int): decode record-aligned chunks of the file in up to this many processes
+            (see worker_count()), the chunks are joined in file order so the table is identical
+            to the serial one
+        fields (list): columns to keep (e.g. packet_table.ANALYSIS_FIELDS), None = all of SCHEMA
+
+    Returns:
+        PacketTable: one row for each (matching) packet in the pcap_file
+
+    Raises:
+        PcapFormatError: the file is not pcap/pcapng or a record is not radiotap
+    """
+    if frame_filter is not None and (frame_filter.start_s is not None or frame_filter.end_s is not None):
+        return _read_time_range(pcap_file, phy, frame_filter, workers, fields)
+    with open(pcap_file, 'rb') as f, _open_mmap(f) as buf:
+        first_time = first_record_time(buf) if frame_filter is not None else None
+        workers = worker_count(len(buf), workers)
+        ranges = split_records(buf, workers) if workers > 1 else []
+        if len(ranges) <= 1:
+            counts = {}
+            return _joined([(_decode_records(buf, phy, frame_filter, first_time, fields=fields, counts=counts), counts)])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_read_range, pcap_file, phy, frame_filter, first_time, start, stop, fields, state)
+                   for start, stop, state in ranges]
+        return _joined([future.result() for future in futures])
+
+
+def _read_time_range(pcap_file, phy, frame_filter, workers, fields):
+    """read_radiotap() for a filter with a time range: seeks to it through the capture's time index."""
+    from time_index import load_or_build_index
+    index = load_or_build_index(pcap_file)
+    ranges = index.ranges(frame_filter.start_s, frame_filter.end_s)
+    if not ranges:
+        return PacketTableBuilder(fields).build()
+    start, stop, _ = ranges[0]
+    workers = worker_count((index.size if stop is None else stop) - start, workers)
+    if workers > 1:
+        ranges = index.ranges(frame_filter.start_s, frame_filter.end_s, workers)
+    if len(ranges) == 1:
+        start, stop, state = ranges[0]
+        return _joined([_read_range(pcap_file, phy, frame_filter, index.first_time, start, stop, fields, state)])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_read_range, pcap_file, phy, frame_filter, index.first_time, start, stop, fields, state)
+                   for start, stop, state in ranges]
+        return _joined([future.result() for future in futures])
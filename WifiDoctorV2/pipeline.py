@@ -0,0 +1,344 @@
+"""
+Fused single-pass analysis.
+
+Frames are decoded one at a time, annotated once (rate gap) and handed to every registered
+consumer, e.g. a LinkWindowConsumer for the link metrics and an RssidConsumer fed by the
+beacons. The capture is read once and the frame list is never materialized: consumers keep
+only their own running state (window sums, RSSID per BSS and time bucket).
+
+A consumer is any object with consume(frame) and finish(); frames are dicts keyed like the
+PacketTable columns.
+"""
+import math
+import mmap
+import instrumentation
+from frame_filter import FrameFilter
+from mcs_tables import rate_gap_for
+from packet_table import MISSING_TIME
+from pcap_reader import PcapFormatError, LINKTYPE_IEEE802_11_RADIOTAP, _LE_U16, decode_frame, iter_records
+from sketches import MetricSketches
+from time_index import load_or_build_index
+from wifi_analysis_engine import (
+    RssidSeries, RssidTracker, compute_theoretical_throughput, RSSID_RESOLUTION_S, WINDOW_SIZE_S, MAX_DURATION_S,
+)
+
+
+def iter_file_records(pcap_file, ranges=None):
+    """
+    Records of a capture file through mmap, without copying the frame bytes.
+
+    Args:
+        ranges (list): only read these (start, stop, state) byte ranges, see TimeIndex.ranges()
+
+    Yields:
+        tuple: (sniff_time_ns, buffer, data_offset, captured_length, original_length, linktype)
+    """
+    with open(pcap_file, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise PcapFormatError("empty file")
+        with buf:
+            for start, stop, state in ranges if ranges is not None else [(0, None, None)]:
+                for sniff_time, data, caplen, origlen, linktype, _ in iter_records(buf, start, stop, state):
+                    yield sniff_time, buf, data, caplen, origlen, linktype
+
+
+def decode_frames(records, phy, frame_filter=None, first_time=None):
+    """
+    Decodes records (see iter_file_records()), frames that do not pass frame_filter are skipped
+    before decoding. Every frame gets its rate_gap like add_rate_gap() would give it.
+
+    Args:
+        first_time (int): origin (ns) of the frame_filter time range, defaults to the first timestamped record
+
+    Yields:
+        dict: frame fields keyed like the PacketTable columns
+    """
+    dropped = unparseable = 0
+    try:
+        for sniff_time, buf, data, caplen, origlen, linktype in records:
+            if linktype != LINKTYPE_IEEE802_11_RADIOTAP:
+                raise PcapFormatError(f"unsupported link type {linktype}")
+            if first_time is None and sniff_time != MISSING_TIME:
+                first_time = sniff_time
+            if frame_filter is not None:
+                if not frame_filter.matches_time(sniff_time, first_time):
+                    dropped += 1
+                    continue
+                radiotap_length = _LE_U16.unpack_from(buf, data + 2)[0] if caplen >= 4 else caplen
+                if not frame_filter.matches_header(buf, data + radiotap_length, data + caplen):
+                    dropped += 1
+                    continue
+            try:
+                frame = decode_frame(buf, data, caplen, origlen, phy)
+            except PcapFormatError:
+                frame = {'frame_length': origlen}
+                unparseable += 1
+            frame['sniff_time'] = sniff_time
+            frame['rate_gap'] = rate_gap_for(phy, frame.get('signal_strength'), frame.get('spatial_streams'), frame.get('mcs_index'))
+            yield frame
+    finally:
+        instrumentation.count(dropped, unparseable)
+
+
+class Pipeline:
+    """
+    Dispatches every frame to the registered consumers.
+
+    Args:
+        consumers (list): objects with consume(frame) and finish()
+    """
+
+    def __init__(self, consumers=()):
+        self.consumers = list(consumers)
+        self.frames = 0
+
+    def register(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    def feed(self, frames):
+        """Hands frames to the consumers without finishing them (for input that arrives in parts)."""
+        consumers = [consumer.consume for consumer in self.consumers]
+        for frame in frames:
+            self.frames += 1
+            for consume in consumers:
+                consume(frame)
+
+    def finish(self):
+        for consumer in self.consumers:
+            consumer.finish()
+
+    def run(self, frames):
+        self.feed(frames)
+        self.finish()
+        return self
+
+
+class RssidConsumer:
+    """
+    Feeds every frame with an SSID (beacons, probe responses) into an RssidTracker and folds the
+    channel RSSIDs into an RssidSeries, i.e. compute_rssid_series() without the packet table.
+    """
+
+    def __init__(self, decay_rate=0.1, window_size=10, resolution=RSSID_RESOLUTION_S):
+        self.tracker = RssidTracker(decay_rate, window_size)
+        self.series = RssidSeries(resolution)
+
+    def consume(self, frame):
+        ssid = frame.get('ssid')
+        channel = frame.get('channel')
+        sniff_time = frame.get('sniff_time', MISSING_TIME)
+        if not ssid or channel is None or frame.get('signal_strength') is None or sniff_time == MISSING_TIME:
+            return
+        timestamp = sniff_time / 1e9
+        self.tracker.update(ssid, channel, int(frame['signal_strength']), timestamp)
+        self.series.add_snapshot(timestamp, self.tracker.snapshot(timestamp))
+
+    def finish(self):
+        pass
+
+    def avg_rssid(self, channel):
+        return self.series.mean(channel)
+
+    def window_rssid(self, channel, start_s, end_s):
+        """RSSID of channel in [start_s, end_s) (epoch seconds), see RssidSeries.window_values()."""
+        return float(self.series.window_values(channel, [start_s], [end_s])[0])
+
+    def prune(self, before_s):
+        """Forgets the RSSID buckets no window starting at or after before_s (epoch seconds) needs."""
+        self.series.prune(before_s)
+
+
+class WindowSums:
+    """
+    Running sums of one window, enough to compute its metrics without the frames, plus the
+    quantile sketches of its RSSI, rate and rate gap when percentiles are asked for.
+    """
+    __slots__ = ('packets', 'retries', 'rssi', 'rssi_n', 'rate', 'rate_n', 'gap', 'gap_n',
+                 'payload', 'payload_n', 'total', 'total_n', 'sketches')
+
+    def __init__(self, sketches=False):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+        self.sketches = MetricSketches() if sketches else None
+
+    def add(self, frame, bins=()):
+        """bins: MetricSketches.bins_of(frame), computed once for all the windows of the frame."""
+        self.packets += 1
+        if frame.get('retry_flag') == 1:
+            self.retries += 1
+        self.rssi += math.trunc(frame['signal_strength'])
+        self.rssi_n += 1
+        for key, name in (('data_rate', 'rate'), ('rate_gap', 'gap'), ('payload_length', 'payload'), ('frame_length', 'total')):
+            value = frame.get(key)
+            if value is not None:
+                setattr(self, name, getattr(self, name) + value)
+                setattr(self, name + '_n', getattr(self, name + '_n') + 1)
+        if self.sketches is not None:
+            self.sketches.add_bins(bins)
+
+    @staticmethod
+    def _mean(total, count):
+        return total / count if count else None
+
+    def result(self, end, rssid, percentiles=None):
+        rate = self._mean(self.rate, self.rate_n)
+        loss = self.retries / self.packets
+        gap = self._mean(self.gap, self.gap_n)
+        avg_payload = self._mean(self.payload, self.payload_n)
+        avg_total = self._mean(self.total, self.total_n)
+        result = {
+            'timestamp': end,
+            'packets': self.packets,
+            'avg_rssi': self._mean(self.rssi, self.rssi_n),
+            'avg_rate': rate,
+            'frame_loss': loss,
+            'rate_gap': gap,
+            'theoretical_throughput': compute_theoretical_throughput(rate, loss, gap, rssid, avg_payload, avg_total),
+        }
+        if percentiles:
+            result.update(self.sketches.percentiles(percentiles))
+        return result
+
+
+class LinkWindowConsumer:
+    """
+    run_analysis() as a consumer: the link's frames go into per-window sums. The time origin is
+    the first link frame and the RSSID of each window comes from rssid (the channel of the first
+    link frame).
+
+    Without on_window every window is kept (a few numbers each) until finish(), which computes the
+    throughput with the RSSID series of the whole capture, exactly like run_analysis(). With
+    on_window a window is emitted and dropped as soon as any later frame shows it closed, using the
+    RSSID series known at that moment, and the RSSID buckets before the oldest window still open
+    are pruned (live mode).
+
+    Args:
+        transmitter_mac, receiver_mac, subtype: the link, same meaning as in filter_for_1_2()
+        rssid (RssidConsumer): where the channel RSSID comes from
+        window_size (float): window length in seconds
+        step (float): distance between window starts (defaults to window_size)
+        max_duration (float): ignore link frames later than this many seconds (None = no limit)
+        on_window (callable): called with each result dict when its window closes,
+            instead of collecting them in self.results
+        percentiles (list): also report these percentiles of RSSI, rate and rate gap per window
+            (rssi_p5, ...); self.sketches then holds the sketches of every link frame, ready to be
+            merged with the ones of other slices / processes
+    """
+
+    def __init__(self, transmitter_mac, receiver_mac, rssid, subtype="0x0028", window_size=WINDOW_SIZE_S,
+                 step=None, max_duration=MAX_DURATION_S, on_window=None, percentiles=None):
+        self.transmitter_mac = transmitter_mac.lower()
+        self.receiver_mac = receiver_mac.lower()
+        self.subtype = subtype
+        self.rssid = rssid
+        self.window_size = window_size
+        self.step = step or window_size
+        self.max_duration = max_duration
+        self.on_window = on_window
+        self.percentiles = percentiles
+        self.sketches = MetricSketches() if percentiles else None
+        self.origin = None
+        self.channel = None
+        self.late_frames = 0
+        self.results = []
+        self._open = {}         # window index -> WindowSums
+        self._next_window = 0   # windows before this one were emitted (live mode)
+        self._last_t = 0.0
+
+    def _is_link_frame(self, frame):
+        return (frame.get('transmitter_mac') == self.transmitter_mac
+                and frame.get('receiver_mac') == self.receiver_mac
+                and frame.get('frame_type_subtype') == self.subtype
+                and frame.get('signal_strength') is not None)
+
+    def _emit(self, index):
+        start_s = self.origin / 1e9 + index * self.step
+        rssid = self.rssid.window_rssid(self.channel, start_s, start_s + self.window_size)
+        result = self._open.pop(index).result(index * self.step + self.window_size, rssid, self.percentiles)
+        if self.on_window is not None:
+            self.on_window(result)
+        else:
+            self.results.append(result)
+
+    def consume(self, frame):
+        sniff_time = frame.get('sniff_time', MISSING_TIME)
+        if sniff_time == MISSING_TIME:
+            return
+        link_frame = self._is_link_frame(frame)
+        if self.origin is None:
+            if not link_frame:
+                return
+            self.origin = sniff_time
+            self.channel = frame.get('channel') or 1
+        t = (sniff_time - self.origin) / 1e9
+        # window k covers [k * step, k * step + window_size)
+        first = max(math.floor((t - self.window_size) / self.step) + 1, 0)
+        if self.on_window is not None:
+            # the windows that end at or before t are complete
+            for k in sorted(k for k in self._open if k < first):
+                self._emit(k)
+            if first > self._next_window:
+                self._next_window = first
+                # no window before this one will be asked for its RSSID again
+                self.rssid.prune(self.origin / 1e9 + first * self.step)
+        if not link_frame:
+            return
+        if self.max_duration is not None and t > self.max_duration:
+            return
+        last = math.floor(t / self.step)
+        if t < 0 or last < self._next_window:
+            self.late_frames += 1
+            return
+        self._last_t = max(self._last_t, t)
+        bins = ()
+        if self.sketches is not None:
+            bins = self.sketches.bins_of(frame)
+            self.sketches.add_bins(bins)
+        for k in range(max(first, self._next_window), last + 1):
+            if k not in self._open:
+                self._open[k] = WindowSums(self.sketches is not None)
+            self._open[k].add(frame, bins)
+
+    def finish(self):
+        # like run_analysis, the last window is the last one that starts before the last link frame
+        for k in sorted(self._open):
+            if k * self.step < self._last_t:
+                self._emit(k)
+        self._open.clear()
+
+
+@instrumentation.instrumented("pipeline")
+def analyze_capture(pcap_file, phy, transmitter_mac, receiver_mac, subtype="0x0028", window_size=WINDOW_SIZE_S,
+                    step=None, max_duration=MAX_DURATION_S, consumers=(), start_s=None, end_s=None, percentiles=None,
+                    sketches=None):
+    """
+    The single-link analysis of run_analysis() in one read of pcap_file.
+
+    Args:
+        phy (str): "11n" or "11ac"
+        consumers (list): extra consumers that see the same frames
+        start_s, end_s (float): only analyze [start_s, end_s) seconds after the first record,
+            the capture's time index is used to read just that part
+        percentiles (list): add these percentiles of RSSI, rate and rate gap to every window
+        sketches (MetricSketches): when given (with percentiles), the link's sketches are merged into it
+
+    Returns:
+        list: one dict per non-empty window, the rows of run_analysis() plus 'packets'
+    """
+    rssid = RssidConsumer()
+    link = LinkWindowConsumer(transmitter_mac, receiver_mac, rssid, subtype, window_size, step, max_duration,
+                              percentiles=percentiles)
+    # only the link frames and the beacons are decoded
+    frame_filter = FrameFilter(transmitter_mac, receiver_mac, subtype, keep_beacons=True, start_s=start_s, end_s=end_s)
+    ranges = first_time = None
+    if start_s is not None or end_s is not None:
+        index = load_or_build_index(pcap_file)
+        ranges, first_time = index.ranges(start_s, end_s), index.first_time
+    frames = decode_frames(iter_file_records(pcap_file, ranges), phy, frame_filter, first_time)
+    Pipeline([rssid, link, *consumers]).run(frames)
+    if sketches is not None and link.sketches is not None:
+        sketches.merge(link.sketches)
+    return link.results
@@ -0,0 +1,113 @@
+"""
+Headless rendering of the run_analysis() metric plots.
+
+Figures are built with matplotlib's object API (matplotlib.figure.Figure on the Agg canvas),
+never through pyplot: nothing opens a window, nothing blocks, and a figure is freed as soon
+as it is saved instead of piling up in pyplot's global figure list. That makes it safe to
+plot hundreds of captures in one batch run, optionally in worker processes.
+
+Layouts:
+    "combined": one figure, a row per metric, shared time axis (wifi_metrics.png)
+    "separate": the five files run_analysis() always wrote (rssi_plot.png, ...)
+
+matplotlib itself is imported on the first figure, importing this module is cheap.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# (result key, y label, title, file name of the "separate" layout)
+METRICS = [
+    ('avg_rssi', "RSSI (dBm)", "Average RSSI Over Time", "rssi_plot.png"),
+    ('avg_rate', "Data Rate (Mbps)", "Average Data Rate Over Time", "rate_plot.png"),
+    ('frame_loss', "Frame Loss Rate", "Frame Loss Over Time", "loss_plot.png"),
+    ('rate_gap', "Rate Gap", "Rate Gap Over Time", "rate_gap_plot.png"),
+    ('theoretical_throughput', "Throughput (Mbps)", "Estimated Throughput Over Time", "throughput_plot.png"),
+]
+COMBINED_FILE = "wifi_metrics.png"
+LAYOUTS = ("combined", "separate")
+
+
+def _series(results, key):
+    times = [r['timestamp'] for r in results]
+    values = [r[key] if r[key] is not None else float('nan') for r in results]
+    return times, values
+
+
+def metric_figure(results, key, ylabel, title):
+    """One metric over time, the figure plot_metric() used to draw."""
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(10, 5))
+    axes = figure.add_subplot()
+    axes.plot(*_series(results, key), marker='o')
+    axes.set_title(title)
+    axes.set_xlabel("Time (seconds)")
+    axes.set_ylabel(ylabel)
+    axes.grid(True)
+    return figure
+
+
+def combined_figure(results, title=None):
+    """Every metric in its own row of one figure, the rows share the time axis."""
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(10, 2.2 * len(METRICS)), layout='constrained')
+    rows = figure.subplots(len(METRICS), 1, sharex=True)
+    for axes, (key, ylabel, metric_title, _) in zip(rows, METRICS):
+        axes.plot(*_series(results, key), marker='o', markersize=3)
+        axes.set_title(metric_title, fontsize='medium')
+        axes.set_ylabel(ylabel)
+        axes.grid(True)
+    rows[-1].set_xlabel("Time (seconds)")
+    if title:
+        figure.suptitle(title)
+    return figure
+
+
+def render_metrics(results, layout="combined", output_dir=".", prefix="", title=None):
+    """
+    Saves the metric plots of one analysis.
+
+    Args:
+        results (list): result rows of run_analysis() / analyze_link()
+        layout (str): "combined" or "separate"
+        output_dir (str): where the images go
+        prefix (str): prepended to the file names (e.g. the capture name in batch runs)
+        title (str): figure title of the combined layout
+
+    Returns:
+        list: paths of the written images
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown plot layout {layout!r}, expected one of {LAYOUTS}")
+    os.makedirs(output_dir, exist_ok=True)
+    if layout == "combined":
+        figures = [(combined_figure(results, title), COMBINED_FILE)]
+    else:
+        figures = [(metric_figure(results, key, ylabel, metric_title), filename)
+                   for key, ylabel, metric_title, filename in METRICS]
+    paths = []
+    for figure, filename in figures:
+        path = os.path.join(output_dir, prefix + filename)
+        figure.savefig(path)
+        paths.append(path)
+    return paths
+
+
+def _render_job(job):
+    return render_metrics(**job)
+
+
+def render_many(jobs, workers=None):
+    """
+    Renders several analyses, in worker processes when workers > 1.
+
+    Args:
+        jobs (list): keyword arguments of render_metrics(), one dict per analysis
+        workers (int): processes to render in (None / 1 = in this process)
+
+    Returns:
+        list: the written image paths of every job, in job order
+    """
+    if not workers or workers <= 1 or len(jobs) <= 1:
+        return [render_metrics(**job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return list(pool.map(_render_job, jobs, chunksize=max(len(jobs) // (4 * workers), 1)))
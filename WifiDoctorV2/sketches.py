@@ -0,0 +1,211 @@
+"""
+Mergeable quantile sketches for the per-window and per-link distributions (p5 / p50 / p95 ...).
+
+A sketch is a histogram over fixed bins, so two sketches of the same metric merge by adding
+their counts: the windows of a link, the slices of a capture analyzed in different processes
+or the chunks of a stream combine into exactly the sketch of all their frames. Memory is
+bounded by the number of bins, whatever the number of frames.
+
+    rssi      1 dBm bins, exact (the RSSI is truncated to whole dBm like avg_rssi)
+    rate      logarithmic bins, every quantile within 1 % of the true rate (like DDSketch)
+    rate_gap  1 MCS bins, exact
+
+Quantiles use the nearest-rank rule (numpy's "inverted_cdf" method): the p-th percentile of n
+values is the smallest value with at least ceil(p / 100 * n) values at or below it, so the
+percentile of an integer metric is always a value that was actually seen.
+"""
+import math
+import numpy as np
+
+PERCENTILES = (5, 50, 95)
+
+
+class LinearBins:
+    """
+    Bins of `width` centered on low, low + width, ..., high. Values outside are counted in the
+    first / last bin.
+    """
+
+    def __init__(self, low, high, width=1.0):
+        self.low = low
+        self.width = width
+        self.size = int(round((high - low) / width)) + 1
+
+    def index(self, values):
+        return np.clip(np.rint((np.asarray(values, dtype=np.float64) - self.low) / self.width), 0, self.size - 1).astype(np.intp)
+
+    def index_of(self, value):
+        return min(max(int(round((value - self.low) / self.width)), 0), self.size - 1)
+
+    def value(self, indices):
+        return self.low + np.asarray(indices) * self.width
+
+    def __eq__(self, other):
+        return type(other) is LinearBins and (self.low, self.width, self.size) == (other.low, other.width, other.size)
+
+
+class LogBins:
+    """
+    Bin i > 0 holds (low * gamma^(i-1), low * gamma^i] with gamma = (1 + e) / (1 - e), its value is
+    within e of everything in it. Values up to low go to bin 0, values above high to the last bin.
+    """
+
+    def __init__(self, low, high, relative_error=0.01):
+        self.low = low
+        self.relative_error = relative_error
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self.gamma)
+        self.size = int(math.ceil(math.log(high / low) / self._log_gamma)) + 1
+
+    def index(self, values):
+        values = np.maximum(np.asarray(values, dtype=np.float64), self.low)
+        return np.clip(np.ceil(np.log(values / self.low) / self._log_gamma), 0, self.size - 1).astype(np.intp)
+
+    def index_of(self, value):
+        if value <= self.low:
+            return 0
+        return min(int(math.ceil(math.log(value / self.low) / self._log_gamma)), self.size - 1)
+
+    def value(self, indices):
+        indices = np.asarray(indices)
+        return np.where(indices > 0, self.low * self.gamma ** indices * 2 / (self.gamma + 1), self.low)
+
+    def __eq__(self, other):
+        return (type(other) is LogBins
+                and (self.low, self.relative_error, self.size) == (other.low, other.relative_error, other.size))
+
+
+# metric -> (PacketTable column, bins, truncate the values first)
+METRICS = {
+    'rssi': ('signal_strength', LinearBins(-128, 20), True),
+    'rate': ('data_rate', LogBins(0.5, 10000, 0.01), False),
+    'rate_gap': ('rate_gap', LinearBins(-64, 64), False),
+}
+
+
+def percentile_columns(percentiles=PERCENTILES, metrics=METRICS):
+    """Column names of the percentiles, e.g. rssi_p5, rssi_p50, ..., rate_gap_p95."""
+    return [f"{name}_p{percentile:g}" for name in metrics for percentile in percentiles]
+
+
+def nearest_ranks(percentiles, counts):
+    """1-based rank of each percentile among counts values (at least 1), as an array shaped (percentiles, counts)."""
+    percentiles = np.asarray(percentiles, dtype=np.float64).reshape(-1, *np.ndim(counts) * (1,))
+    # the rounding keeps e.g. 95 % of 20 at rank 19 instead of ceil(19.000000000000004)
+    return np.maximum(np.ceil(np.round(percentiles / 100 * counts, 9)), 1)
+
+
+def bin_count_quantiles(bins, occupied, counts, percentiles):
+    """
+    Percentiles of many histograms at once.
+
+    Args:
+        bins (LinearBins / LogBins): the bins of the histograms
+        occupied (numpy.ndarray): bin indices of the columns of counts, ascending
+        counts (numpy.ndarray): one histogram per row, shaped (histograms, len(occupied))
+        percentiles (list): percentiles in [0, 100]
+
+    Returns:
+        numpy.ndarray: shaped (percentiles, histograms), NaN for empty histograms
+    """
+    result = np.full((len(percentiles), len(counts)), np.nan)
+    if not len(occupied) or not len(counts):
+        return result
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    ranks = nearest_ranks(percentiles, totals)
+    for row, rank in enumerate(ranks):
+        position = np.minimum((cumulative < rank[:, None]).sum(axis=1), len(occupied) - 1)
+        result[row] = np.where(totals > 0, bins.value(occupied[position]), np.nan)
+    return result
+
+
+class QuantileSketch:
+    """
+    Histogram of one metric, only the bins that were hit are stored.
+
+    Args:
+        bins (LinearBins / LogBins): how values map to bins
+    """
+
+    def __init__(self, bins):
+        self.bins = bins
+        self.counts = {}  # bin index -> values in it
+        self.count = 0
+
+    def add(self, value):
+        self.add_index(self.bins.index_of(value))
+
+    def add_index(self, index, count=1):
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+
+    def update(self, values):
+        """Adds a whole array of values (NaN are skipped)."""
+        values = np.asarray(values, dtype=np.float64)
+        indices, counts = np.unique(self.bins.index(values[~np.isnan(values)]), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.add_index(index, count)
+
+    def merge(self, other):
+        if self.bins != other.bins:
+            raise ValueError("only sketches with the same bins can be merged")
+        for index, count in other.counts.items():
+            self.add_index(index, count)
+        return self
+
+    def __len__(self):
+        return self.count
+
+    def quantiles(self, percentiles=PERCENTILES):
+        """Nearest-rank percentiles, None each for an empty sketch."""
+        if not self.count:
+            return [None] * len(percentiles)
+        occupied = np.array(sorted(self.counts), dtype=np.intp)
+        counts = np.array([[self.counts[index] for index in occupied.tolist()]])
+        return [float(value) for value in bin_count_quantiles(self.bins, occupied, counts, percentiles)[:, 0]]
+
+    def quantile(self, percentile):
+        return self.quantiles([percentile])[0]
+
+
+class MetricSketches:
+    """
+    A QuantileSketch per metric of METRICS, fed frame by frame (frame dicts as in pipeline.py) or
+    with whole PacketTables.
+    """
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.sketches = {name: QuantileSketch(bins) for name, (_, bins, _) in metrics.items()}
+
+    def bins_of(self, frame):
+        """(metric, bin index) of every metric the frame has, computed once for all its windows."""
+        indices = []
+        for name, (column, bins, truncate) in self.metrics.items():
+            value = frame.get(column)
+            if value is not None:
+                indices.append((name, bins.index_of(math.trunc(value) if truncate else value)))
+        return indices
+
+    def add_bins(self, indices):
+        for name, index in indices:
+            self.sketches[name].add_index(index)
+
+    def add_frame(self, frame):
+        self.add_bins(self.bins_of(frame))
+
+    def update(self, packets):
+        for name, (column, _, truncate) in self.metrics.items():
+            values = packets[column]
+            self.sketches[name].update(np.trunc(values) if truncate else values)
+
+    def merge(self, other):
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        return self
+
+    def percentiles(self, percentiles=PERCENTILES):
+        """{'rssi_p5': ..., 'rssi_p50': ..., ...} in percentile_columns() order."""
+        return dict(zip(percentile_columns(percentiles, self.metrics),
+                        (value for sketch in self.sketches.values() for value in sketch.quantiles(percentiles))))
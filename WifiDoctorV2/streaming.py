@@ -0,0 +1,313 @@
+"""
+Live / tail-following analysis.
+
+Packets are read one record at a time from a growing pcap/pcapng file (--follow) or a pipe
+on stdin, decoded with the native radiotap decoder, and folded into running per-window sums.
+A window's result (RSSI, rate, loss, gap, throughput) is emitted as soon as a later packet
+shows that it closed. Only the open windows, the RSSID tracker and the RSSID buckets of the
+open windows are held, so memory does not grow with the length of the session.
+
+    tshark -i wlan0mon -w - | python streaming.py - --parser 11ac
+    python streaming.py pcap_files/live.pcap --parser 11n --follow --csv live_summary.csv
+    python streaming.py - --parser 11ac --output live_summary.parquet   # Parquet / Arrow, written in batches
+"""
+import argparse
+import csv
+import sys
+import time
+from frame_filter import FrameFilter, mac_to_bytes
+from pcap_reader import (
+    PcapFormatError, PCAP_MAGIC_US, PCAP_MAGIC_NS, PCAPNG_SHB,
+    PCAPNG_BYTE_ORDER_MAGIC, PCAPNG_IDB, PCAPNG_PB, PCAPNG_SPB, PCAPNG_EPB, _parse_idb,
+)
+from output_writers import open_writer
+from packet_table import MISSING_TIME
+from pipeline import Pipeline, RssidConsumer, LinkWindowConsumer, decode_frames
+from sketches import PERCENTILES, percentile_columns
+from wifi_analysis_engine import WINDOW_SIZE_S
+
+SUMMARY_FIELDS = ['timestamp', 'packets', 'avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap', 'theoretical_throughput']
+
+
+class PacketStream:
+    """
+    Incremental pcap / pcapng reader over a binary file object.
+
+    Args:
+        f: binary file object (a capture file that may still be written, or sys.stdin.buffer)
+        follow (bool): at end of file wait for more data instead of stopping (tail -f)
+        poll_interval (float): seconds between polls while following
+        idle_timeout (float): stop following after this many seconds without new data (None = never)
+    """
+
+    def __init__(self, f, follow=False, poll_interval=0.5, idle_timeout=None):
+        self.f = f
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self._pending = b''
+
+    def _read(self, size):
+        """Exactly size bytes, or None once the stream is over."""
+        idle_since = time.monotonic()
+        while len(self._pending) < size:
+            data = self.f.read(size - len(self._pending))
+            if data:
+                self._pending += data
+                idle_since = time.monotonic()
+                continue
+            if not self.follow:
+                return None
+            if self.idle_timeout is not None and time.monotonic() - idle_since >= self.idle_timeout:
+                return None
+            time.sleep(self.poll_interval)
+        data, self._pending = self._pending, b''
+        return data
+
+    def __iter__(self):
+        """
+        Yields:
+            tuple: (sniff_time_ns, record bytes, 0, captured_length, original_length, linktype),
+                the record layout pipeline.decode_frames() takes
+        """
+        magic = self._read(4)
+        if magic is None:
+            return
+        if int.from_bytes(magic, 'little') == PCAPNG_SHB:
+            yield from self._iter_pcapng(magic)
+        else:
+            yield from self._iter_pcap(magic)
+
+    def _iter_pcap(self, magic):
+        header = self._read(20)
+        if header is None:
+            raise PcapFormatError("truncated pcap header")
+        if int.from_bytes(magic, 'little') in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            byteorder = 'little'
+        elif int.from_bytes(magic, 'big') in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            byteorder = 'big'
+        else:
+            raise PcapFormatError("not a pcap file")
+        frac_ns = 1 if int.from_bytes(magic, byteorder) == PCAP_MAGIC_NS else 1000
+        linktype = int.from_bytes(header[16:20], byteorder) & 0xffff
+        while True:
+            record = self._read(16)
+            if record is None:
+                return
+            ts_sec = int.from_bytes(record[0:4], byteorder)
+            ts_frac = int.from_bytes(record[4:8], byteorder)
+            caplen = int.from_bytes(record[8:12], byteorder)
+            origlen = int.from_bytes(record[12:16], byteorder)
+            data = self._read(caplen)
+            if data is None:
+                return
+            yield ts_sec * 1_000_000_000 + ts_frac * frac_ns, data, 0, len(data), origlen, linktype
+
+    def _iter_pcapng(self, magic):
+        interfaces = []
+        endian = '<'
+        block_start = magic
+        while True:
+            head = self._read(8 - len(block_start))
+            if head is None:
+                return
+            head = block_start + head
+            block_start = b''
+            byteorder = 'little' if endian == '<' else 'big'
+            block_type = int.from_bytes(head[0:4], byteorder)
+            if block_type == PCAPNG_SHB:
+                # the byte order magic follows the length, peek at it to read the length right
+                order = self._read(4)
+                if order is None:
+                    return
+                endian = '<' if int.from_bytes(order, 'little') == PCAPNG_BYTE_ORDER_MAGIC else '>'
+                byteorder = 'little' if endian == '<' else 'big'
+                interfaces = []
+                block_length = int.from_bytes(head[4:8], byteorder)
+                rest = self._read(block_length - 12)
+                if rest is None:
+                    return
+                continue
+            block_length = int.from_bytes(head[4:8], byteorder)
+            if block_length < 12:
+                raise PcapFormatError("bad pcapng block length")
+            block = self._read(block_length - 8)
+            if block is None:
+                return
+            body_end = len(block) - 4
+
+            if block_type == PCAPNG_IDB:
+                interfaces.append(_parse_idb(block, 0, body_end, endian))
+                continue
+            if block_type in (PCAPNG_EPB, PCAPNG_PB):
+                if block_type == PCAPNG_EPB:
+                    interface = int.from_bytes(block[0:4], byteorder)
+                else:
+                    interface = int.from_bytes(block[0:2], byteorder)
+                ts_high = int.from_bytes(block[4:8], byteorder)
+                ts_low = int.from_bytes(block[8:12], byteorder)
+                caplen = int.from_bytes(block[12:16], byteorder)
+                origlen = int.from_bytes(block[16:20], byteorder)
+                data = block[20:20 + caplen]
+            elif block_type == PCAPNG_SPB:
+                interface, ts_high = 0, None
+                origlen = int.from_bytes(block[0:4], byteorder)
+                data = block[4:4 + min(origlen, body_end - 4)]
+            else:
+                continue
+            if interface >= len(interfaces):
+                continue
+            linktype, multiplier, divisor, tsoffset = interfaces[interface]
+            if ts_high is None:
+                sniff_time = MISSING_TIME
+            else:
+                sniff_time = ((ts_high << 32) | ts_low) * multiplier // divisor + tsoffset
+            yield sniff_time, data, 0, len(data), origlen, linktype
+
+
+def run_stream(source, parser, transmitter_mac, receiver_mac, subtype="0x0028", window_size=WINDOW_SIZE_S,
+               step=None, follow=False, poll_interval=0.5, idle_timeout=None, on_window=None, percentiles=None,
+               on_finish=None):
+    """
+    Streams source (path, or "-" for stdin) through the pipeline consumers in live mode: a window
+    result is emitted as soon as any later frame shows it closed (so a quiet link still gets its
+    results on time while beacons keep arriving), with the RSSID of the link channel over the
+    window as known at that moment (run_analysis sees the beacons of the whole capture).
+
+    Args:
+        parser (module): parser_11n or parser_11ac (only its PHY is used)
+        on_window (callable): called with each window result (dict) as soon as it closes
+        percentiles (list): add these percentiles of RSSI, rate and rate gap to every window result,
+            the returned consumer's sketches then cover the whole stream
+        on_finish (callable): called with the finished link consumer, also when the stream is
+            stopped with Ctrl-C
+
+    Returns:
+        LinkWindowConsumer: the finished link consumer
+
+    Raises:
+        KeyboardInterrupt: on Ctrl-C, after the open windows were emitted and on_finish was called
+    """
+    rssid = RssidConsumer()
+    link = LinkWindowConsumer(transmitter_mac, receiver_mac, rssid, subtype, window_size, step,
+                              max_duration=None, on_window=on_window or (lambda result: None), percentiles=percentiles)
+    # everything but the link frames and the beacons is dropped before decoding
+    frame_filter = FrameFilter(transmitter_mac, receiver_mac, subtype, keep_beacons=True)
+    f = sys.stdin.buffer if source == "-" else open(source, 'rb')
+    pipeline = Pipeline([rssid, link])
+    try:
+        stream = PacketStream(f, follow=follow, poll_interval=poll_interval, idle_timeout=idle_timeout)
+        pipeline.run(decode_frames(stream, parser.PHY, frame_filter))
+    except KeyboardInterrupt:
+        # flush what the windows hold so far, the caller still sees the interrupt
+        link.finish()
+        if on_finish is not None:
+            on_finish(link)
+        raise
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+    if on_finish is not None:
+        on_finish(link)
+    return link
+
+
+def _format(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def _format_percentiles(result, percentiles):
+    if not percentiles:
+        return ""
+    rssi = "/".join(_format(result[f"rssi_p{p:g}"], '.0f') for p in percentiles)
+    rate = "/".join(_format(result[f"rate_p{p:g}"], '.1f') for p in percentiles)
+    return f"  RSSI p{'/'.join(f'{p:g}' for p in percentiles)} {rssi} dBm  rate {rate} Mbps"
+
+
+def main(argv=None):
+    from wifi_doctor import PARSERS
+    parsers = {parser.PHY: (parser, ta, ra) for parser, _, ta, ra in PARSERS.values()}
+
+    arg_parser = argparse.ArgumentParser(description="Wi-Fi Doctor live analysis of a growing capture or a pipe.")
+    arg_parser.add_argument("source", help='pcap / pcapng file, or "-" to read from stdin')
+    arg_parser.add_argument("--parser", choices=sorted(parsers), default="11n")
+    arg_parser.add_argument("--ta", help="link transmitter MAC (defaults to the one wifi_doctor uses for the parser)")
+    arg_parser.add_argument("--ra", help="link receiver MAC")
+    arg_parser.add_argument("--subtype", default="0x0028")
+    arg_parser.add_argument("--window", type=float, default=WINDOW_SIZE_S, help="window size in seconds")
+    arg_parser.add_argument("--step", type=float, help="window step in seconds (defaults to the window size)")
+    arg_parser.add_argument("--follow", action="store_true", help="keep waiting for data at the end of the file")
+    arg_parser.add_argument("--poll", type=float, default=0.5, help="seconds between polls while following")
+    arg_parser.add_argument("--idle-timeout", type=float, help="stop after this many seconds without new data")
+    arg_parser.add_argument("--csv", help="append every window result to this CSV file as it closes")
+    arg_parser.add_argument("--output", help="write the window results to this .csv / .parquet / .arrow file "
+                                             "(overwritten), in batches of --batch-rows windows")
+    arg_parser.add_argument("--batch-rows", type=int, default=64, help="windows per write of --output")
+    arg_parser.add_argument("--percentiles", nargs="?", const=",".join(map(str, PERCENTILES)), metavar="LIST",
+                            help="add these comma separated percentiles of RSSI, rate and rate gap to every window "
+                                 f"(default {','.join(map(str, PERCENTILES))})")
+    args = arg_parser.parse_args(argv)
+
+    parser, default_ta, default_ra = parsers[args.parser]
+    transmitter_mac = args.ta or default_ta
+    receiver_mac = args.ra or default_ra
+    for mac in (transmitter_mac, receiver_mac):
+        try:
+            mac_to_bytes(mac)
+        except ValueError:
+            arg_parser.error(f"invalid MAC address {mac!r}")
+    percentiles = None
+    if args.percentiles:
+        try:
+            percentiles = [float(value) for value in args.percentiles.split(',')]
+        except ValueError:
+            arg_parser.error(f"invalid --percentiles {args.percentiles!r}")
+        if not all(0 <= value <= 100 for value in percentiles):
+            arg_parser.error("percentiles must be between 0 and 100")
+    fields = SUMMARY_FIELDS + (percentile_columns(percentiles) if percentiles else [])
+
+    csv_file = open(args.csv, 'a', newline='') if args.csv else None
+    writer = None
+    if csv_file is not None:
+        writer = csv.DictWriter(csv_file, fields)
+        if csv_file.tell() == 0:
+            writer.writeheader()
+
+    output = open_writer(args.output, fields, batch_rows=args.batch_rows) if args.output else None
+
+    def on_window(result):
+        print(f"[{result['timestamp'] - args.window:7.2f}–{result['timestamp']:7.2f}s] {result['packets']:5d} packets  "
+              f"RSSI {_format(result['avg_rssi'], '.1f')} dBm  rate {_format(result['avg_rate'], '.1f')} Mbps  "
+              f"loss {_format(result['frame_loss'], '.1%')}  gap {_format(result['rate_gap'], '.2f')}  "
+              f"throughput {_format(result['theoretical_throughput'], '.1f')} Mbps{_format_percentiles(result, percentiles)}",
+              flush=True)
+        if writer is not None:
+            writer.writerow(result)
+            csv_file.flush()
+        if output is not None:
+            output.write(result)
+
+    def on_finish(link):
+        if link.late_frames:
+            print(f"[INFO] {link.late_frames} frames arrived after their window closed and were dropped", file=sys.stderr)
+        if link.sketches is not None:
+            print(f"[INFO] Whole stream:{_format_percentiles(link.sketches.percentiles(percentiles), percentiles)}",
+                  file=sys.stderr)
+
+    print(f"[INFO] Streaming {args.source} with parser_{args.parser}, link {transmitter_mac} -> {receiver_mac}", file=sys.stderr)
+    try:
+        run_stream(args.source, parser, transmitter_mac, receiver_mac, args.subtype, args.window, args.step,
+                   args.follow, args.poll, args.idle_timeout, on_window, percentiles, on_finish)
+    except KeyboardInterrupt:
+        print("[INFO] Interrupted", file=sys.stderr)
+        return 130  # 128 + SIGINT, like a shell reports a Ctrl-C'd command
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+        if output is not None:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Synthetic 802.11n / 802.11ac radiotap captures for benchmarks and offline experiments.
+
+The capture has access points that beacon on their channel and stations that exchange QoS
+data with their access point. Every station has its own mean RSSI and picks an MCS that
+roughly follows it, so rate gap, loss and throughput come out non-trivial. The first access
+point and stations use the MACs wifi_doctor defaults to, so the default link of both parsers
+is found in every synthetic capture.
+
+    python synthetic_capture.py bench.pcapng --packets 200000 --phy 11ac --stations 8 --channels 36,40
+"""
+import argparse
+import random
+import struct
+import sys
+
+DEFAULT_AP_MACS = ["dc:e9:94:2a:68:31"]
+DEFAULT_STATION_MACS = ["f8:aa:3f:92:dd:16", "f8:aa:3f:92:dd:1b"]
+SSIDS = [b"TUC", b"eduroam", b"SpeedTest", b"guest"]
+BROADCAST = b"\xff" * 6
+
+# radiotap present bits: TSFT, Flags, Rate, Channel, dBm signal, dBm noise, MCS (HT), VHT
+_TSFT, _FLAGS, _RATE, _CHANNEL, _SIGNAL, _NOISE, _MCS, _VHT = 0, 1, 2, 3, 5, 6, 19, 21
+_CHANNEL_2GHZ = 0x0080 | 0x0040  # 2 GHz + OFDM
+_CHANNEL_5GHZ = 0x0100 | 0x0040
+_NOISE_DBM = -95
+
+
+def channel_frequency(channel):
+    return 2407 + 5 * channel if channel <= 14 else 5000 + 5 * channel
+
+
+def _mac(index, prefix):
+    return bytes(prefix) + index.to_bytes(3, 'big')
+
+
+def _mac_bytes(mac):
+    return bytes(int(part, 16) for part in mac.split(':'))
+
+
+def radiotap_header(rng, phy, channel, signal, mcs=None, nss=1, legacy_rate=None):
+    """Radiotap header with TSFT, flags, channel, signal / noise and the HT or VHT field."""
+    present = (1 << _TSFT) | (1 << _FLAGS) | (1 << _CHANNEL) | (1 << _SIGNAL) | (1 << _NOISE)
+    body = struct.pack('<QB', rng.getrandbits(40), 0)
+    if legacy_rate is not None:
+        present |= 1 << _RATE
+        body += bytes([int(legacy_rate * 2)])
+    if len(body) % 2:
+        body += b'\0'
+    frequency = channel_frequency(channel)
+    body += struct.pack('<HHbb', frequency, _CHANNEL_5GHZ if frequency > 5000 else _CHANNEL_2GHZ, signal, _NOISE_DBM)
+    if legacy_rate is None and phy == '11n':
+        present |= 1 << _MCS
+        # known: bandwidth, MCS, GI / flags: 20 MHz, long GI
+        body += bytes([0x07, 0x00, (nss - 1) * 8 + mcs])
+    elif legacy_rate is None:
+        present |= 1 << _VHT
+        if len(body) % 2:
+            body += b'\0'
+        # known: GI + bandwidth / 80 MHz / user 0 MCS + NSS
+        body += struct.pack('<HBBBBBBBBH', 0x0044, 0, 4, (mcs << 4) | nss, 0, 0, 0, 0, 0, 0)
+    return struct.pack('<BBHI', 0, 0, 8 + len(body), present) + body
+
+
+def beacon_frame(rng, bssid, ssid):
+    header = b'\x80\x00\x00\x00' + BROADCAST + bssid + bssid + b'\x00\x00'
+    body = struct.pack('<QHH', rng.getrandbits(40), 100, 0x0411) + bytes([0, len(ssid)]) + ssid + b'\x01\x01\x8c'
+    return header + body
+
+
+def qos_data_frame(transmitter, receiver, to_ap, retry, payload):
+    # to DS for station -> AP, from DS for AP -> station, addr3 is the other end's BSSID / SA
+    flags = (0x01 if to_ap else 0x02) | (0x08 if retry else 0)
+    bssid = receiver if to_ap else transmitter
+    return bytes([0x88, flags]) + b'\x00\x00' + receiver + transmitter + bssid + b'\x00\x00' + b'\x00\x00' + bytes(payload)
+
+
+class _PcapWriter:
+    def __init__(self, f):
+        self.f = f
+        f.write(struct.pack('<IHHiIII', 0xa1b23c4d, 2, 4, 0, 0, 65535, 127))
+
+    def write(self, time_ns, data):
+        self.f.write(struct.pack('<IIII', time_ns // 1_000_000_000, time_ns % 1_000_000_000, len(data), len(data)))
+        self.f.write(data)
+
+
+class _PcapngWriter:
+    def __init__(self, f):
+        self.f = f
+        self._block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1))
+        # if_tsresol = 9 (nanoseconds)
+        self._block(0x00000001, struct.pack('<HHI', 127, 0, 65535) + struct.pack('<HHB3x', 9, 1, 9) + b'\0\0\0\0')
+
+    def _block(self, block_type, body):
+        length = 12 + len(body) + (-len(body) % 4)
+        self.f.write(struct.pack('<II', block_type, length) + body + b'\0' * (-len(body) % 4) + struct.pack('<I', length))
+
+    def write(self, time_ns, data):
+        self._block(0x00000006, struct.pack('<IIIII', 0, time_ns >> 32, time_ns & 0xffffffff, len(data), len(data)) + data)
+
+
+def write_capture(path, packets=100_000, phy="11n", stations=2, access_points=1, channels=(6,), beacons_per_s=10.0,
+                  data_rate_pps=500.0, retry_rate=0.1, legacy_fraction=0.05, seed=0, fmt=None, start_time=1_700_000_000):
+    """
+    Writes a synthetic capture.
+
+    Args:
+        path (str): output file, .pcapng selects the pcapng format unless fmt is given
+        packets (int): total number of records (beacons + data)
+        phy (str): "11n" (HT MCS field) or "11ac" (VHT field) for the data frames
+        stations (int): stations, spread over the access points round-robin
+        access_points (int): access points, spread over channels round-robin
+        channels (tuple): channel numbers (e.g. (6,), (36, 40), (1, 6, 36) for a band mix)
+        beacons_per_s (float): beacons per second of every access point
+        data_rate_pps (float): data frames per second over all stations (Poisson arrivals)
+        retry_rate (float): fraction of data frames with the retry flag
+        legacy_fraction (float): fraction of data frames sent at a legacy (non HT/VHT) rate
+        seed (int): random seed, the same arguments give the same bytes
+        fmt (str): "pcap" or "pcapng"
+
+    Returns:
+        dict: the parameters plus the capture duration in seconds
+    """
+    rng = random.Random(seed)
+    fmt = fmt or ("pcapng" if str(path).endswith(".pcapng") else "pcap")
+    ap_macs = [_mac_bytes(mac) for mac in DEFAULT_AP_MACS[:access_points]]
+    ap_macs += [_mac(i, b'\x00\x11\x22') for i in range(len(ap_macs), access_points)]
+    station_macs = [_mac_bytes(mac) for mac in DEFAULT_STATION_MACS[:stations]]
+    station_macs += [_mac(i, b'\x02\x5a\x00') for i in range(len(station_macs), stations)]
+    ap_channels = [channels[i % len(channels)] for i in range(access_points)]
+    ap_ssids = [SSIDS[i % len(SSIDS)] for i in range(access_points)]
+    station_ap = [i % access_points for i in range(stations)]
+    station_rssi = [rng.uniform(-78, -42) for _ in range(stations)]
+    max_mcs = 7 if phy == '11n' else 9
+
+    time_ns = start_time * 1_000_000_000
+    beacon_period_ns = int(1e9 / beacons_per_s) if beacons_per_s > 0 else None
+    next_beacon = [time_ns + rng.randrange(beacon_period_ns) if beacon_period_ns else None for _ in range(access_points)]
+    next_data = time_ns
+    with open(path, 'wb') as f:
+        writer = _PcapngWriter(f) if fmt == "pcapng" else _PcapWriter(f)
+        for _ in range(packets):
+            ap = min(range(access_points), key=lambda i: next_beacon[i]) if beacon_period_ns else None
+            if ap is not None and next_beacon[ap] <= next_data:
+                time_ns = next_beacon[ap]
+                next_beacon[ap] += beacon_period_ns
+                signal = int(rng.gauss(-55, 4))
+                record = radiotap_header(rng, phy, ap_channels[ap], signal, legacy_rate=6.0)
+                record += beacon_frame(rng, ap_macs[ap], ap_ssids[ap])
+            else:
+                time_ns = next_data
+                next_data += max(int(rng.expovariate(data_rate_pps) * 1e9), 1)
+                station = rng.randrange(stations)
+                ap = station_ap[station]
+                signal = max(min(int(rng.gauss(station_rssi[station], 3)), -20), -95)
+                # stronger signal -> higher MCS, with some rate control noise
+                mcs = max(0, min(max_mcs, int((signal + 85) / 45 * max_mcs + rng.gauss(0, 1))))
+                nss = 1 + (signal > -60) + (phy == '11ac' and signal > -50)
+                legacy = rng.random() < legacy_fraction
+                record = radiotap_header(rng, phy, ap_channels[ap], signal, mcs, nss, 24.0 if legacy else None)
+                to_ap = rng.random() < 0.7
+                transmitter, receiver = (station_macs[station], ap_macs[ap]) if to_ap else (ap_macs[ap], station_macs[station])
+                record += qos_data_frame(transmitter, receiver, to_ap, rng.random() < retry_rate,
+                                         rng.randrange(40, 1500))
+            writer.write(time_ns, record)
+    return {
+        'packets': packets, 'phy': phy, 'stations': stations, 'access_points': access_points,
+        'channels': list(channels), 'beacons_per_s': beacons_per_s, 'data_rate_pps': data_rate_pps,
+        'retry_rate': retry_rate, 'legacy_fraction': legacy_fraction, 'seed': seed, 'format': fmt,
+        'duration': (time_ns - start_time * 1_000_000_000) / 1e9,
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Write a synthetic radiotap capture.")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--packets", type=int, default=100_000)
+    arg_parser.add_argument("--phy", choices=["11n", "11ac"], default="11n")
+    arg_parser.add_argument("--stations", type=int, default=2)
+    arg_parser.add_argument("--access-points", type=int, default=1)
+    arg_parser.add_argument("--channels", default="6", help="comma separated channel numbers, e.g. 6,36")
+    arg_parser.add_argument("--beacons-per-s", type=float, default=10.0, help="beacons per second of every access point")
+    arg_parser.add_argument("--data-rate", type=float, default=500.0, help="data frames per second")
+    arg_parser.add_argument("--retry-rate", type=float, default=0.1)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--format", choices=["pcap", "pcapng"])
+    args = arg_parser.parse_args(argv)
+    info = write_capture(args.path, args.packets, args.phy, args.stations, args.access_points,
+                         tuple(int(channel) for channel in args.channels.split(',')), args.beacons_per_s,
+                         args.data_rate, args.retry_rate, seed=args.seed, fmt=args.format)
+    print(f"[INFO] {args.path}: {info['packets']} packets over {info['duration']:.1f}s ({info['format']})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
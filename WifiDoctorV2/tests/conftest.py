@@ -0,0 +1,17 @@
+import pathlib
+import sys
+
+import pytest
+
+# the modules of WifiDoctorV2 import each other by their bare names
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from synthetic_capture import write_capture  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def capture_11n(tmp_path_factory):
+    """A small synthetic 802.11n capture (two stations on the default access point, beacons on channel 6)."""
+    path = tmp_path_factory.mktemp("captures") / "synthetic_11n.pcap"
+    write_capture(path, packets=20_000, phy="11n", seed=1)
+    return path
@@ -0,0 +1,131 @@
+import json
+import os
+import pathlib
+import stat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import capture_cache
+from capture_cache import CaptureCache, load_or_extract
+from packet_table import PacketTable
+from synthetic_capture import write_capture
+
+
+def _table(seed):
+    values = np.arange(1000, dtype=np.int64) + seed
+    return PacketTable({'sniff_time': values}, {})
+
+
+def _put(cache_dir, pcap_file, variant, seed):
+    cache = CaptureCache(cache_dir)
+    key = cache.key(pcap_file, "parser_11n", 1, variant)
+    cache.put(key, _table(seed), pcap_file)
+    return key
+
+
+def test_concurrent_puts_keep_every_entry(tmp_path):
+    captures = []
+    for i in range(6):
+        path = tmp_path / f"n{i}.pcap"
+        write_capture(path, packets=200, seed=i)
+        captures.append(str(path))
+    cache_dir = tmp_path / "cache"
+    jobs = [(capture, f"variant{j}", i * 10 + j) for i, capture in enumerate(captures) for j in range(4)]
+    with ProcessPoolExecutor(max_workers=6) as pool:
+        keys = list(pool.map(_put, [cache_dir] * len(jobs), *zip(*jobs)))
+
+    assert len(set(keys)) == len(jobs)
+    assert not list(cache_dir.glob("*.tmp"))
+    index = json.loads((cache_dir / "index.json").read_text())
+    assert len(index) == len(captures)
+    assert sorted(key for entry in index.values() for key in entry['keys']) == sorted(keys)
+    cache = CaptureCache(cache_dir)
+    for key, (_, _, seed) in zip(keys, jobs):
+        assert np.array_equal(cache.get(key)['sniff_time'], _table(seed)['sniff_time'])
+
+
+def test_missing_or_damaged_index_is_tolerated(tmp_path):
+    capture = tmp_path / "n.pcap"
+    write_capture(capture, packets=200)
+    cache = CaptureCache(tmp_path / "cache")
+    key = cache.key(capture, "parser_11n", 1)
+    cache.put(key, _table(0), capture)
+
+    cache.index_path.write_text('{"truncated": ')
+    assert cache.key(capture, "parser_11n", 1) == key
+    assert cache.get(key) is not None
+
+    cache.index_path.unlink()
+    assert cache.key(capture, "parser_11n", 1) == key
+    assert cache.get(key) is not None
+    cache.put(key, _table(0), capture)
+    cache.invalidate(capture)
+    assert cache.get(key) is None
+
+
+class _Parser:
+    """Stands in for parser_11n, remembers the backend of every extraction."""
+    __name__ = "parser_11n"
+    PARSER_VERSION = 1
+
+    def __init__(self):
+        self.backends = []
+
+    def extract_all_data(self, pcap_file, backend="auto", frame_filter=None, workers=None, fields=None):
+        self.backends.append(backend)
+        return _table(len(self.backends))
+
+    def add_rate_gap(self, table):
+        return table
+
+
+def test_backend_is_part_of_the_key_but_workers_is_not(tmp_path):
+    capture = tmp_path / "n.pcap"
+    write_capture(capture, packets=200)
+    cache = CaptureCache(tmp_path / "cache")
+    parser = _Parser()
+
+    native = load_or_extract(capture, parser, cache=cache, backend="native", workers=1)
+    assert np.array_equal(load_or_extract(capture, parser, cache=cache, backend="native", workers=4)['sniff_time'],
+                          native['sniff_time'])
+    pyshark = load_or_extract(capture, parser, cache=cache, backend="pyshark")
+    assert not np.array_equal(pyshark['sniff_time'], native['sniff_time'])
+    load_or_extract(capture, parser, cache=cache, fields=['sniff_time'], backend="pyshark")
+    load_or_extract(capture, parser, cache=cache)
+    assert parser.backends == ["native", "pyshark", "auto"]
+
+
+def test_no_cache_extracts_without_writing(tmp_path, monkeypatch):
+    capture = tmp_path / "n.pcap"
+    write_capture(capture, packets=200)
+    monkeypatch.chdir(tmp_path)
+    parser = _Parser()
+    load_or_extract(capture, parser)
+    load_or_extract(capture, parser)
+    assert parser.backends == ["auto", "auto"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["n.pcap"]
+
+
+def test_default_directory_is_outside_the_source_tree(tmp_path):
+    import subprocess
+    import sys
+    source_dir = pathlib.Path(capture_cache.__file__).resolve().parent
+    script = "import capture_cache; print(capture_cache.DEFAULT_CACHE_DIR)"
+    env = {'PATH': os.environ.get('PATH', ''), 'HOME': str(tmp_path / "home"), 'XDG_CACHE_HOME': str(tmp_path / "xdg")}
+    output = subprocess.run([sys.executable, "-c", script], cwd=source_dir, env=env, capture_output=True, text=True)
+    assert output.stdout.strip() == str(tmp_path / "xdg" / "wifidoctor")
+    del env['XDG_CACHE_HOME']
+    output = subprocess.run([sys.executable, "-c", script], cwd=source_dir, env=env, capture_output=True, text=True)
+    assert output.stdout.strip() == str(tmp_path / "home" / ".cache" / "wifidoctor")
+
+
+def test_entries_get_the_umask_mode(tmp_path):
+    capture = tmp_path / "n.pcap"
+    write_capture(capture, packets=200)
+    cache = CaptureCache(tmp_path / "cache")
+    key = cache.key(capture, "parser_11n", 1)
+    cache.put(key, _table(0), capture)
+    expected = 0o666 & ~capture_cache._UMASK
+    assert stat.S_IMODE(cache._entry_path(key).stat().st_mode) == expected
+    assert stat.S_IMODE(cache.index_path.stat().st_mode) == expected
@@ -0,0 +1,34 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from capture_catalog import CATALOG_FILE, CaptureCatalog
+
+
+@pytest.fixture
+def pcap_dir(tmp_path, capture_11n):
+    for name in ("a.pcap", "b.pcap"):
+        (tmp_path / name).write_bytes(capture_11n.read_bytes())
+    return tmp_path
+
+
+def _refresh(pcap_dir):
+    return sorted(CaptureCatalog(pcap_dir).refresh(verbose=False))
+
+
+def test_concurrent_refreshes_leave_a_valid_catalog(pcap_dir):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        listings = list(pool.map(_refresh, [pcap_dir] * 8))
+    assert listings == [["a.pcap", "b.pcap"]] * 8
+    with open(pcap_dir / CATALOG_FILE) as f:
+        assert sorted(json.load(f)['captures']) == ["a.pcap", "b.pcap"]
+    # no temporary files left behind
+    assert sorted(path.name for path in pcap_dir.iterdir()) == sorted([CATALOG_FILE, "a.pcap", "b.pcap"])
+
+
+def test_damaged_catalog_is_rescanned(pcap_dir):
+    expected = CaptureCatalog(pcap_dir).refresh(verbose=False)
+    (pcap_dir / CATALOG_FILE).write_text('{"version": 1, "captures": {"a.pca')
+    assert CaptureCatalog(pcap_dir).refresh(verbose=False) == expected
+    assert CaptureCatalog(pcap_dir)._load() == expected
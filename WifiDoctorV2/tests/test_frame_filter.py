@@ -0,0 +1,127 @@
+import random
+import shutil
+import struct
+import subprocess
+
+import numpy as np
+import pytest
+
+from frame_filter import FrameFilter
+from packet_table import MISSING_TIME, PacketTable
+from pcap_reader import _LE_U16, _open_mmap, first_record_time, iter_records, read_radiotap
+from pipeline import decode_frames, iter_file_records
+from synthetic_capture import (
+    _PcapngWriter, _PcapWriter, beacon_frame, qos_data_frame, radiotap_header,
+)
+
+TA, RA = "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"
+OTHER = "f8:aa:3f:92:dd:1b"
+START = 1_700_000_000_000_000_000
+
+FILTERS = [
+    FrameFilter(TA, RA, "0x0028"),
+    FrameFilter(TA, RA, "0x0028", keep_beacons=False),
+    FrameFilter(receiver_mac=RA, keep_beacons=False),
+    FrameFilter(transmitter_mac=TA, keep_beacons=False),
+    FrameFilter(subtype="0x001d", keep_beacons=False),
+    FrameFilter(subtype="0x0028", keep_beacons=False),
+    FrameFilter(TA, RA, "0x0028", start_s=2.0, end_s=7.5),
+    FrameFilter(subtype="0x0008", start_s=0.0, end_s=3.0),
+    FrameFilter(end_s=4.0, keep_beacons=False),
+    FrameFilter(start_s=5.0),
+]
+
+
+def _frames():
+    """(time offset in ns, radiotap + 802.11 bytes) of every kind of frame the filter tells apart."""
+    rng = random.Random(0)
+    ta, ra, other = (bytes.fromhex(mac.replace(':', '')) for mac in (TA, RA, OTHER))
+    frames = []
+    for i in range(40):
+        t = i * 250_000_000
+        header = radiotap_header(rng, '11n', 6, -60 - i % 7, mcs=i % 8)
+        body = [
+            qos_data_frame(ta, ra, True, i % 3 == 0, 40),                  # the link
+            qos_data_frame(other, ra, True, False, 40),                    # another station to the AP
+            qos_data_frame(ra, ta, False, False, 40),                      # the reverse direction
+            beacon_frame(rng, ra, b"TUC"),
+            b'\xd4\x00\x00\x00' + ta,                                      # ACK to the station, no TA
+            b'\xc4\x00\x00\x00' + ra,                                      # CTS, no TA
+            b'\x08\x01\x00\x00' + ra + ta + ra + b'\x00\x00',              # plain data of the link
+            b'\x88\x01',                                                   # too short for any address
+        ][i % 8]
+        frames.append((t, header + body))
+    return frames
+
+
+def _write(path, frames, untimed=()):
+    with open(path, 'wb') as f:
+        writer = (_PcapngWriter if path.suffix == ".pcapng" else _PcapWriter)(f)
+        for i, (t, data) in enumerate(frames):
+            if i in untimed:
+                writer._block(0x00000003, struct.pack('<I', len(data)) + data)  # simple packet block
+            else:
+                writer.write(START + t, data)
+    return path
+
+
+@pytest.fixture(scope="module", params=["pcap", "pcapng-untimed"])
+def capture(request, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("filters")
+    if request.param == "pcap":
+        return _write(directory / "frames.pcap", _frames())
+    # the first records and one in the middle have no timestamp, the origin is the first one that has
+    return _write(directory / "frames.pcapng", [(t + 1_000_000_000, data) for t, data in _frames()], untimed={0, 1, 13})
+
+
+def header_matches(path, frame_filter):
+    with open(path, 'rb') as f, _open_mmap(f) as buf:
+        first_time = first_record_time(buf)
+        keep = []
+        for sniff_time, data, caplen, _, _, _ in iter_records(buf):
+            radiotap_length = _LE_U16.unpack_from(buf, data + 2)[0]
+            keep.append(frame_filter.matches_time(sniff_time, first_time)
+                        and frame_filter.matches_header(buf, data + radiotap_length, data + caplen))
+    return np.array(keep)
+
+
+@pytest.mark.parametrize("frame_filter", FILTERS, ids=repr)
+def test_header_check_and_mask_agree(capture, frame_filter):
+    full = read_radiotap(str(capture), "11n")
+    mask = frame_filter.mask(full)
+    assert np.array_equal(header_matches(capture, frame_filter), mask)
+    assert 0 < mask.sum() < len(full)
+    # and the filtered extraction (table and fused pipeline) is the masked full one
+    filtered = read_radiotap(str(capture), "11n", frame_filter)
+    assert np.array_equal(filtered['sniff_time'], full['sniff_time'][mask])
+    assert filtered.decode('frame_type_subtype').tolist() == full.decode('frame_type_subtype')[mask].tolist()
+    frames = list(decode_frames(iter_file_records(str(capture)), "11n", frame_filter))
+    assert [frame['sniff_time'] for frame in frames] == full['sniff_time'][mask].tolist()
+
+
+def test_time_origin_is_the_first_timestamp():
+    times = np.array([MISSING_TIME, START, START + 1_000_000_000, MISSING_TIME, START + 3_000_000_000], dtype=np.int64)
+    table = PacketTable({'sniff_time': times})
+    assert FrameFilter(start_s=1.0, keep_beacons=False).mask(table).tolist() == [False, False, True, False, True]
+    assert FrameFilter(end_s=2.0, keep_beacons=False).mask(table).tolist() == [False, True, True, False, False]
+    assert FrameFilter(end_s=2.0, keep_beacons=False).mask(PacketTable({'sniff_time': times[[0, 3]]})).tolist() == [False, False]
+    assert FrameFilter(keep_beacons=False).mask(table).all()
+
+    frame_filter = FrameFilter(start_s=1.0)
+    assert not frame_filter.matches_time(MISSING_TIME, START)
+    assert frame_filter.matches_time(START + 1_000_000_000, START)
+    assert FrameFilter().matches_time(MISSING_TIME, None)
+
+
+@pytest.mark.skipif(shutil.which("tshark") is None, reason="tshark is not installed")
+@pytest.mark.parametrize("frame_filter", FILTERS, ids=repr)
+def test_display_filter_agrees_with_the_mask(tmp_path, frame_filter):
+    # tshark's frame.time_relative counts from the first frame, so every frame here has a timestamp
+    path = _write(tmp_path / "frames.pcap", _frames())
+    full = read_radiotap(str(path), "11n")
+    command = ["tshark", "-r", str(path), "-T", "fields", "-e", "frame.number"]
+    if frame_filter.display_filter():
+        command += ["-Y", frame_filter.display_filter()]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    numbers = [int(line) - 1 for line in output.split()]
+    assert numbers == np.flatnonzero(frame_filter.mask(full)).tolist()
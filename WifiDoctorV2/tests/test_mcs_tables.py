@@ -0,0 +1,132 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import mcs_tables
+import parser_11ac
+import parser_11n
+from packet_table import PacketTable
+
+RSSI = range(-100, 1)
+STREAMS = [None, 0, 1, 2, 3, 4]
+MCS = [None] + list(range(-1, 32))
+
+
+# the if/elif chains the parsers had before mcs_tables.py, kept verbatim as the reference
+def chain_steps(signal_strength, mcs):
+    if signal_strength >= -64:
+        return mcs[7]
+    elif -65 <= signal_strength < -64:
+        return mcs[6]
+    elif -66 <= signal_strength < -65:
+        return mcs[5]
+    elif -70 <= signal_strength < -66:
+        return mcs[4]
+    elif -74 <= signal_strength < -70:
+        return mcs[3]
+    elif -77 <= signal_strength < -74:
+        return mcs[2]
+    elif -79 <= signal_strength < -77:
+        return mcs[1]
+    else:
+        return mcs[0]
+
+
+def chain_11n(signal_strength, spatial_streams):
+    if spatial_streams == 1:
+        return chain_steps(signal_strength, range(0, 8))
+    if spatial_streams == 2:
+        return chain_steps(signal_strength, range(8, 16))
+    if spatial_streams == 3:
+        return chain_steps(signal_strength, range(16, 24))
+
+
+def chain_11ac(signal_strength, spatial_streams):
+    if spatial_streams == 1:
+        return chain_steps(signal_strength, range(0, 8))
+    if spatial_streams == 2:
+        if signal_strength >= -57:
+            return 9
+        elif -59 <= signal_strength < -57:
+            return 8
+        elif -64 <= signal_strength < -59:
+            return 7
+        return chain_steps(signal_strength, range(0, 8))
+    if spatial_streams == 3:
+        return chain_steps(signal_strength, range(16, 24))
+
+
+CHAINS = {"11n": chain_11n, "11ac": chain_11ac}
+PARSERS = {"11n": parser_11n, "11ac": parser_11ac}
+
+
+def chain_spatial_streams(packet):
+    # find_spatial_streams: MCS 0 (and anything past 23) leaves the streams unknown
+    if packet.get('spatial_streams') is None and packet.get('mcs_index') is not None:
+        mcs_index = int(packet['mcs_index'])
+        if 1 <= mcs_index <= 7:
+            packet['spatial_streams'] = 1
+        elif 8 <= mcs_index <= 15:
+            packet['spatial_streams'] = 2
+        elif 16 <= mcs_index <= 23:
+            packet['spatial_streams'] = 3
+    return packet
+
+
+def chain_rate_gap(phy, packet):
+    chain_spatial_streams(packet)
+    if packet.get('signal_strength') is None or packet.get('spatial_streams') is None:
+        return None
+    expected = CHAINS[phy](int(packet['signal_strength']), int(packet['spatial_streams']))
+    if expected is None:
+        return None  # the old code hit a TypeError here and stored None
+    return expected - (int(packet['mcs_index']) if packet.get('mcs_index') is not None else 0)
+
+
+@pytest.mark.parametrize("phy", ["11n", "11ac"])
+def test_expected_mcs_matches_the_chains(phy):
+    rssi, streams = np.array(list(itertools.product(RSSI, STREAMS)), dtype=object).T
+    expected = [CHAINS[phy](r, s) for r, s in zip(rssi, streams)]
+    assert [PARSERS[phy].find_expected_mcs_index(r, s) for r, s in zip(rssi, streams)] == expected
+    assert [mcs_tables.expected_mcs_for(phy, r, s) for r, s in zip(rssi, streams)] == expected
+
+    vectorized = mcs_tables.expected_mcs_index(phy, rssi.astype(float), np.array([-1 if s is None else s for s in streams]))
+    assert [None if np.isnan(value) else int(value) for value in vectorized] == expected
+
+
+@pytest.mark.parametrize("rssi, expected", [(-60, 7), (-59, 8), (-58, 8), (-57, 9), (-56, 9), (-64, 7), (-65, 6)])
+def test_11ac_two_stream_boundaries(rssi, expected):
+    assert parser_11ac.find_expected_mcs_index(rssi, 2) == expected
+    # 11n has no MCS 8/9 steps, two streams top out at MCS 15 from -64 dBm on
+    assert parser_11n.find_expected_mcs_index(rssi, 2) == min(expected, 7) + 8
+
+
+def test_spatial_streams_from_mcs():
+    mcs = np.array([-1 if m is None else m for m in MCS])
+    expected = [chain_spatial_streams({'mcs_index': m}).get('spatial_streams') for m in MCS]
+    assert expected[MCS.index(0)] is None  # MCS 0 does not say how many streams there are
+    assert [None if s == -1 else int(s) for s in mcs_tables.infer_spatial_streams(mcs)] == expected
+
+    table = PacketTable.from_records([{'mcs_index': m, 'spatial_streams': None} for m in MCS] +
+                                     [{'mcs_index': m, 'spatial_streams': 2} for m in MCS])
+    streams = parser_11n.find_spatial_streams(table)['spatial_streams'].tolist()
+    assert streams == [-1 if s is None else s for s in expected] + [2] * len(MCS)
+
+
+def sweep_packets():
+    rssi = [None, -100.0, -79.5, -64.9] + [float(r) for r in RSSI]
+    return [{'signal_strength': r, 'spatial_streams': s, 'mcs_index': m}
+            for r, s, m in itertools.product(rssi, STREAMS, [None, 0, 1, 7, 8, 9, 15, 23, 24])]
+
+
+@pytest.mark.parametrize("phy", ["11n", "11ac"])
+def test_rate_gap_matches_the_chains(phy):
+    packets = sweep_packets()
+    expected = [chain_rate_gap(phy, dict(packet)) for packet in packets]
+
+    table = PARSERS[phy].add_rate_gap(PacketTable.from_records(packets))
+    assert [None if np.isnan(gap) else gap for gap in table['rate_gap'].tolist()] == expected
+
+    streamed = [mcs_tables.rate_gap_for(phy, p['signal_strength'], p['spatial_streams'], p['mcs_index']) for p in packets]
+    assert streamed == expected
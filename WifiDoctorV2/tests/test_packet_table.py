@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from capture_cache import CaptureCache
+from packet_table import ANALYSIS_FIELDS, MISSING_INT, MISSING_TIME, SCHEMA, PacketTable, PacketTableBuilder
+
+TA, RA = "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"
+
+RECORDS = [
+    # the parsers append strings (pyshark) or numbers (native reader) for the same columns
+    {'transmitter_mac': TA, 'receiver_mac': RA, 'frame_type_subtype': "0x0028", 'mcs_index': "7",
+     'signal_strength': "-61", 'retry_flag': "True", 'data_rate': 65.0, 'ssid': None,
+     'sniff_time': datetime(2023, 11, 14, 22, 13, 20, 250_000, tzinfo=timezone.utc)},
+    {'transmitter_mac': RA, 'receiver_mac': "ff:ff:ff:ff:ff:ff", 'frame_type_subtype': "0x0008", 'mcs_index': None,
+     'signal_strength': -70.0, 'retry_flag': 0, 'ssid': "TUC\x00", 'sniff_time': 1_700_000_000_500_000_000},
+    {'transmitter_mac': TA, 'receiver_mac': RA, 'frame_type_subtype': "0x0028", 'mcs_index': 15,
+     'signal_strength': "", 'retry_flag': "1", 'data_rate': "130.0", 'ssid': None, 'sniff_time': None},
+    {'transmitter_mac': RA, 'receiver_mac': "ff:ff:ff:ff:ff:ff", 'frame_type_subtype': "0x0008", 'mcs_index': "0x3",
+     'signal_strength': -71.5, 'retry_flag': None, 'ssid': "TUC", 'sniff_time': 1_700_000_001_000_000_000},
+    {'transmitter_mac': None, 'receiver_mac': TA, 'frame_type_subtype': "0x001d", 'ssid': "",
+     'sniff_time': 1_700_000_001_250_000_000},
+]
+# SSIDs a NumPy string array would mangle: trailing NULs, only NULs, non-ASCII
+SSIDS = ["TUC\x00", "TUC", "", "\x00\x00", "καφέ wifi", "x\x00y\x00"]
+
+
+@pytest.fixture
+def table():
+    return PacketTable.from_records(RECORDS)
+
+
+def assert_same_table(table, expected):
+    assert table.fields == expected.fields
+    for name in expected.fields:
+        assert table[name].dtype == expected[name].dtype, name
+        assert np.array_equal(table[name], expected[name], equal_nan=SCHEMA[name].startswith('float')), name
+        if SCHEMA[name] == 'category':
+            assert table.decode(name).tolist() == expected.decode(name).tolist(), name
+
+
+def test_build_converts_and_fills_the_missing_values(table):
+    assert len(table) == len(RECORDS)
+    assert table.fields == list(SCHEMA)
+    assert table['mcs_index'].tolist() == [7, MISSING_INT, 15, 3, MISSING_INT]
+    assert table['retry_flag'].tolist() == [1, 0, 1, MISSING_INT, MISSING_INT]
+    assert np.array_equal(table['signal_strength'], np.array([-61, -70, np.nan, -71.5, np.nan], dtype=np.float32),
+                          equal_nan=True)
+    assert table['sniff_time'].tolist() == [1_700_000_000_250_000_000, 1_700_000_000_500_000_000, MISSING_TIME,
+                                            1_700_000_001_000_000_000, 1_700_000_001_250_000_000]
+    assert table.decode('transmitter_mac').tolist() == [TA, RA, TA, RA, None]
+    assert table.decode('ssid').tolist() == [None, "TUC\x00", None, "TUC", ""]
+    assert table.to_records()[2]['sniff_time'] is None and table.row(0)['data_rate'] == 65.0
+
+    projected = PacketTable.from_records(RECORDS, fields=ANALYSIS_FIELDS)
+    assert projected.fields == ANALYSIS_FIELDS
+    assert PacketTableBuilder().build().fields == list(SCHEMA) and len(PacketTableBuilder().build()) == 0
+
+
+def test_categorical_codes(table):
+    assert table.code('ssid', "TUC\x00") != table.code('ssid', "TUC")
+    assert table.code('ssid', "eduroam") == MISSING_INT
+    assert table.equals('frame_type_subtype', "0x0028").tolist() == [True, False, True, False, False]
+    assert table.equals('frame_type_subtype', "0x0005").tolist() == [False] * 5
+    assert table.equals('ssid', "").tolist() == [False, False, False, False, True]
+
+
+def test_take_and_select(table):
+    by_mask = table.take(table.equals('frame_type_subtype', "0x0008"))
+    by_index = table.take(np.array([1, 3]))
+    assert_same_table(by_mask, by_index)
+    assert by_index.decode('ssid').tolist() == ["TUC\x00", "TUC"]
+    assert by_index.categories is table.categories
+    assert len(table.take(slice(0))) == 0
+
+    selected = table.select(['sniff_time', 'ssid', 'no_such_column'])
+    assert selected.fields == ['sniff_time', 'ssid'] and list(selected.categories) == ['ssid']
+    assert selected['sniff_time'] is table['sniff_time']
+    assert table.sort_by('sniff_time')['sniff_time'].tolist()[0] == MISSING_TIME
+
+
+def test_concat_remaps_the_categories(table):
+    other = PacketTable.from_records([{'ssid': ssid} for ssid in reversed(SSIDS)])
+    joined = PacketTable.concat([table, other.select(table.fields).ensure_columns(table.fields)])
+    assert joined.decode('ssid').tolist() == table.decode('ssid').tolist() + list(reversed(SSIDS))
+    assert len(set(joined.categories['ssid'])) == len(joined.categories['ssid'])
+
+
+@pytest.mark.parametrize("fields", [None, ANALYSIS_FIELDS])
+def test_npz_round_trip(tmp_path, table, fields):
+    table = PacketTable.concat([table, PacketTable.from_records([{'ssid': ssid} for ssid in SSIDS])])
+    if fields is not None:
+        table = table.select(fields)
+    path = tmp_path / "table.npz"
+    table.save_npz(path)
+    loaded = PacketTable.load_npz(path)
+
+    assert_same_table(loaded, table)
+    assert loaded.categories == table.categories
+    assert set(loaded.decode('ssid').tolist()) == set(SSIDS) | {None}
+    for ssid in SSIDS:
+        assert loaded.equals('ssid', ssid).sum() == (2 if ssid in ("TUC\x00", "TUC", "") else 1), repr(ssid)
+
+
+def test_empty_table_round_trip(tmp_path):
+    table = PacketTableBuilder().build()
+    table.save_npz(tmp_path / "empty.npz")
+    assert_same_table(PacketTable.load_npz(tmp_path / "empty.npz"), table)
+
+
+def test_old_string_categories_are_a_cache_miss(tmp_path, table):
+    # entries written before the categories were stored as bytes lost trailing NULs, they get extracted again
+    arrays = {f"col:{name}": values for name, values in table.columns.items()}
+    arrays.update({f"cat:{name}": np.array(values, dtype=str) for name, values in table.categories.items()})
+    cache = CaptureCache(tmp_path)
+    with open(tmp_path / "old.npz", 'wb') as f:
+        np.savez(f, **arrays)
+    with pytest.raises(ValueError):
+        PacketTable.load_npz(tmp_path / "old.npz")
+    assert cache.get("old") is None
@@ -0,0 +1,158 @@
+import struct
+
+import numpy as np
+import pytest
+
+import pcap_reader
+from frame_filter import FrameFilter
+from packet_table import SCHEMA, PacketTable
+from synthetic_capture import write_capture
+from pcap_reader import PHY_11A, PHY_11AC, PHY_11N, decode_radiotap, read_radiotap
+
+TA, RA = "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"
+
+
+def assert_same_table(table, expected):
+    assert table.fields == expected.fields
+    assert len(table) == len(expected)
+    for name in expected.fields:
+        if SCHEMA[name] == 'category':
+            assert table.decode(name).tolist() == expected.decode(name).tolist(), name
+        else:
+            assert np.array_equal(table[name], expected[name], equal_nan=SCHEMA[name].startswith('float')), name
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # the test captures are far below the size where read_radiotap starts worker processes
+    monkeypatch.setattr(pcap_reader, 'MIN_BYTES_PER_WORKER', 1)
+
+
+@pytest.fixture(scope="module")
+def capture_pcapng(tmp_path_factory):
+    path = tmp_path_factory.mktemp("captures") / "synthetic_11n.pcapng"
+    write_capture(path, packets=5_000, seed=2)
+    return path
+
+
+@pytest.mark.parametrize("frame_filter", [None, FrameFilter(TA, RA, "0x0028")], ids=["all", "link"])
+@pytest.mark.parametrize("capture", ["capture_11n", "capture_pcapng"])
+def test_workers_give_the_serial_table(request, small_chunks, capture, frame_filter):
+    path = str(request.getfixturevalue(capture))
+    serial = read_radiotap(path, "11n", frame_filter, workers=1)
+    assert len(serial)
+    assert_same_table(read_radiotap(path, "11n", frame_filter, workers=4), serial)
+
+
+def test_split_records_carries_the_pcapng_section(capture_pcapng):
+    with open(capture_pcapng, 'rb') as f, pcap_reader._open_mmap(f) as buf:
+        ranges = pcap_reader.split_records(buf, 4)
+        serial = pcap_reader._decode_records(buf, "11n", None, None)
+        assert len(ranges) == 4 and all(state for _, _, state in ranges)
+        # every range decodes on its own from its start, without the blocks in front of it
+        parts = [pcap_reader._decode_records(buf, "11n", None, None, start, stop, state=state)
+                 for start, stop, state in ranges]
+    assert_same_table(PacketTable.concat(parts), serial)
+
+
+def test_small_captures_stay_serial(capture_11n):
+    assert pcap_reader.worker_count(capture_11n.stat().st_size, 8) == 1
+    assert pcap_reader.worker_count(10 * pcap_reader.MIN_BYTES_PER_WORKER, 8) == 8
+    assert pcap_reader.worker_count(3 * pcap_reader.MIN_BYTES_PER_WORKER, 8) == 3
+    assert pcap_reader.worker_count(10 * pcap_reader.MIN_BYTES_PER_WORKER, None) == 1
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("start_s, end_s", [(5.0, 12.5), (None, 3.0), (20.0, None), (1000.0, 2000.0)])
+def test_time_range_read_is_the_masked_full_read(small_chunks, capture_11n, start_s, end_s, workers):
+    frame_filter = FrameFilter(TA, RA, "0x0028", start_s=start_s, end_s=end_s)
+    full = read_radiotap(str(capture_11n), "11n")
+    expected = full.take(frame_filter.mask(full))
+    assert_same_table(read_radiotap(str(capture_11n), "11n", frame_filter, workers=workers), expected)
+
+
+# hand-written radiotap headers, independent of synthetic_capture: Flags, Channel (36, 5 GHz OFDM),
+# dBm signal and then the HT or VHT field or the legacy Rate
+def _radiotap(present, body):
+    return struct.pack('<BBHI', 0, 0, 8 + len(body), present) + body
+
+
+def vht_header(bandwidth, mcs, nss, short_gi):
+    body = b'\x00\x00'                                 # flags, pad to 2
+    body += struct.pack('<HHb', 5180, 0x0140, -55)     # channel, signal
+    body += b'\x00'                                    # pad to 2
+    # known: GI + bandwidth, flags: GI, bandwidth, user 0 MCS/NSS, 3 more users, coding, group, partial AID
+    body += struct.pack('<HBB4BBBH', 0x0044, 0x04 if short_gi else 0, bandwidth, (mcs << 4) | nss, 0, 0, 0, 0, 0, 0)
+    return _radiotap(1 << 1 | 1 << 3 | 1 << 5 | 1 << 21, body)
+
+
+def ht_header(bandwidth, mcs, short_gi):
+    body = b'\x00\x00' + struct.pack('<HHb', 5180, 0x0140, -60)
+    body += bytes([0x07, bandwidth | (0x04 if short_gi else 0), mcs])  # known: bandwidth, MCS, GI
+    return _radiotap(1 << 1 | 1 << 3 | 1 << 5 | 1 << 19, body)
+
+
+def legacy_header(rate_500kbps):
+    return _radiotap(1 << 1 | 1 << 2 | 1 << 3 | 1 << 5, bytes([0, rate_500kbps]) + struct.pack('<HHb', 5180, 0x0140, -70))
+
+
+@pytest.mark.parametrize("bandwidth, mcs, nss, short_gi, rate", [
+    (0, 7, 1, False, 65.0),       # 20 MHz
+    (1, 7, 1, False, 135.0),      # 40 MHz
+    (2, 7, 1, False, 65.0),       # 20L: the lower 20 MHz of a 40 MHz channel
+    (3, 7, 1, False, 65.0),       # 20U
+    (4, 9, 2, True, 866.7),       # 80 MHz
+    (5, 9, 2, True, 400.0),       # 40L of 80
+    (6, 9, 2, True, 400.0),       # 40U of 80
+    (7, 8, 1, False, 78.0),       # 20LL of 80
+    (10, 8, 1, False, 78.0),      # 20UU of 80
+    (11, 9, 2, True, 1733.3),     # 160 MHz
+    (12, 9, 1, True, 433.3),      # 80L of 160
+    (14, 0, 1, False, 13.5),      # 40LL of 160
+    (18, 4, 3, False, 117.0),     # 20LLL of 160
+    (25, 4, 3, False, 117.0),     # 20UUU of 160
+])
+def test_vht_rates(bandwidth, mcs, nss, short_gi, rate):
+    header = vht_header(bandwidth, mcs, nss, short_gi)
+    frame = {}
+    assert decode_radiotap(header, 0, len(header), "11ac", frame) == (len(header), 0)
+    assert frame['data_rate'] == rate
+    assert (frame['phy_type'], frame['channel'], frame['frequency'], frame['signal_strength']) == (PHY_11AC, 36, 5180, -55)
+    assert (frame['mcs_index'], frame['spatial_streams'], frame['short_gi']) == (mcs, nss, int(short_gi))
+
+
+@pytest.mark.parametrize("bandwidth, mcs, short_gi, rate", [
+    (0, 0, False, 6.5), (0, 7, False, 65.0), (0, 7, True, 72.2), (1, 15, True, 300.0), (1, 23, False, 405.0),
+])
+def test_ht_rates(bandwidth, mcs, short_gi, rate):
+    header = ht_header(bandwidth, mcs, short_gi)
+    frame = {}
+    decode_radiotap(header, 0, len(header), "11n", frame)
+    assert (frame['data_rate'], frame['phy_type'], frame['mcs_index']) == (rate, PHY_11N, mcs)
+
+
+def test_legacy_rate():
+    header = legacy_header(108)
+    frame = {}
+    decode_radiotap(header, 0, len(header), "11n", frame)
+    assert (frame['data_rate'], frame['phy_type'], frame['signal_strength']) == (54.0, PHY_11A, -70)
+
+
+def test_hand_written_record(tmp_path):
+    ta, ra = bytes.fromhex("f8aa3f92dd1b"), bytes.fromhex("dce9942a6831")
+    # QoS data, to DS, retry: frame control, duration, addr1 (BSSID = RA), addr2 (TA), addr3, sequence, QoS
+    wlan = bytes([0x88, 0x09]) + b'\x00\x00' + ra + ta + ra + b'\x10\x00' + b'\x00\x00'
+    packet = vht_header(5, 9, 2, True) + wlan + bytes(100)
+    path = tmp_path / "one.pcap"
+    path.write_bytes(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 127)
+                     + struct.pack('<IIII', 1_700_000_000, 250_000, len(packet), len(packet)) + packet)
+
+    table = read_radiotap(str(path), "11ac")
+    row = table.row(0)
+    assert len(table) == 1
+    assert (row['transmitter_mac'], row['receiver_mac'], row['bssid']) == (ta.hex(':'), ra.hex(':'), ra.hex(':'))
+    assert (row['frame_type_subtype'], row['retry_flag']) == ("0x0028", 1)
+    assert (row['wlan_header_length'], row['payload_length'], row['frame_length']) == (26, 100, len(packet))
+    assert row['data_rate'] == pytest.approx(400.0)
+    assert row['bandwidth'] == "5"
+    assert row['sniff_time'] == 1_700_000_000_250_000_000
@@ -0,0 +1,58 @@
+import pytest
+
+import parser_11ac
+import parser_11n
+from frame_filter import FrameFilter
+from pipeline import analyze_capture
+from sketches import MetricSketches
+from synthetic_capture import write_capture
+from wifi_analysis_engine import run_analysis
+
+PARSERS = {"11n": parser_11n, "11ac": parser_11ac}
+# the first station on the first access point, the other stations go round-robin over both
+TA, RA = "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"
+
+
+@pytest.fixture(scope="module", params=[("11n", "pcap"), ("11ac", "pcapng")], ids=["11n-pcap", "11ac-pcapng"])
+def capture(request, tmp_path_factory):
+    phy, fmt = request.param
+    path = tmp_path_factory.mktemp("captures") / f"synthetic_{phy}.{fmt}"
+    # the link's frames among other stations' traffic, beacons on two channels
+    write_capture(path, packets=12_000, phy=phy, stations=3, access_points=2, channels=(6, 11) if phy == "11n" else (36, 40),
+                  seed=11)
+    return phy, path
+
+
+def table_results(path, parser, ta, ra, start_s=None, end_s=None, **kwargs):
+    frame_filter = FrameFilter(ta, ra, "0x0028", keep_beacons=True, start_s=start_s, end_s=end_s)
+    packets = parser.add_rate_gap(parser.extract_all_data(str(path), frame_filter=frame_filter, backend="native"))
+    filtered = parser.filter_for_1_2(packets, ta, ra, "0x0028")
+    return run_analysis(filtered, rssid_packets=packets, plots=False, **kwargs), filtered
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {'window_size': 2, 'step': 0.5, 'max_duration': None, 'percentiles': [5, 50, 95]},
+    {'window_size': 1.5, 'max_duration': 12.25, 'start_s': 3.0, 'end_s': 17.5},
+], ids=["default", "sliding-percentiles", "time-range"])
+def test_fused_pass_matches_run_analysis(capture, tmp_path, monkeypatch, kwargs):
+    monkeypatch.chdir(tmp_path)  # run_analysis writes its summary into the working directory
+    phy, path = capture
+    expected, link_frames = table_results(path, PARSERS[phy], TA, RA, **kwargs)
+    sketches = MetricSketches()
+    results = analyze_capture(str(path), phy, TA, RA, sketches=sketches if kwargs.get('percentiles') else None, **kwargs)
+
+    assert len(expected) > 3
+    assert len(results) == len(expected)
+    for row, expected_row in zip(results, expected):
+        assert row.keys() - {'packets'} == expected_row.keys()
+        for key, value in expected_row.items():
+            assert (row[key] is None) == (value is None), key
+            if value is not None:
+                assert row[key] == pytest.approx(value, rel=1e-9), key
+    if kwargs.get('percentiles'):
+        # every link frame once, however many windows it is in
+        table_sketches = MetricSketches()
+        table_sketches.update(link_frames)
+        assert sketches.percentiles([5, 50, 95]) == table_sketches.percentiles([5, 50, 95])
+        assert len(sketches.sketches['rssi']) == len(link_frames)
@@ -0,0 +1,97 @@
+import math
+import random
+from collections import deque
+
+import numpy as np
+import pytest
+
+from packet_table import MISSING_INT, MISSING_TIME
+from wifi_analysis_engine import RssidTracker, compute_rssid_log
+
+
+class ReferenceRssid:
+    """The RSSID as it was computed before RssidTracker: every key's WMA and decay redone per sample."""
+
+    def __init__(self, decay_rate=0.1, window_size=10):
+        self.decay_rate = decay_rate
+        self.window_size = window_size
+        self.history = {}
+        self.last_seen = {}
+
+    def update(self, ssid, channel, rssi, ts):
+        key = (ssid, channel)
+        self.history.setdefault(key, deque(maxlen=self.window_size)).append(rssi)
+        self.last_seen[key] = ts
+        return self.wma(key)
+
+    def wma(self, key):
+        values = list(self.history[key])
+        weights = range(1, len(values) + 1)
+        return round(sum(value * weight for value, weight in zip(values, weights)) / sum(weights), 2)
+
+    def snapshot(self, ts):
+        rssid = {}
+        for key in self.history:
+            wma = self.wma(key)
+            if wma:
+                weight = math.exp(-self.decay_rate * (ts - self.last_seen[key]) / 1e6)
+                rssid[key[1]] = rssid.get(key[1], 0.0) + (1 / abs(wma)) * weight
+        return rssid
+
+
+def _samples(seed, count, gaps):
+    rng = random.Random(seed)
+    ts = 1_700_000_000.0
+    for _ in range(count):
+        ts += rng.choice(gaps) * rng.random()
+        ssid = rng.choice(["TUC", "eduroam", "guest"])
+        channel = rng.choice([1, 6, 11])
+        # now and then a value that brings a WMA to 0, so the key stops counting
+        rssi = rng.choice([0, 1, -1]) if rng.random() < 0.05 else rng.randint(-95, -30)
+        yield ssid, channel, rssi, ts
+
+
+@pytest.mark.parametrize("decay_rate, gaps", [
+    (0.1, [0.1]),                     # beacon spacing, the exponent stays tiny
+    (0.1, [0.1, 1e9]),                # gaps of years push the exponent past MAX_EXPONENT
+    (1e6, [0.1, 5.0, 60.0, 600.0]),   # a decay of 1 per second rebases every few samples
+])
+def test_tracker_matches_the_full_recompute(decay_rate, gaps):
+    tracker = RssidTracker(decay_rate, window_size=5)
+    reference = ReferenceRssid(decay_rate, window_size=5)
+    rebases = 0
+    for ssid, channel, rssi, ts in _samples(7, 3000, gaps):
+        reference_ts = tracker.reference_ts
+        assert tracker.update(ssid, channel, rssi, ts) == reference.update(ssid, channel, rssi, ts)
+        rebases += reference_ts is not None and tracker.reference_ts != reference_ts
+        expected = reference.snapshot(ts)
+        snapshot = tracker.snapshot(ts)
+        assert list(snapshot) == tracker.channels()
+        assert set(snapshot) == set(expected)
+        for channel, value in expected.items():
+            assert snapshot[channel] == pytest.approx(value, rel=1e-9, abs=1e-12)
+            assert tracker.rssid(channel, ts) == pytest.approx(value, rel=1e-9, abs=1e-12)
+    if max(gaps) * decay_rate / 1e6 > RssidTracker.MAX_EXPONENT or decay_rate > 1:
+        assert rebases > 0
+
+
+def test_rssid_log_matches_the_full_recompute(capture_11n):
+    from pcap_reader import read_radiotap
+    packets = read_radiotap(str(capture_11n), "11n")
+    reference = ReferenceRssid()
+    expected = []
+    ssids = packets.categories['ssid']
+    for i in range(len(packets)):
+        code, channel = packets['ssid'][i], packets['channel'][i]
+        rssi, sniff_time = packets['signal_strength'][i], packets['sniff_time'][i]
+        if code < 0 or not ssids[code] or np.isnan(rssi) or channel == MISSING_INT or sniff_time == MISSING_TIME:
+            continue
+        ts = int(sniff_time) / 1e9
+        reference.update(ssids[code], int(channel), int(rssi), ts)
+        expected.extend((ts, ch, value) for ch, value in reference.snapshot(ts).items())
+
+    log = compute_rssid_log(packets)
+    assert len(log) == len(expected) > 100
+    for (ts, channel, value), (expected_ts, expected_channel, expected_value) in zip(log, expected):
+        assert (ts, channel) == (expected_ts, expected_channel)
+        assert value == pytest.approx(expected_value, rel=1e-9)
@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from packet_table import PacketTable
+from sketches import METRICS, LinearBins, LogBins, MetricSketches, QuantileSketch, percentile_columns
+
+PERCENTILES = [0, 1, 5, 25, 50, 75, 95, 99, 100]
+
+
+def true_percentiles(values):
+    # the nearest-rank rule the sketches document
+    return np.percentile(values, PERCENTILES, method="inverted_cdf")
+
+
+def sketch_of(bins, values):
+    sketch = QuantileSketch(bins)
+    sketch.update(values)
+    return sketch
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(7)
+
+
+def test_integer_values_are_exact(rng):
+    values = rng.integers(-95, -20, 5_001)
+    assert sketch_of(LinearBins(-128, 20), values).quantiles(PERCENTILES) == true_percentiles(values).tolist()
+
+
+@pytest.mark.parametrize("width", [1.0, 0.5, 2.0])
+def test_linear_bins_within_half_a_bin(rng, width):
+    values = rng.normal(-60, 8, 10_000)
+    quantiles = np.array(sketch_of(LinearBins(-128, 20, width), values).quantiles(PERCENTILES))
+    assert np.all(np.abs(quantiles - true_percentiles(values)) <= width / 2 + 1e-9)
+
+
+@pytest.mark.parametrize("relative_error", [0.01, 0.05])
+def test_log_bins_within_the_relative_error(rng, relative_error):
+    values = np.exp(rng.uniform(np.log(0.5), np.log(10_000), 10_000))
+    quantiles = np.array(sketch_of(LogBins(0.5, 10_000, relative_error), values).quantiles(PERCENTILES))
+    expected = true_percentiles(values)
+    assert np.all(np.abs(quantiles - expected) <= relative_error * expected + 1e-9)
+
+
+@pytest.mark.parametrize("bins, values", [
+    (LinearBins(-128, 20), [-200.0, -128.4, -3.5, 0.0, 19.6, 500.0]),
+    (LogBins(0.5, 10000, 0.01), [0.0, 0.5, 0.50001, 1.0, 6.5, 1733.3, 9999.0, 1e6]),
+])
+def test_scalar_and_array_binning_agree(bins, values):
+    assert bins.index(values).tolist() == [bins.index_of(value) for value in values]
+    # values outside the range land in the edge bins
+    assert bins.index(values).min() == 0 and bins.index(values).max() == bins.size - 1
+
+
+def test_merged_partial_sketches_are_the_sketch_of_all(rng):
+    bins = LogBins(0.5, 10000, 0.01)
+    values = rng.lognormal(4, 1, 9_000)
+    parts = [sketch_of(bins, part) for part in np.array_split(values, 5)]
+    merged = QuantileSketch(bins)
+    for part in parts:
+        merged.merge(part)
+    whole = sketch_of(bins, values)
+    assert merged.counts == whole.counts and len(merged) == len(whole) == len(values)
+    assert merged.quantiles(PERCENTILES) == whole.quantiles(PERCENTILES)
+
+
+def test_merge_needs_the_same_bins():
+    with pytest.raises(ValueError):
+        QuantileSketch(LinearBins(-128, 20)).merge(QuantileSketch(LinearBins(-64, 64)))
+    with pytest.raises(ValueError):
+        QuantileSketch(LogBins(0.5, 10000, 0.01)).merge(QuantileSketch(LogBins(0.5, 10000, 0.05)))
+
+
+def test_empty_and_nan_inputs():
+    sketch = sketch_of(LinearBins(-64, 64), [])
+    assert len(sketch) == 0 and sketch.quantiles() == [None, None, None] and sketch.quantile(50) is None
+    sketch.update([np.nan, np.nan])
+    assert len(sketch) == 0 and sketch.quantile(95) is None
+    # an empty sketch merges as a no-op both ways
+    assert sketch_of(LinearBins(-64, 64), [1, 2]).merge(sketch).quantiles([0, 100]) == [1.0, 2.0]
+    assert sketch.merge(sketch_of(LinearBins(-64, 64), [3])).quantiles() == [3.0, 3.0, 3.0]
+
+    values = np.array([5.0, np.nan, -2.0, np.nan, 7.0, 1.0])
+    assert sketch_of(LinearBins(-64, 64), values).quantiles(PERCENTILES) == true_percentiles(values[~np.isnan(values)]).tolist()
+
+
+def test_add_matches_update(rng):
+    values = rng.integers(-10, 10, 500)
+    sketch = QuantileSketch(LinearBins(-64, 64))
+    for value in values.tolist():
+        sketch.add(value)
+    assert sketch.counts == sketch_of(LinearBins(-64, 64), values).counts
+
+
+@pytest.fixture
+def packets(rng):
+    n = 3_000
+    rssi = rng.uniform(-90, -30, n)
+    rssi[::17] = np.nan
+    rate = rng.choice([6.5, 65.0, 135.0, 400.0, 866.7], n)
+    rate_gap = rng.integers(-7, 8, n).astype(float)
+    rate_gap[::5] = np.nan
+    return PacketTable({'signal_strength': rssi, 'data_rate': rate, 'rate_gap': rate_gap})
+
+
+def frames_of(packets):
+    return [{column: None if np.isnan(value) else value for column, value in zip(packets.fields, row)}
+            for row in zip(*(packets[column].tolist() for column in packets.fields))]
+
+
+def test_metric_sketches(packets):
+    sketches = MetricSketches()
+    sketches.update(packets)
+    percentiles = sketches.percentiles()
+    assert list(percentiles) == percentile_columns()
+
+    rssi = np.trunc(packets['signal_strength'])
+    assert [percentiles[f"rssi_p{p}"] for p in (5, 50, 95)] == np.percentile(
+        rssi[~np.isnan(rssi)], [5, 50, 95], method="inverted_cdf").tolist()
+    rate = np.percentile(packets['data_rate'], [5, 50, 95], method="inverted_cdf")
+    assert [percentiles[f"rate_p{p}"] for p in (5, 50, 95)] == pytest.approx(rate, rel=0.01)
+    rate_gap = packets['rate_gap']
+    assert [percentiles[f"rate_gap_p{p}"] for p in (5, 50, 95)] == np.percentile(
+        rate_gap[~np.isnan(rate_gap)], [5, 50, 95], method="inverted_cdf").tolist()
+
+
+def test_metric_sketches_frame_by_frame_and_merged(packets):
+    whole = MetricSketches()
+    whole.update(packets)
+
+    by_frame = MetricSketches()
+    for frame in frames_of(packets):
+        by_frame.add_frame(frame)
+
+    merged = MetricSketches()
+    for part in np.array_split(np.arange(len(packets)), 3):
+        partial = MetricSketches()
+        partial.update(packets.take(part))
+        merged.merge(partial)
+
+    for name in METRICS:
+        assert by_frame.sketches[name].counts == whole.sketches[name].counts, name
+        assert merged.sketches[name].counts == whole.sketches[name].counts, name
+    assert by_frame.percentiles() == merged.percentiles() == whole.percentiles()
+
+
+def test_empty_metric_sketches():
+    sketches = MetricSketches()
+    sketches.update(PacketTable({'signal_strength': np.array([np.nan]), 'data_rate': np.array([np.nan]),
+                                 'rate_gap': np.array([np.nan])}))
+    assert set(sketches.percentiles().values()) == {None}
@@ -0,0 +1,125 @@
+import csv
+import itertools
+
+import pytest
+
+import parser_11n
+import streaming
+from frame_filter import FrameFilter
+from pcap_reader import _open_mmap, iter_records
+from pipeline import LinkWindowConsumer, Pipeline, RssidConsumer, decode_frames, iter_file_records
+from streaming import PacketStream
+from synthetic_capture import write_capture
+
+TA, RA = "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"
+
+
+class _KeepAllRssid(RssidConsumer):
+    def prune(self, before_s):
+        pass
+
+
+@pytest.fixture(scope="module")
+def long_capture(tmp_path_factory):
+    # 20 minutes of beacons from 3 access points on 3 channels around a sparse link
+    path = tmp_path_factory.mktemp("captures") / "long_11n.pcap"
+    info = write_capture(path, packets=40_000, access_points=3, stations=3, channels=(1, 6, 11),
+                         beacons_per_s=10.0, data_rate_pps=3.0, seed=3)
+    assert info['duration'] > 1000
+    return path
+
+
+def _stream(pcap_file, rssid, on_window):
+    link = LinkWindowConsumer(TA, RA, rssid, max_duration=None, on_window=on_window)
+    frames = decode_frames(iter_file_records(pcap_file), "11n", FrameFilter(TA, RA, keep_beacons=True))
+    Pipeline([rssid, link]).run(frames)
+    return link
+
+
+def test_live_rssid_series_stays_bounded(long_capture):
+    rssid = RssidConsumer()
+    results, sizes = [], []
+
+    def on_window(result):
+        results.append(result)
+        sizes.append(len(rssid.series))
+
+    _stream(long_capture, rssid, on_window)
+    reference = _KeepAllRssid()
+    expected = []
+    _stream(long_capture, reference, expected.append)
+
+    assert len(results) > 400
+    # per channel: the 2 s of the open window, the bucket being filled and the one carried over
+    assert max(sizes) <= 3 * 5
+    assert len(reference.series) > 3 * 1000
+    # the window sums only differ in rounding, the cumulative sums run over fewer buckets
+    assert len(results) == len(expected)
+    for result, reference_result in zip(results, expected):
+        assert result == pytest.approx(reference_result)
+    for channel in reference.series.channels():
+        assert rssid.avg_rssid(channel) == pytest.approx(reference.avg_rssid(channel))
+
+
+class _GrowingFile:
+    """Reads path while it is being written: whenever the reader hits the end, the next chunk is appended."""
+
+    def __init__(self, path, contents, chunk_sizes):
+        self.path = path
+        self.contents = contents
+        self.written = 0
+        self.chunk_sizes = itertools.cycle(chunk_sizes)
+        path.write_bytes(b'')
+        self.f = open(path, 'rb')
+
+    def read(self, size):
+        data = self.f.read(size)
+        if not data and self.written < len(self.contents):
+            chunk = self.contents[self.written:self.written + next(self.chunk_sizes)]
+            with open(self.path, 'ab') as writer:
+                writer.write(chunk)
+            self.written += len(chunk)
+        return data
+
+
+@pytest.mark.parametrize("suffix", ["pcap", "pcapng"])
+def test_packet_stream_follows_a_growing_file(tmp_path, suffix):
+    source = tmp_path / f"capture.{suffix}"
+    write_capture(source, packets=300, seed=5)
+    contents = source.read_bytes()
+    with open(source, 'rb') as f, _open_mmap(f) as buf:
+        expected = [(sniff_time, bytes(buf[data:data + caplen]), origlen, linktype)
+                    for sniff_time, data, caplen, origlen, linktype, _ in iter_records(buf)]
+
+    # appends that stop inside headers, inside frames and right on record boundaries
+    growing = _GrowingFile(tmp_path / f"live.{suffix}", contents, [1, 3, 7, 16, 61, 250, 1024])
+    stream = PacketStream(growing, follow=True, poll_interval=0, idle_timeout=0.2)
+    records = [(sniff_time, data, origlen, linktype) for sniff_time, data, _, caplen, origlen, linktype in stream]
+    growing.f.close()
+
+    assert growing.written == len(contents)
+    assert len(records) == len(expected) == 300
+    assert records == expected
+
+
+def test_ctrl_c_flushes_the_windows_and_fails_the_run(long_capture, tmp_path, monkeypatch):
+    decode = streaming.decode_frames
+
+    def interrupted(records, phy, frame_filter=None):
+        for count, frame in enumerate(decode(records, phy, frame_filter)):
+            if count == 5_000:
+                raise KeyboardInterrupt
+            yield frame
+
+    monkeypatch.setattr(streaming, 'decode_frames', interrupted)
+    finished = []
+    with pytest.raises(KeyboardInterrupt):
+        streaming.run_stream(str(long_capture), parser_11n, TA, RA, on_finish=finished.append)
+    assert len(finished) == 1 and not finished[0]._open
+
+    output = tmp_path / "live.csv"
+    assert streaming.main([str(long_capture), "--output", str(output)]) == 130
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    # the windows before the interrupt, the last one flushed by it
+    assert len(rows) > 10
@@ -0,0 +1,45 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from time_index import TimeIndex, index_path, load_or_build_index
+
+
+@pytest.fixture
+def capture(tmp_path, capture_11n):
+    # a private copy, the sidecars are written next to it
+    path = tmp_path / capture_11n.name
+    path.write_bytes(capture_11n.read_bytes())
+    return path
+
+
+def _build(pcap_file):
+    return len(load_or_build_index(pcap_file))
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:len(data) // 2],   # interrupted save
+    lambda data: data[:10],
+    lambda data: b'',
+    lambda data: b'not an index at all',
+])
+def test_damaged_sidecar_is_rebuilt(capture, damage):
+    expected = load_or_build_index(capture)
+    sidecar = index_path(capture)
+    with open(sidecar, 'rb') as f:
+        data = f.read()
+    with open(sidecar, 'wb') as f:
+        f.write(damage(data))
+
+    index = load_or_build_index(capture)
+    assert np.array_equal(index.offsets, expected.offsets)
+    assert np.array_equal(TimeIndex.load(sidecar).offsets, expected.offsets)
+
+
+def test_concurrent_builds_leave_a_valid_sidecar(capture):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        sizes = list(pool.map(_build, [capture] * 8))
+    assert len(set(sizes)) == 1
+    assert len(TimeIndex.load(index_path(capture))) == sizes[0]
+    assert sorted(path.name for path in capture.parent.iterdir()) == sorted([capture.name, capture.name + ".tidx"])
@@ -0,0 +1,52 @@
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import parser_11ac
+import parser_11n
+from packet_table import MISSING_INT
+from tshark_backend import HEADER_FIELDS, _chunk_to_table, select_fields, tshark_available, wlan_header_length
+
+
+@pytest.mark.skipif(not tshark_available(), reason="tshark is not installed")
+def test_every_exported_field_exists():
+    # tshark aborts the whole export on a single unknown -e field
+    known = {line.split('\t')[2] for line in subprocess.run(['tshark', '-G', 'fields'], capture_output=True, text=True,
+                                                            check=True).stdout.splitlines() if line.startswith('F\t')}
+    for fields in (parser_11n.TSHARK_FIELDS, parser_11ac.TSHARK_FIELDS, HEADER_FIELDS):
+        assert set(fields.values()) <= known
+
+
+def test_11n_streams_come_from_the_mcs():
+    assert 'spatial_streams' not in parser_11n.TSHARK_FIELDS
+    chunk = pd.DataFrame({'mcs_index': ['3', '12', '21', None], 'signal_strength': ['-60', '-60', '-60', '-60']}, dtype=str)
+    table = parser_11n.add_rate_gap(_chunk_to_table(chunk).ensure_columns(['spatial_streams', 'rate_gap']))
+    assert table['spatial_streams'].tolist() == [1, 2, 3, MISSING_INT]
+
+
+def test_header_length_follows_the_frame_control():
+    # beacon, beacon +HTC, data, QoS data, QoS data +HTC, 4-address QoS data, ACK, RTS, unknown
+    type_subtype = np.array([0x08, 0x08, 0x20, 0x28, 0x28, 0x28, 0x1d, 0x1b, MISSING_INT])
+    ds = np.array([0, 0, 1, 1, 2, 3, 0, 0, 0])
+    order = np.array([0, 1, 0, 0, 1, 0, 0, 0, 0])
+    assert wlan_header_length(type_subtype, ds, order).tolist() == [24, 28, 24, 26, 30, 32, 10, 16, MISSING_INT]
+
+
+def test_payload_fallback_subtracts_both_headers():
+    selected = select_fields(parser_11n.TSHARK_FIELDS, ['payload_length'])
+    assert {'radiotap_length', 'frame_type_subtype', *HEADER_FIELDS} <= set(selected)
+    assert 'wlan_header_length' not in selected
+    chunk = pd.DataFrame({
+        'frame_type_subtype': ['0x0028', '0x0028', '0x0008'],
+        'radiotap_length': ['36', '36', '36'],
+        'frame_length': ['1536', '100', '160'],
+        'payload_length': ['1400', None, None],
+        'fc_ds': ['0x01', '0x03', '0x00'],
+        'fc_order': ['False', '0', 'True'],
+    }, dtype=str)
+    table = _chunk_to_table(chunk)
+    assert table['wlan_header_length'].tolist() == [26, 32, 28]
+    assert table['payload_length'].tolist() == [1400, 100 - 36 - 32, 160 - 36 - 28]
+    assert 'fc_ds' not in table
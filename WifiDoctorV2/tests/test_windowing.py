@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+import parser_11n
+from frame_filter import FrameFilter
+from synthetic_capture import write_capture
+from wifi_analysis_engine import (
+    analyze_link, analyze_links, compute_data_rate_avg, compute_frame_loss, compute_length_avg, compute_rate_gap_avg,
+    compute_rssi_avg, link_ids,
+)
+from windowing import segment_window_bounds, window_aggregates, window_bounds
+
+TA, RA = "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"
+
+
+@pytest.fixture(scope="module")
+def link(capture_11n):
+    packets = parser_11n.add_rate_gap(parser_11n.extract_all_data(str(capture_11n), backend="native"))
+    packets = packets.take(FrameFilter(TA, RA, "0x0028", keep_beacons=False).mask(packets)).sort_by('sniff_time')
+    timestamps = (packets['sniff_time'] - packets['sniff_time'][0]) / 1e9
+    # a silent stretch, so some windows are empty
+    keep = (timestamps < 9.3) | (timestamps >= 16.1)
+    return packets.take(keep), timestamps[keep]
+
+
+def reference_windows(packets, timestamps, window_size, step, max_duration):
+    """The per-window loop run_analysis used before windowing.py."""
+    if max_duration is not None:
+        in_range = timestamps <= max_duration
+        packets, timestamps = packets.take(in_range), timestamps[in_range]
+    rows = []
+    start = 0
+    while start < timestamps[-1]:
+        window = packets.take((timestamps >= start) & (timestamps < start + window_size))
+        if len(window):
+            rows.append({
+                'start': start, 'packets': len(window), 'avg_rssi': compute_rssi_avg(window),
+                'avg_rate': compute_data_rate_avg(window), 'frame_loss': compute_frame_loss(window),
+                'rate_gap': compute_rate_gap_avg(window),
+                'avg_payload': compute_length_avg(window, 'payload_length'),
+                'avg_total': compute_length_avg(window, 'frame_length'),
+            })
+        else:
+            rows.append({'start': start, 'packets': 0})
+        start += step
+    return rows
+
+
+@pytest.mark.parametrize("window_size, step, max_duration", [
+    (2, None, 30), (2, None, None), (2, 0.5, 30), (1.5, None, 20.25),
+])
+def test_window_aggregates_match_the_per_window_loop(link, window_size, step, max_duration):
+    packets, timestamps = link
+    windows = window_aggregates(packets, timestamps, window_size, step, max_duration)
+    expected = reference_windows(packets, timestamps, window_size, step or window_size, max_duration)
+
+    assert len(windows['start']) == len(expected)
+    assert any(row['packets'] == 0 for row in expected)
+    for i, row in enumerate(expected):
+        assert windows['start'][i] == pytest.approx(row['start'])
+        assert windows['end'][i] == pytest.approx(row['start'] + window_size)
+        assert windows['packets'][i] == row['packets']
+        if not row['packets']:
+            assert np.isnan(windows['avg_rssi'][i]) and np.isnan(windows['avg_rate'][i])
+            assert windows['frame_loss'][i] == 0
+            continue
+        for key in ('avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap', 'avg_payload', 'avg_total'):
+            value = windows[key][i]
+            assert (np.isnan(value) if row[key] is None else value == pytest.approx(row[key], rel=1e-12)), key
+
+
+@pytest.mark.parametrize("window_size, step, max_duration", [(2, None, 30), (2, 0.5, None), (1.5, None, 3.1)])
+def test_segment_window_bounds_match_window_bounds_per_group(window_size, step, max_duration):
+    rng = np.random.default_rng(5)
+    groups = [np.sort(rng.uniform(0, 12, n)) for n in (0, 1, 40, 3, 200, 0, 7)]
+    groups = [times - times[0] if len(times) else times for times in groups]
+    groups[3] = np.array([0.0, 2.0, 2.0])  # a packet right on window edges
+    # unrelated packets in front of and between the groups
+    parts, segment_starts, segment_ends = [], [], []
+    position = 0
+    for times in groups:
+        parts += [np.full(2, 99.0), times]
+        segment_starts.append(position + 2)
+        position += 2 + len(times)
+        segment_ends.append(position)
+    timestamps = np.concatenate(parts)
+
+    group, starts, lo, hi = segment_window_bounds(timestamps, segment_starts, segment_ends, window_size, step, max_duration)
+    for g, (times, first) in enumerate(zip(groups, segment_starts)):
+        expected_starts, expected_lo, expected_hi = window_bounds(times, window_size, step, max_duration)
+        assert np.array_equal(starts[group == g], expected_starts)
+        assert np.array_equal(lo[group == g], expected_lo + first)
+        assert np.array_equal(hi[group == g], expected_hi + first)
+    assert np.array_equal(group, np.sort(group))
+
+
+@pytest.fixture(scope="module")
+def many_links(tmp_path_factory):
+    path = tmp_path_factory.mktemp("captures") / "stations.pcap"
+    write_capture(path, packets=15_000, stations=6, access_points=2, channels=(1, 6), seed=4)
+    return parser_11n.add_rate_gap(parser_11n.extract_all_data(str(path), backend="native"))
+
+
+@pytest.mark.parametrize("group_by", ["ta_ra", "bssid_station"])
+def test_analyze_links_is_analyze_link_per_link(many_links, group_by):
+    percentiles = [5, 50, 95]
+    summary = analyze_links(many_links, group_by=group_by, percentiles=percentiles)
+    ids, links = link_ids(many_links, group_by)
+    assert len(links) > 2
+
+    first_column, second_column = ("transmitter_mac", "receiver_mac") if group_by == "ta_ra" else ("bssid", "station")
+    for i, (first, second) in enumerate(links):
+        link = many_links.take((ids == i) & many_links.equals('frame_type_subtype', "0x0028"))
+        rows = summary[(summary[first_column] == first) & (summary[second_column] == second)]
+        analyzed = analyze_link(link, rssid_packets=many_links, verbose=False, percentiles=percentiles)
+        if analyzed is None:
+            assert rows.empty
+            continue
+        windows, results, _ = analyzed
+        assert len(rows) == len(results), (first, second)
+        assert rows['packets'].tolist() == windows['packets'][windows['packets'] > 0].tolist()
+        for key in ['timestamp', 'avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap', 'theoretical_throughput',
+                    'rssi_p5', 'rate_p50', 'rate_gap_p95']:
+            expected = np.array([np.nan if row[key] is None else row[key] for row in results])
+            assert np.allclose(rows[key].to_numpy(dtype=float), expected, rtol=1e-12, equal_nan=True), key
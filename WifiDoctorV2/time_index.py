@@ -0,0 +1,231 @@
+"""
+Sidecar time index of a pcap / pcapng capture.
+
+The records are grouped in blocks of about `granularity` seconds of capture time. For every
+block the index keeps its byte offset, its earliest and latest record time and, for pcapng,
+the section state (byte order, interfaces) needed to start parsing there. Reading a time
+range then only touches the blocks that overlap it instead of walking the capture from the
+start, and a long capture can be cut into time slices that are read independently.
+
+The index is built in one header-only pass and saved next to the capture as <capture>.tidx,
+it is rebuilt when the capture's size or mtime changes.
+
+    python time_index.py pcap_files/long_capture.pcapng
+"""
+import json
+import os
+import pathlib
+import sys
+import numpy as np
+from capture_cache import write_atomic
+from packet_table import MISSING_TIME
+from pcap_reader import iter_records, _open_mmap
+
+INDEX_SUFFIX = ".tidx"
+INDEX_VERSION = 1
+DEFAULT_GRANULARITY_S = 1.0
+NO_TIME = np.iinfo(np.int64).max  # min_times of a block without any timestamped record
+
+
+def index_path(pcap_file):
+    return str(pcap_file) + INDEX_SUFFIX
+
+
+class TimeIndex:
+    """
+    Args:
+        offsets (numpy.ndarray): byte offset of the first record of every block
+        min_times, max_times (numpy.ndarray): earliest / latest record time (ns) of every block,
+            NO_TIME / MISSING_TIME when the block has no timestamped record
+        state_ids (numpy.ndarray): index into states of every block (-1 for classic pcap)
+        states (list): pcapng section states (endian, interfaces), see iter_pcapng_records()
+        granularity (float): block length in seconds
+        first_time (int): time (ns) of the first timestamped record, None for an empty capture
+    """
+
+    def __init__(self, offsets, min_times, max_times, state_ids, states, granularity, first_time,
+                 size=None, mtime_ns=None):
+        self.offsets = offsets
+        self.min_times = min_times
+        self.max_times = max_times
+        self.state_ids = state_ids
+        self.states = states
+        self.granularity = granularity
+        self.first_time = first_time
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, buf, granularity=DEFAULT_GRANULARITY_S):
+        """
+        Walks the record headers of a capture once.
+
+        Args:
+            buf: the capture contents (bytes or mmap)
+            granularity (float): seconds of capture time per block
+        """
+        step = max(int(granularity * 1e9), 1)
+        offsets, min_times, max_times, state_ids, states = [], [], [], [], []
+        state = {}
+        first_time = None
+        slot = -1
+        for sniff_time, _, _, _, _, record_offset in iter_records(buf, state=state):
+            timed = sniff_time != MISSING_TIME
+            if timed and first_time is None:
+                first_time = sniff_time
+            record_slot = (sniff_time - first_time) // step if timed else slot
+            # a new block starts with the first record of a later slot, out of order
+            # records stay in the current block and only widen its time span
+            if not offsets or record_slot > slot:
+                slot = max(record_slot, 0)
+                offsets.append(record_offset)
+                min_times.append(NO_TIME)
+                max_times.append(MISSING_TIME)
+                if state:
+                    section = (state['endian'], tuple(state['interfaces']))
+                    if not states or states[-1] != section:
+                        states.append(section)
+                    state_ids.append(len(states) - 1)
+                else:
+                    state_ids.append(-1)
+            if timed:
+                min_times[-1] = min(min_times[-1], sniff_time)
+                max_times[-1] = max(max_times[-1], sniff_time)
+        return cls(np.array(offsets, dtype=np.int64), np.array(min_times, dtype=np.int64),
+                   np.array(max_times, dtype=np.int64), np.array(state_ids, dtype=np.int32),
+                   states, granularity, first_time)
+
+    @property
+    def duration(self):
+        """Seconds from the first to the last timestamped record."""
+        timed = self.max_times != MISSING_TIME
+        if self.first_time is None or not timed.any():
+            return 0.0
+        return (self.max_times[timed].max() - self.first_time) / 1e9
+
+    def _state(self, block):
+        state_id = self.state_ids[block]
+        if state_id < 0:
+            return None
+        endian, interfaces = self.states[state_id]
+        return {'endian': endian, 'interfaces': interfaces}
+
+    def ranges(self, start_s=None, end_s=None, chunks=1):
+        """
+        Byte ranges that hold every record with a time in [start_s, end_s) seconds after the
+        first record, the same convention as FrameFilter.start_s / end_s. The ranges may hold
+        a few records outside the time range, the caller still filters on the record time.
+
+        Args:
+            chunks (int): cut the covered blocks into up to this many ranges (for workers)
+
+        Returns:
+            list: (start, stop, state) with stop None for the end of the file and state the
+                pcapng section state to pass to iter_records() (None for classic pcap)
+        """
+        if self.first_time is None or not len(self):
+            return []
+        timed = self.max_times != MISSING_TIME
+        keep = timed.copy() if start_s is not None else np.ones(len(self), dtype=bool)
+        if start_s is not None:
+            keep &= self.max_times - self.first_time >= start_s * 1e9
+        if end_s is not None:
+            keep &= ~timed | (self.min_times - self.first_time < end_s * 1e9)
+        blocks = np.flatnonzero(keep)
+        if not len(blocks):
+            return []
+        covered = np.arange(blocks[0], blocks[-1] + 1)
+        ranges = []
+        for group in np.array_split(covered, min(max(chunks, 1), len(covered))):
+            stop = int(self.offsets[group[-1] + 1]) if group[-1] + 1 < len(self) else None
+            ranges.append((int(self.offsets[group[0]]), stop, self._state(group[0])))
+        return ranges
+
+    def slices(self, slice_s, start_s=None, end_s=None):
+        """
+        Consecutive [start, end) time slices of slice_s seconds that cover the capture
+        (or the part of it between start_s and end_s).
+
+        Returns:
+            list: (start_s, end_s) tuples in seconds after the first record
+        """
+        first = start_s or 0.0
+        last = self.duration if end_s is None else min(end_s, self.duration)
+        slices = []
+        start = first
+        while start <= last and (end_s is None or start < end_s):
+            end = start + slice_s
+            slices.append((start, end if end_s is None else min(end, end_s)))
+            start = end
+        return slices
+
+    def save(self, path):
+        meta = {
+            'version': INDEX_VERSION, 'granularity': self.granularity, 'first_time': self.first_time,
+            'size': self.size, 'mtime_ns': self.mtime_ns, 'states': self.states,
+        }
+
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez(f, offsets=self.offsets, min_times=self.min_times, max_times=self.max_times,
+                         state_ids=self.state_ids, meta=np.array(json.dumps(meta)))
+        # an interrupted or concurrent save never leaves a truncated sidecar behind
+        write_atomic(pathlib.Path(path), write)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].item())
+            if meta.get('version') != INDEX_VERSION:
+                return None
+            states = [(endian, [tuple(interface) for interface in interfaces]) for endian, interfaces in meta['states']]
+            return cls(data['offsets'], data['min_times'], data['max_times'], data['state_ids'], states,
+                       meta['granularity'], meta['first_time'], meta['size'], meta['mtime_ns'])
+
+
+def load_or_build_index(pcap_file, granularity=DEFAULT_GRANULARITY_S):
+    """
+    The time index of pcap_file from its .tidx sidecar, built (and saved when the directory is
+    writable) if the sidecar is missing, outdated or was built with another granularity.
+
+    Returns:
+        TimeIndex
+    """
+    stat = os.stat(pcap_file)
+    path = index_path(pcap_file)
+    try:
+        index = TimeIndex.load(path)
+    except Exception:
+        # missing, truncated (BadZipFile, EOFError) or foreign sidecar, it is simply rebuilt
+        index = None
+    if (index is not None and index.size == stat.st_size and index.mtime_ns == stat.st_mtime_ns
+            and index.granularity == granularity):
+        return index
+
+    with open(pcap_file, 'rb') as f, _open_mmap(f) as buf:
+        index = TimeIndex.build(buf, granularity)
+    index.size = stat.st_size
+    index.mtime_ns = stat.st_mtime_ns
+    try:
+        index.save(path)
+    except OSError as error:
+        print(f"[WARN] Could not save the time index of {pcap_file}: {error}")
+    return index
+
+
+def main(argv=None):
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="Build (or refresh) the .tidx time index of captures.")
+    arg_parser.add_argument("captures", nargs="+")
+    arg_parser.add_argument("--granularity", type=float, default=DEFAULT_GRANULARITY_S, help="seconds per index block")
+    args = arg_parser.parse_args(argv)
+    for pcap_file in args.captures:
+        index = load_or_build_index(pcap_file, args.granularity)
+        print(f"{pcap_file}: {len(index)} blocks, {index.duration:.1f}s -> {index_path(pcap_file)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Bulk extraction backend: one `tshark -T fields` run over the capture, its tab separated
+output is parsed in chunks by pandas.read_csv instead of walking pyshark packet objects.
+The field lists (column -> tshark field) live in parser_11n.TSHARK_FIELDS / parser_11ac.TSHARK_FIELDS.
+"""
+import csv
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+import instrumentation
+from packet_table import PacketTable, PacketTableBuilder, SCHEMA, MISSING_INT, MISSING_TIME, dtype_of
+
+CHUNK_ROWS = 500_000
+
+# frame control fields the 802.11 header length is worked out from (wireshark has no header
+# length field), exported next to TSHARK_FIELDS when the payload fallback needs them
+HEADER_FIELDS = {'fc_ds': 'wlan.fc.ds', 'fc_order': 'wlan.fc.order'}
+
+
+class TsharkError(RuntimeError):
+    """tshark is missing or exited with an error."""
+
+
+def tshark_available(tshark="tshark"):
+    return shutil.which(tshark) is not None
+
+
+def build_command(pcap_file, fields, display_filter=None, tshark="tshark"):
+    command = [
+        tshark, '-r', pcap_file, '-n', '-T', 'fields',
+        '-E', 'separator=/t', '-E', 'occurrence=f', '-E', 'quote=n', '-E', 'header=n',
+    ]
+    if display_filter:
+        command += ['-Y', display_filter]
+    for field in fields.values():
+        command += ['-e', field]
+    return command
+
+
+def select_fields(fields: dict, columns=None) -> dict:
+    """
+    The part of a column -> tshark field mapping needed for columns (None = all of it).
+    payload_length and wlan_header_length bring along radiotap_length, frame_type_subtype and
+    the HEADER_FIELDS, the header length and the payload fallback are computed from them.
+    """
+    wanted = set(fields) | {'wlan_header_length'} if columns is None else set(columns)
+    if 'payload_length' in wanted or 'wlan_header_length' in wanted:
+        wanted.update(('radiotap_length', 'frame_type_subtype'))
+        selected = {name: field for name, field in fields.items() if name in wanted}
+        selected.update(HEADER_FIELDS)
+        return selected
+    return {name: field for name, field in fields.items() if name in wanted}
+
+
+def _parse_int(values: pd.Series, dtype):
+    numbers = pd.to_numeric(values, errors='coerce')
+    hex_values = values.str.startswith('0x', na=False)
+    if hex_values.any():
+        numbers[hex_values] = values[hex_values].map(lambda v: int(v, 16))
+    return numbers.fillna(MISSING_INT).astype(dtype).to_numpy()
+
+
+def _parse_time(values: pd.Series):
+    """frame.time_epoch "1700000000.123456789" -> int ns without going through float"""
+    parts = values.str.split('.', n=1, expand=True)
+    seconds = pd.to_numeric(parts[0], errors='coerce')
+    if parts.shape[1] > 1:
+        fraction = parts[1].fillna('').str.ljust(9, '0').str[:9]
+        nanoseconds = pd.to_numeric(fraction, errors='coerce').fillna(0)
+    else:
+        nanoseconds = 0
+    result = seconds * 1_000_000_000 + nanoseconds
+    return result.fillna(MISSING_TIME).astype(np.int64).to_numpy()
+
+
+def wlan_header_length(type_subtype, ds, order):
+    """
+    802.11 MAC header length from the frame control, the same rules as pcap_reader.decode_80211().
+
+    Args:
+        type_subtype (numpy.ndarray): wlan.fc.type_subtype, MISSING_INT when unknown
+        ds (numpy.ndarray): wlan.fc.ds (1 = to DS, 2 = from DS, 3 = both)
+        order (numpy.ndarray): wlan.fc.order (+HTC)
+
+    Returns:
+        numpy.ndarray: header lengths, MISSING_INT for unknown / extension frames
+    """
+    frame_type, subtype = type_subtype >> 4, type_subtype & 0xf
+    control = frame_type == 1
+    data = frame_type == 2
+    qos = data & (subtype & 0x8 != 0)
+    length = np.where(control, np.where((subtype == 0xc) | (subtype == 0xd), 10, 16), 24)
+    length += np.where(data & (ds == 3), 6, 0)
+    length += np.where(qos, 2, 0)
+    length += np.where((order == 1) & (qos | (frame_type == 0)), 4, 0)
+    return np.where((type_subtype < 0) | (frame_type > 2), MISSING_INT, length)
+
+
+def _chunk_to_table(chunk: pd.DataFrame) -> PacketTable:
+    columns = {}
+    categories = {}
+    header = {name: chunk.pop(name) for name in HEADER_FIELDS if name in chunk.columns}
+    if header and 'frame_type_subtype' in chunk.columns:
+        flags = {'1': 1, 'True': 1, '0': 0, 'False': 0}
+        columns['wlan_header_length'] = wlan_header_length(
+            _parse_int(chunk['frame_type_subtype'], np.int64), _parse_int(header['fc_ds'], np.int64),
+            header['fc_order'].map(flags).fillna(0).to_numpy(),
+        ).astype(dtype_of('wlan_header_length'))
+    for name in chunk.columns:
+        values = chunk[name]
+        kind = SCHEMA[name]
+        dtype = dtype_of(name)
+        if kind == 'category':
+            if name == 'bandwidth':
+                values = values.replace('0', '20 MHz')
+            categorical = pd.Categorical(values)
+            columns[name] = categorical.codes.astype(dtype)
+            categories[name] = list(categorical.categories)
+        elif kind == 'flag':
+            flags = values.map({'1': 1, 'True': 1, '0': 0, 'False': 0})
+            columns[name] = flags.fillna(MISSING_INT).astype(dtype).to_numpy()
+        elif kind == 'time':
+            columns[name] = _parse_time(values)
+        elif kind.startswith('float'):
+            columns[name] = pd.to_numeric(values, errors='coerce').astype(dtype).to_numpy()
+        else:
+            columns[name] = _parse_int(values, dtype)
+
+    # same fallback as the pyshark path when there is no data layer: frame - radiotap - 802.11 header
+    if 'payload_length' in columns and 'frame_length' in columns:
+        payload = columns['payload_length']
+        computed = columns['frame_length'].astype(np.int64)
+        for header in ('radiotap_length', 'wlan_header_length'):
+            if header in columns:
+                computed -= np.maximum(columns[header], 0)
+        missing = (payload == MISSING_INT) & (columns['frame_length'] != MISSING_INT)
+        columns['payload_length'] = np.where(missing, np.maximum(computed, 0), payload).astype(payload.dtype)
+    return PacketTable(columns, categories)
+
+
+@instrumentation.instrumented("tshark")
+def read_fields(pcap_file: str, fields: dict, display_filter: str = None, tshark: str = "tshark", columns=None) -> PacketTable:
+    """
+    Runs tshark once over pcap_file and loads the requested fields.
+
+    Args:
+        pcap_file (str): path to the pcap file
+        fields (dict): PacketTable column -> tshark field name
+        display_filter (str): optional tshark display filter (-Y)
+        columns (list): columns of the returned table (defaults to all of SCHEMA)
+
+    Returns:
+        PacketTable: one row per packet, columns without a tshark field are left missing
+
+    Raises:
+        TsharkError: tshark is not installed or failed (e.g. a field unknown to this tshark version)
+    """
+    if not tshark_available(tshark):
+        raise TsharkError(f"{tshark} not found on PATH")
+    # stderr goes to a file so a chatty tshark cannot block on a full pipe while we read stdout
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        build_command(pcap_file, fields, display_filter, tshark),
+        stdout=subprocess.PIPE, stderr=stderr, text=True, encoding='utf-8', errors='replace'
+    )
+    tables = []
+    try:
+        reader = pd.read_csv(
+            process.stdout, sep='\t', header=None, names=list(fields), dtype=str,
+            keep_default_na=False, na_values=[''], quoting=csv.QUOTE_NONE, chunksize=CHUNK_ROWS,
+        )
+        for chunk in reader:
+            tables.append(_chunk_to_table(chunk))
+    except pd.errors.EmptyDataError:
+        pass
+    finally:
+        process.stdout.close()
+        process.wait()
+        stderr.seek(0)
+        message = stderr.read().decode('utf-8', 'replace').strip()
+        stderr.close()
+    if process.returncode != 0:
+        raise TsharkError(f"tshark exited with {process.returncode}: {message}")
+    table = PacketTable.concat(tables) if tables else PacketTableBuilder(name for name in fields if name in SCHEMA).build()
+    return table.ensure_columns(SCHEMA if columns is None else columns)
@@ -1,97 +1,373 @@
-import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 from datetime import datetime
 from collections import deque, defaultdict
 import math
+from instrumentation import instrumented, stage
+from packet_table import as_packet_table, MISSING_INT, MISSING_TIME
+from sketches import MetricSketches, PERCENTILES, percentile_columns
+from windowing import window_aggregates, aggregate_windows, segment_window_bounds
 
 MAX_DURATION_S = 30
+WINDOW_SIZE_S = 2
+LINK_COLUMNS = {
+    'ta_ra': ['transmitter_mac', 'receiver_mac'],
+    'bssid_station': ['bssid', 'station'],
+}
+PENALTY_SLOPE = 0.07 #0.07 is empirical, anything between 0.05 and 0.07 is good. We use 0.07 here because we need to be a little harsh when it comes to real time applications
+PENALTY_FLOOR = 0.3
+RSSID_RESOLUTION_S = 1.0  # time bucket of the RSSID series, the per-window RSSID is built from these
+
+# pandas and matplotlib (plotting.py) are imported where tables are exported / plots drawn,
+# so menus, catalog lookups and --help do not pay for them
 
 # === Metric Calculations ===
 def compute_frame_loss(packets):
     total = len(packets)
-    retries = sum(1 for pkt in packets if pkt.get('retry_flag') == '1')
+    retries = int(np.count_nonzero(packets['retry_flag'] == 1))
     return retries / total if total > 0 else 0
 
 def compute_rssi_avg(packets):
-    rssi_values = []
-    for pkt in packets:
-        try:
-            rssi = int(pkt['signal_strength'])
-            rssi_values.append(rssi)
-        except (TypeError, ValueError):
-            continue
-    return sum(rssi_values) / len(rssi_values) if rssi_values else None
+    rssi_values = packets['signal_strength']
+    rssi_values = np.trunc(rssi_values[~np.isnan(rssi_values)])
+    return float(rssi_values.mean(dtype=np.float64)) if len(rssi_values) else None
 
 def compute_data_rate_avg(packets):
-    rates = [float(pkt['data_rate']) for pkt in packets if pkt.get('data_rate')]
-    return sum(rates) / len(rates) if rates else None
+    rates = packets['data_rate']
+    rates = rates[~np.isnan(rates)]
+    return float(rates.mean()) if len(rates) else None
 
 def compute_rate_gap_avg(packets):
-    gaps = [int(pkt['rate_gap']) for pkt in packets if pkt.get('rate_gap') is not None]
-    return sum(gaps) / len(gaps) if gaps else None
+    gaps = packets['rate_gap']
+    gaps = gaps[~np.isnan(gaps)]
+    return float(gaps.mean(dtype=np.float64)) if len(gaps) else None
+
+def compute_metric_percentiles(packets, percentiles=PERCENTILES):
+    # p5 / p50 / p95 ... of RSSI, rate and rate gap next to the means above, see sketches.py
+    sketches = MetricSketches()
+    sketches.update(packets)
+    return sketches.percentiles(percentiles)
+
+def compute_length_avg(packets, key):
+    lengths = packets[key]
+    lengths = lengths[lengths != MISSING_INT]
+    return float(lengths.mean(dtype=np.float64)) if len(lengths) else None
 
 def compute_rate_gap_penalty(gap):
     if gap is None:
         return 1.0
-    penalty_slope = 0.07 #0.07 is empirical, anything between 0.05 and 0.07 is good. We use 0.07 here because we need to be a little harsh when it comes to real time applications
-    penalty = max(0.3, 1 - penalty_slope * gap) 
+    penalty = max(PENALTY_FLOOR, 1 - PENALTY_SLOPE * gap) 
     return penalty
 
 # === RSSID Logic ===
-def update_rssi(ssid, channel, new_rssi, timestamp, rssi_history, last_activity, window_size):
-    key = (ssid, channel)
-    if key not in rssi_history:
-        rssi_history[key] = deque(maxlen=window_size)
-    rssi_history[key].append((new_rssi, timestamp))
-    last_activity[key] = timestamp
-    return compute_wma(key, rssi_history)
-
-def compute_wma(key, rssi_history):
-    rssi_tuples = list(rssi_history[key])
-    rssi_values = [rssi for rssi, _ in rssi_tuples]
-    n = len(rssi_values)
-    if n == 0:
-        return None
-    weights = [i + 1 for i in range(n)]
-    wma = sum(rssi * weight for rssi, weight in zip(rssi_values, weights)) / sum(weights)
-    return round(wma, 2)
-
-def compute_weight(key, current_ts, last_activity, decay_rate):
-    last_seen = float(last_activity.get(key, current_ts))
-    elapsed = (float(current_ts) - last_seen) / 1e6
-    return math.exp(-decay_rate * elapsed)
-
-def compute_rssid_per_channel(ts, rssi_history, last_activity, decay_rate):
-    rssid_per_channel = defaultdict(float)
-    for (ssid, channel), _ in rssi_history.items():
-        wma = compute_wma((ssid, channel), rssi_history)
-        if wma is not None and wma != 0:
-            weight = compute_weight((ssid, channel), ts, last_activity, decay_rate)
-            rssid_per_channel[channel] += (1 / abs(wma)) * weight
-    return dict(rssid_per_channel)
+class RssidTracker:
+    """
+    Incremental RSSID per channel.
 
-def compute_rssid_log(packets, decay_rate=0.1, window_size=10):  #decay rate here is also empirical, we changed it from 0.5 to 0.1 since we care more about real time data
-    rssi_history = {}
-    last_activity = {}
-    rssid_log = []
+    RSSID(channel, ts) = sum over the (ssid, channel) keys of (1 / |wma|) * exp(-decay_rate * (ts - last_seen) / 1e6),
+    with wma the weighted moving average (weights 1..n, oldest first) of the key's last window_size RSSI values.
+    Each update touches only the key that changed: the WMA comes from a running sum and running weighted sum,
+    and the per channel sum is kept relative to a reference time so the decay is applied once, at query time.
+    """
+    # re-anchor the reference time before exp() of the decay exponent can overflow
+    MAX_EXPONENT = 50.0
+
+    def __init__(self, decay_rate=0.1, window_size=10):
+        self.decay_rate = decay_rate
+        self.window_size = window_size
+        self.reference_ts = None
+        self._values = {}        # key -> deque of the last window_size rssi values
+        self._sums = {}          # key -> [sum, weighted sum]
+        self._contribution = {}  # key -> (1 / |wma|) * exp(decay_rate * (last_seen - reference_ts) / 1e6)
+        self._channel_sum = {}   # channel -> sum of its keys' contributions
+        self._active = defaultdict(int)  # channel -> number of keys with a non zero WMA
+        self._order = {}         # key -> first seen position, the log lists channels in this order
+        self._channels = []
+
+    def _scale(self, ts):
+        return self.decay_rate * (ts - self.reference_ts) / 1e6
+
+    def _rebase(self, ts):
+        factor = math.exp(-self._scale(ts))
+        for key in self._contribution:
+            self._contribution[key] *= factor
+        for channel in self._channel_sum:
+            self._channel_sum[channel] *= factor
+        self.reference_ts = ts
+
+    def wma(self, key):
+        values = self._values.get(key)
+        if not values:
+            return None
+        n = len(values)
+        return round(self._sums[key][1] / (n * (n + 1) / 2), 2)
+
+    def update(self, ssid, channel, rssi, ts):
+        """Adds one RSSI sample of (ssid, channel) seen at ts (seconds), returns the key's new WMA."""
+        key = (ssid, channel)
+        if self.reference_ts is None:
+            self.reference_ts = ts
+        elif abs(self._scale(ts)) > self.MAX_EXPONENT:
+            self._rebase(ts)
+
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = deque(maxlen=self.window_size)
+            self._sums[key] = [0, 0]
+            self._order[key] = len(self._order)
+        sums = self._sums[key]
+        if len(values) == self.window_size:
+            # every remaining weight drops by one and the oldest value leaves
+            sums[1] += self.window_size * rssi - sums[0]
+            sums[0] += rssi - values[0]
+        else:
+            sums[1] += (len(values) + 1) * rssi
+            sums[0] += rssi
+        values.append(rssi)
+
+        wma = self.wma(key)
+        contribution = (1 / abs(wma)) * math.exp(self._scale(ts)) if wma else None
+        previous = self._contribution.pop(key, None)
+        if previous is not None:
+            self._channel_sum[channel] -= previous
+            self._active[channel] -= 1
+        if contribution is not None:
+            self._contribution[key] = contribution
+            self._channel_sum[channel] = self._channel_sum.get(channel, 0.0) + contribution
+            self._active[channel] += 1
+        if (previous is None) != (contribution is None):
+            if not self._active[channel]:
+                self._channel_sum.pop(channel, None)
+            self._channels = self._ordered_channels()
+        return wma
+
+    def rssid(self, channel, ts):
+        """RSSID of channel at ts, None when no key with a non zero WMA was seen on it."""
+        total = self._channel_sum.get(channel)
+        if total is None:
+            return None
+        return total * math.exp(-self._scale(ts))
+
+    def _ordered_channels(self):
+        # only runs when a key starts or stops counting, not per packet
+        first = {}
+        for key in sorted(self._contribution, key=self._order.get):
+            first.setdefault(key[1], None)
+        return list(first)
+
+    def channels(self):
+        """Channels with an RSSID, in the order of their first key."""
+        return list(self._channels)
+
+    def snapshot(self, ts):
+        """{channel: RSSID at ts} for every channel."""
+        if not self._channels:
+            return {}
+        factor = math.exp(-self._scale(ts))
+        return {channel: self._channel_sum[channel] * factor for channel in self._channels}
+
+class _BucketArrays:
+    """The buckets of one channel as arrays sorted by time, grown in place as samples arrive."""
+    __slots__ = ('length', 'last_bucket', 'times', 'sums', 'counts', 'lasts')
+
+    def __init__(self, capacity=64):
+        self.length = 0
+        self.last_bucket = None
+        self.times = np.empty(capacity)
+        self.sums = np.empty(capacity)
+        self.counts = np.empty(capacity)
+        self.lasts = np.empty(capacity)
+
+    @classmethod
+    def from_buckets(cls, buckets, resolution):
+        arrays = cls(max(64, 2 * len(buckets)))
+        for bucket in sorted(buckets):
+            arrays.set(bucket, buckets[bucket], resolution)
+        return arrays
 
-    for pkt in packets:
-        ssid = pkt.get('ssid')
-        channel = pkt.get('channel')
-        rssi = pkt.get('signal_strength')
-        sniff_time = pkt.get('sniff_time')
-
-        if ssid and rssi is not None and channel and sniff_time:
-            try:
-                rssi = int(rssi)
-                channel = int(channel)
-                timestamp = sniff_time.timestamp()  # use sniff_time as float timestamp
-                update_rssi(ssid, channel, rssi, timestamp, rssi_history, last_activity, window_size)
-                rssid_values = compute_rssid_per_channel(timestamp, rssi_history, last_activity, decay_rate)
-                for ch, value in rssid_values.items():
-                    rssid_log.append((timestamp, ch, value))
-            except Exception:
+    def set(self, bucket, entry, resolution):
+        """Patches the last bucket or appends a later one."""
+        if bucket != self.last_bucket:
+            if self.length == len(self.times):
+                for name in ('times', 'sums', 'counts', 'lasts'):
+                    grown = np.empty(2 * self.length)
+                    grown[:self.length] = getattr(self, name)
+                    setattr(self, name, grown)
+            self.times[self.length] = bucket * resolution
+            self.length += 1
+            self.last_bucket = bucket
+        i = self.length - 1
+        self.sums[i] = entry[0]
+        self.counts[i] = entry[1]
+        self.lasts[i] = entry[4]
+
+    def drop_before(self, time):
+        dropped = int(np.searchsorted(self.times[:self.length], time, 'left'))
+        if dropped:
+            kept = self.length - dropped
+            for array in (self.times, self.sums, self.counts, self.lasts):
+                array[:kept] = array[dropped:self.length]
+            self.length = kept
+
+    def views(self):
+        n = self.length
+        return self.times[:n], self.sums[:n], self.counts[:n], self.lasts[:n]
+
+
+class RssidSeries:
+    """
+    RSSID of every channel aggregated over time buckets of `resolution` seconds: sum / count
+    (mean), min, max and the last value of the bucket. Memory grows with the capture duration
+    over the resolution, not with the number of SSID frames like the per-frame RSSID log, and
+    stays bounded when the consumer prune()s the buckets it no longer needs (live mode).
+    """
+
+    def __init__(self, resolution=RSSID_RESOLUTION_S):
+        self.resolution = resolution
+        self._buckets = {}  # channel -> {bucket index: [sum, count, min, max, last]}
+        self._arrays = {}   # channel -> _BucketArrays, built on first use and then kept up to date
+        self._pruned = {}   # channel -> [sum, count] of the pruned buckets, so mean() still covers them
+
+    def add(self, channel, timestamp, value):
+        buckets = self._buckets.get(channel)
+        if buckets is None:
+            buckets = self._buckets[channel] = {}
+        bucket = math.floor(timestamp / self.resolution)
+        entry = buckets.get(bucket)
+        if entry is None:
+            entry = buckets[bucket] = [value, 1, value, value, value]
+        else:
+            entry[0] += value
+            entry[1] += 1
+            if value < entry[2]:
+                entry[2] = value
+            if value > entry[3]:
+                entry[3] = value
+            entry[4] = value
+        arrays = self._arrays.get(channel)
+        if arrays is not None:
+            if arrays.last_bucket is not None and bucket < arrays.last_bucket:
+                del self._arrays[channel]  # out of order sample, rebuilt on the next query
+            else:
+                arrays.set(bucket, entry, self.resolution)
+
+    def add_snapshot(self, timestamp, snapshot):
+        """RssidTracker.snapshot() output, the RSSID of every channel at timestamp."""
+        for channel, value in snapshot.items():
+            self.add(channel, timestamp, value)
+
+    def prune(self, before):
+        """
+        Drops the buckets that start before `before` (seconds), except the last one of each channel
+        which window_values() carries into later windows without samples. Queries of windows that
+        start at or after `before` give the same result as without pruning, mean() still counts
+        the dropped buckets, rows() no longer lists them.
+        """
+        cutoff = math.floor(before / self.resolution)
+        for channel, buckets in self._buckets.items():
+            old = sorted(bucket for bucket in buckets if bucket < cutoff)[:-1]
+            if not old:
                 continue
+            pruned = self._pruned.setdefault(channel, [0.0, 0])
+            for bucket in old:
+                entry = buckets.pop(bucket)
+                pruned[0] += entry[0]
+                pruned[1] += entry[1]
+            arrays = self._arrays.get(channel)
+            if arrays is not None:
+                arrays.drop_before((old[-1] + 1) * self.resolution)
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._buckets.values())
+
+    def channels(self):
+        return list(self._buckets)
+
+    def mean(self, channel):
+        """Mean over the whole series, what compute_avg_rssid() gives for the per-frame log."""
+        entries = self._buckets.get(channel, {}).values()
+        total, count = self._pruned.get(channel, (0.0, 0))
+        count += sum(entry[1] for entry in entries)
+        return (total + sum(entry[0] for entry in entries)) / count if count else 0
+
+    def _channel_arrays(self, channel):
+        arrays = self._arrays.get(channel)
+        if arrays is None:
+            arrays = self._arrays[channel] = _BucketArrays.from_buckets(self._buckets.get(channel, {}), self.resolution)
+        return arrays.views()
+
+    def window_values(self, channel, starts, ends):
+        """
+        RSSID of channel in each [start, end) (seconds, same clock as the samples): the mean of the
+        buckets starting inside the window. A window without samples keeps the last value before it,
+        or the mean of the whole series when there is none (0 without any sample on the channel).
+        """
+        times, sums, counts, lasts = self._channel_arrays(channel)
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        if not len(times):
+            return np.zeros(len(starts))
+        lo = np.searchsorted(times, starts, 'left')
+        hi = np.searchsorted(times, ends, 'left')
+        cumulative_sums = np.concatenate([[0.0], np.cumsum(sums)])
+        cumulative_counts = np.concatenate([[0.0], np.cumsum(counts)])
+        window_sums = cumulative_sums[hi] - cumulative_sums[lo]
+        window_counts = cumulative_counts[hi] - cumulative_counts[lo]
+        carried = np.where(lo > 0, lasts[np.maximum(lo - 1, 0)], cumulative_sums[-1] / cumulative_counts[-1])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(window_counts > 0, window_sums / window_counts, carried)
+
+    def link_rssid(self, channel, origin_s):
+        """Per-window RSSID callable for compute_link_windows(): windows relative to origin_s."""
+        return lambda starts, ends: self.window_values(channel, origin_s + np.asarray(starts), origin_s + np.asarray(ends))
+
+    def rows(self):
+        """(timestamp, channel, mean, min, max, last, samples) per bucket, in time order."""
+        rows = [(bucket * self.resolution, channel, entry[0] / entry[1], entry[2], entry[3], entry[4], entry[1])
+                for channel, buckets in self._buckets.items() for bucket, entry in buckets.items()]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+
+def _rssid_samples(packets, decay_rate, window_size):
+    # (timestamp, RSSID snapshot of every channel) after each usable SSID frame
+    tracker = RssidTracker(decay_rate, window_size)
+    packets = as_packet_table(packets)
+    ssids = packets.categories.get('ssid', [])
+    ssid_codes = packets['ssid']
+    channels = packets['channel']
+    rssis = packets['signal_strength']
+    sniff_times = packets['sniff_time']
+    usable = (ssid_codes >= 0) & ~np.isnan(rssis) & (channels != MISSING_INT) & (sniff_times != MISSING_TIME)
+
+    for i in np.flatnonzero(usable):
+        ssid = ssids[ssid_codes[i]]
+        if not ssid:
+            continue
+        timestamp = int(sniff_times[i]) / 1e9  # use sniff_time as float timestamp
+        tracker.update(ssid, int(channels[i]), int(rssis[i]), timestamp)
+        yield timestamp, tracker.snapshot(timestamp)
+
+
+@instrumented("rssid", table_arg=0)
+def compute_rssid_series(packets, decay_rate=0.1, window_size=10, resolution=RSSID_RESOLUTION_S):
+    """
+    The RSSID of compute_rssid_log() folded into an RssidSeries as it is computed, the log itself is never built.
+
+    Returns:
+        RssidSeries: per-channel buckets of `resolution` seconds
+    """
+    series = RssidSeries(resolution)
+    for timestamp, snapshot in _rssid_samples(packets, decay_rate, window_size):
+        series.add_snapshot(timestamp, snapshot)
+    return series
+
+
+@instrumented("rssid_log", table_arg=0)
+def compute_rssid_log(packets, decay_rate=0.1, window_size=10):  #decay rate here is also empirical, we changed it from 0.5 to 0.1 since we care more about real time data
+    rssid_log = []
+    for timestamp, snapshot in _rssid_samples(packets, decay_rate, window_size):
+        for ch, value in snapshot.items():
+            rssid_log.append((timestamp, ch, value))
     return rssid_log
 
 
@@ -112,83 +388,292 @@ def compute_theoretical_throughput(rate, loss, gap=None, rssid=0.0, avg_payload=
 
     return rate * (1 - loss) * penalty * utilization_penalty * payload_efficiency
 
-def plot_metric(results, key, ylabel, title, filename):
-    times = [r['timestamp'] for r in results]
-    values = [r[key] for r in results]
-    #debug
-    #print(f"\n{key.upper()} values:")
-    #print(values)
-    plt.figure(figsize=(10, 5))
-    plt.plot(times, values, marker='o')
-    plt.title(title)
-    plt.xlabel("Time (seconds)")
-    plt.ylabel(ylabel)
-    plt.grid(True)
-    plt.savefig(filename)
-    plt.show()
-
-def run_analysis(packet_data):
-    filtered_packets = [
-        pkt for pkt in packet_data
-        if pkt.get('sniff_time') and pkt.get('signal_strength') is not None
-    ]
-    filtered_packets.sort(key=lambda pkt: pkt['sniff_time'])
-    start_time = filtered_packets[0]['sniff_time']
-    for pkt in filtered_packets:
-        pkt['timestamp'] = (pkt['sniff_time'] - start_time).total_seconds()
-    filtered_packets = [pkt for pkt in filtered_packets if isinstance(pkt['timestamp'], (float, int)) and pkt['timestamp'] <= 30]
-    if not filtered_packets:
-        print("No packets after filtering for 30s window.")
-        return
-
-    print("\n[INFO] Computing RSSID log internally...")
-    rssid_log = compute_rssid_log(packet_data)
-    channel = int(filtered_packets[0]['channel']) if 'channel' in filtered_packets[0] else 1
-    avg_rssid = compute_avg_rssid(rssid_log, channel)
-
-    WINDOW_SIZE_S = 2
-    end_time = filtered_packets[-1]['timestamp']
-    current_start = 0
-    current_end = current_start + WINDOW_SIZE_S
+def compute_theoretical_throughput_array(rate, loss, gap, rssid, avg_payload, avg_total,
+                                         penalty_slope=PENALTY_SLOPE, penalty_floor=PENALTY_FLOOR):
+    """
+    compute_theoretical_throughput() over arrays of windows, NaN plays the role of None.
+    All arguments broadcast, e.g. penalty_slope shaped (configurations, 1) gives one row of
+    windows per configuration (see param_sweep.py).
+    """
+    penalty = np.where(np.isnan(gap), 1.0, np.maximum(penalty_floor, 1 - penalty_slope * np.nan_to_num(gap)))
+    utilization_penalty = 1 - np.minimum(rssid, 1.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        payload_efficiency = np.where(~np.isnan(avg_payload) & (avg_total > 0), avg_payload / avg_total, 1.0)
+    return rate * (1 - loss) * penalty * utilization_penalty * payload_efficiency
+
+def compute_link_windows(filtered_packets, timestamps, rssid, window_size=WINDOW_SIZE_S, step=None, max_duration=MAX_DURATION_S,
+                         percentiles=None):
+    """
+    Windowed metrics of one link.
+
+    Args:
+        filtered_packets (PacketTable): link frames sorted by sniff_time
+        timestamps (numpy.ndarray): their times in seconds since the first one
+        rssid: RSSID of the link's channel used for the utilization penalty, a float for every
+            window or a callable (window starts, window ends) -> per-window values (RssidSeries.link_rssid())
+        percentiles (list): also report these percentiles of RSSI, rate and rate gap per window (rssi_p5, ...)
+
+    Returns:
+        tuple: (aggregates dict from windowing.window_aggregates plus the per-window 'rssid',
+            list of result rows for the non-empty windows)
+    """
+    windows = window_aggregates(filtered_packets, timestamps, window_size, step, max_duration, percentiles)
+    windows['rssid'] = rssid(windows['start'], windows['end']) if callable(rssid) else np.full(len(windows['start']), float(rssid))
+    windows['theoretical_throughput'] = compute_theoretical_throughput_array(
+        windows['avg_rate'], windows['frame_loss'], windows['rate_gap'], windows['rssid'],
+        windows['avg_payload'], windows['avg_total'])
+
+    keys = ['avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap', 'theoretical_throughput']
+    keys += percentile_columns(percentiles) if percentiles else []
     results = []
+    for i in np.flatnonzero(windows['packets']):
+        results.append({
+            'timestamp': windows['end'][i].item(),
+            **{key: _none_if_nan(windows[key][i]) for key in keys}
+        })
+    return windows, results
+
+def _none_if_nan(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+def plot_metric(results, key, ylabel, title, filename):
+    # headless, see plotting.py
+    from plotting import metric_figure
+    metric_figure(results, key, ylabel, title).savefig(filename)
+
+def analyze_link(packet_data, rssid_packets=None, window_size=WINDOW_SIZE_S, step=None, max_duration=MAX_DURATION_S, verbose=True,
+                 rssid_resolution=RSSID_RESOLUTION_S, percentiles=None, sketches=None):
+    """
+    The computation of run_analysis() without any file output. Every window's throughput uses the
+    RSSID of the link's channel during that window.
+
+    Args:
+        percentiles (list): also report these percentiles of RSSI, rate and rate gap per window (rssi_p5, ...)
+        sketches (MetricSketches): when given, the link frames within max_duration are added to it
+
+    Returns:
+        tuple: (windows dict from compute_link_windows, result rows, RssidSeries), None when no packet is usable
+    """
+    packet_data = as_packet_table(packet_data)
+    usable = (packet_data['sniff_time'] != MISSING_TIME) & ~np.isnan(packet_data['signal_strength'])
+    filtered_packets = packet_data.take(usable).sort_by('sniff_time')
+    if len(filtered_packets) == 0:
+        if verbose:
+            print(f"No packets after filtering for {max_duration}s window.")
+        return None
+    sniff_times = filtered_packets['sniff_time']
+    timestamps = (sniff_times - sniff_times[0]) / 1e9
+    if sketches is not None:
+        sketches.update(filtered_packets if max_duration is None else filtered_packets.take(timestamps <= max_duration))
+
+    if verbose:
+        print("\n[INFO] Computing RSSID series internally...")
+    rssid_series = compute_rssid_series(packet_data if rssid_packets is None else rssid_packets, resolution=rssid_resolution)
+    channel = int(filtered_packets['channel'][0]) if filtered_packets['channel'][0] != MISSING_INT else 1
+    link_rssid = rssid_series.link_rssid(channel, int(sniff_times[0]) / 1e9)
+
+    with stage("windows", frames_in=len(filtered_packets)) as record:
+        windows, results = compute_link_windows(filtered_packets, timestamps, link_rssid, window_size, step, max_duration,
+                                                percentiles)
+        record.frames_out = len(results)
+    if verbose:
+        for start, end, count in zip(windows['start'], windows['end'], windows['packets']):
+            print(f"Window {start:.2f}–{end:.2f}s: {count} packets")
+    return windows, results, rssid_series
+
+def link_ids(packets, group_by='ta_ra'):
+    """
+    Link of every frame.
+
+    Args:
+        packets (PacketTable): extracted frames
+        group_by (str): 'ta_ra' -> (transmitter, receiver) pairs, one per direction,
+            'bssid_station' -> (BSSID, station), both directions of a station together,
+            group addressed frames belong to no link
+
+    Returns:
+        tuple: (link index per frame, -1 when a MAC is missing, list of link tuples)
+    """
+    if group_by == 'ta_ra':
+        first = packets['transmitter_mac']
+        second = packets['receiver_mac']
+        names = (packets.categories['transmitter_mac'], packets.categories['receiver_mac'])
+    elif group_by == 'bssid_station':
+        # transmitter, receiver and BSSID codes moved onto one list of MACs so they compare directly,
+        # a BSSID that is neither is -2 and never equals a (missing, -1) transmitter
+        macs = list(dict.fromkeys(packets.categories['transmitter_mac'] + packets.categories['receiver_mac']))
+        position = {mac: i for i, mac in enumerate(macs)}
+        def mac_codes(name, other=MISSING_INT):
+            return np.array([position.get(mac, other) for mac in packets.categories[name]] + [MISSING_INT],
+                            dtype=np.int64)[packets[name]]
+        transmitter = mac_codes('transmitter_mac')
+        receiver = mac_codes('receiver_mac')
+        first = packets['bssid']
+        station = np.where(transmitter == mac_codes('bssid', -2), receiver, transmitter)
+        # stations numbered in order of appearance
+        seen, first_seen = np.unique(station[station >= 0], return_index=True)
+        stations = seen[np.argsort(first_seen)]
+        # broadcast / multicast receivers are not stations
+        group_addressed = np.array([int(macs[i][1], 16) & 1 == 1 for i in stations.tolist()], dtype=bool)
+        numbers = np.full(len(macs) + 1, MISSING_INT, dtype=np.int64)
+        numbers[stations] = np.where(group_addressed, MISSING_INT, np.arange(len(stations)))
+        second = numbers[station]
+        names = (packets.categories['bssid'], [macs[i] for i in stations.tolist()])
+    else:
+        raise ValueError(f"unknown group_by {group_by!r}, expected one of {sorted(LINK_COLUMNS)}")
+
+    valid = (first >= 0) & (second >= 0)
+    keys = first.astype(np.int64) * (len(names[1]) + 1) + second
+    unique_keys, inverse = np.unique(keys[valid], return_inverse=True)
+    ids = np.full(len(packets), MISSING_INT, dtype=np.int64)
+    ids[valid] = inverse
+    links = [(names[0][key // (len(names[1]) + 1)], names[1][key % (len(names[1]) + 1)]) for key in unique_keys]
+    return ids, links
+
+@instrumented("links", table_arg=0)
+def analyze_links(packet_data, rssid_packets=None, subtype="0x0028", group_by='ta_ra', window_size=WINDOW_SIZE_S,
+                  step=None, max_duration=MAX_DURATION_S, min_packets=1, rssid_resolution=RSSID_RESOLUTION_S,
+                  percentiles=None, sketches=None):
+    """
+    analyze_link() for every link of the capture at once: one sort by (link, time) and one
+    reduceat pass over all the windows of all links. Every link gets its own time origin
+    (its first frame) and, per window, the RSSID of its own channel.
+
+    Args:
+        packet_data (PacketTable): all extracted frames (with the beacons for the RSSID)
+        rssid_packets (PacketTable): frames for the RSSID estimate (defaults to packet_data)
+        subtype (str): frame subtype the links are built from (None = every frame)
+        group_by (str): 'ta_ra' or 'bssid_station', see link_ids()
+        min_packets (int): links with fewer usable frames are left out
+        percentiles (list): also report these percentiles of RSSI, rate and rate gap per window (rssi_p5, ...)
+        sketches (dict): when given, filled with link tuple -> MetricSketches of the link frames
+            within max_duration, to be merged with other slices / captures
+
+    Returns:
+        pandas.DataFrame: one row per link and non-empty window
+    """
+    import pandas as pd
+    packet_data = as_packet_table(packet_data)
+    ids, links = link_ids(packet_data, group_by)
+    usable = (ids >= 0) & (packet_data['sniff_time'] != MISSING_TIME) & ~np.isnan(packet_data['signal_strength'])
+    if subtype:
+        usable &= packet_data.equals('frame_type_subtype', subtype)
+    link_sizes = np.bincount(ids[usable], minlength=len(links))
+    usable[usable] = link_sizes[ids[usable]] >= min_packets
+    order = np.flatnonzero(usable)
+    order = order[np.lexsort((packet_data['sniff_time'][order], ids[order]))]
+    frames = packet_data.take(order)
+    ids = ids[order]
+
+    boundaries = np.flatnonzero(np.diff(ids)) + 1
+    segment_starts = np.concatenate([[0], boundaries]).astype(np.intp) if len(ids) else np.empty(0, dtype=np.intp)
+    segment_ends = np.append(boundaries, len(ids)).astype(np.intp) if len(ids) else np.empty(0, dtype=np.intp)
+    sniff_times = frames['sniff_time']
+    origins = np.repeat(sniff_times[segment_starts], segment_ends - segment_starts)
+    timestamps = (sniff_times - origins) / 1e9
+
+    group, starts, lo, hi = segment_window_bounds(timestamps, segment_starts, segment_ends, window_size, step, max_duration)
+    windows = aggregate_windows(frames, starts, lo, hi, window_size, percentiles)
+    if sketches is not None:
+        for link, first, last in zip(ids[segment_starts].tolist(), segment_starts, segment_ends):
+            in_range = timestamps[first:last] <= max_duration if max_duration is not None else slice(None)
+            sketches[links[link]] = MetricSketches()
+            sketches[links[link]].update(frames.take(np.arange(first, last)[in_range]))
+
+    # per-window RSSID of the channel each link started on, looked up once per channel
+    rssid_series = compute_rssid_series(packet_data if rssid_packets is None else rssid_packets, resolution=rssid_resolution)
+    first_channels = frames['channel'][segment_starts]
+    link_channels = np.where(first_channels != MISSING_INT, first_channels, 1)
+    window_channels = link_channels[group]
+    window_origins = sniff_times[segment_starts][group] / 1e9
+    window_rssid = np.zeros(len(group))
+    for channel in np.unique(window_channels).tolist():
+        on_channel = window_channels == channel
+        window_rssid[on_channel] = rssid_series.window_values(
+            channel, window_origins[on_channel] + windows['start'][on_channel],
+            window_origins[on_channel] + windows['end'][on_channel])
+    windows['theoretical_throughput'] = compute_theoretical_throughput_array(
+        windows['avg_rate'], windows['frame_loss'], windows['rate_gap'], window_rssid,
+        windows['avg_payload'], windows['avg_total'])
+
+    non_empty = windows['packets'] > 0
+    link_index = ids[segment_starts][group][non_empty]
+    first_column, second_column = LINK_COLUMNS[group_by]
+    return pd.DataFrame({
+        first_column: [links[i][0] for i in link_index],
+        second_column: [links[i][1] for i in link_index],
+        'channel': link_channels[group][non_empty],
+        'window_start': windows['start'][non_empty],
+        'timestamp': windows['end'][non_empty],
+        'packets': windows['packets'][non_empty],
+        **{key: windows[key][non_empty] for key in ('avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap', 'theoretical_throughput')},
+        **{key: windows[key][non_empty] for key in (percentile_columns(percentiles) if percentiles else [])},
+    })
+
+def run_links_analysis(packet_data, rssid_packets=None, subtype="0x0028", group_by='ta_ra', window_size=WINDOW_SIZE_S,
+                       step=None, max_duration=MAX_DURATION_S, min_packets=1, output_format="csv", percentiles=None):
+    """
+    Multi-link mode of run_analysis(): every link of packet_data (all extracted frames, not the
+    output of filter_for_1_2) in one tidy table saved to wifi_links_summary.csv (or .parquet / .arrow
+    with output_format).
+
+    Returns:
+        pandas.DataFrame: see analyze_links()
+    """
+    summary = analyze_links(packet_data, rssid_packets, subtype, group_by, window_size, step, max_duration, min_packets,
+                            percentiles=percentiles)
+    first_column, second_column = LINK_COLUMNS[group_by]
+    links = summary.groupby([first_column, second_column], sort=False)
+    print(f"[INFO] {links.ngroups} links, {len(summary)} windows")
+    for (first, second), rows in links:
+        print(f"{first_column} {first}, {second_column} {second}: {len(rows)} windows, {rows['packets'].sum()} packets, "
+              f"mean throughput {rows['theoretical_throughput'].mean():.2f} Mbps")
+    with stage("export", frames_in=len(summary)):
+        from output_writers import open_writer
+        with open_writer("wifi_links_summary", list(summary.columns), output_format) as writer:
+            writer.write_frame(summary)
+    print(f"Saved metrics to {writer.path}")
+    return summary
+
+def run_analysis(packet_data, rssid_packets=None, window_size=WINDOW_SIZE_S, step=None, max_duration=MAX_DURATION_S, plots=True,
+                 output_format="csv", rssid_resolution=RSSID_RESOLUTION_S, percentiles=None):
+    """
+    Args:
+        packet_data (PacketTable): the link frames to analyze (output of filter_for_1_2)
+        rssid_packets (PacketTable): frames used for the RSSID / channel utilization estimate,
+            they need the beacons (defaults to packet_data)
+        window_size (float): window length in seconds
+        step (float): distance between window starts, defaults to window_size (hopping windows)
+        max_duration (float): analyze only this many seconds after the first packet (None = all)
+        plots: False / None skips the plots, True or "combined" saves every metric in one figure
+            (wifi_metrics.png), "separate" saves one image per metric (rssi_plot.png, ...)
+        output_format (str): "csv", "parquet" or "arrow" for wifi_analysis_summary / rssid_series
+            (see output_writers)
+        rssid_resolution (float): seconds per bucket of the RSSID series
+        percentiles (list): add these percentiles of RSSI, rate and rate gap to every window, e.g. (5, 50, 95)
+
+    Returns:
+        list: one dict per non-empty window (None when no packet is usable)
+    """
+    analysis = analyze_link(packet_data, rssid_packets, window_size, step, max_duration, rssid_resolution=rssid_resolution,
+                            percentiles=percentiles)
+    if analysis is None:
+        return None
+    _, results, rssid_series = analysis
+
+    with stage("export", frames_in=len(results)):
+        from output_writers import RSSID_SERIES_COLUMNS, SUMMARY_COLUMNS, write_rows
+        path = write_rows("wifi_analysis_summary", results, list(results[0]) if results else SUMMARY_COLUMNS, output_format)
+        print(f"Saved metrics to {path}")
+
+        # Save the RSSID series (per channel and time bucket) for reference
+        path = write_rows("rssid_series", rssid_series.rows(), RSSID_SERIES_COLUMNS, output_format)
+        print(f"Saved RSSID series to {path}")
 
-    while current_start < end_time:
-        window_packets = [pkt for pkt in filtered_packets if current_start <= pkt['timestamp'] < current_end]
-        print(f"Window {current_start:.2f}–{current_end:.2f}s: {len(window_packets)} packets")
-        if window_packets:
-            rssi = compute_rssi_avg(window_packets)
-            rate = compute_data_rate_avg(window_packets)
-            loss = compute_frame_loss(window_packets)
-            gap = compute_rate_gap_avg(window_packets)
-
-            payloads = [pkt['payload_length'] for pkt in window_packets if pkt.get('payload_length') is not None]
-            totals = [pkt['frame_length'] for pkt in window_packets if pkt.get('frame_length') is not None]
-
-            avg_payload = sum(payloads) / len(payloads) if payloads else None
-            avg_total = sum(totals) / len(totals) if totals else None
-
-            tput = compute_theoretical_throughput(rate, loss, gap, avg_rssid, avg_payload, avg_total)
-            results.append({
-                'timestamp': current_end,
-                'avg_rssi': rssi,
-                'avg_rate': rate,
-                'frame_loss': loss,
-                'rate_gap': gap,
-                'theoretical_throughput': tput
-            })
-        current_start += WINDOW_SIZE_S
-        current_end += WINDOW_SIZE_S
-
-    df = pd.DataFrame(results)
-    df.to_csv("wifi_analysis_summary.csv", index=False)
-    print("Saved metrics to wifi_analysis_summary.csv")
-
-    # Save RSSID log for reference
-    pd.DataFrame(rssid_log, columns=['timestamp', 'channel', 'rssid']).to_csv("rssid_log.csv", index=False)
-    print("Saved RSSID log to rssid_log.csv")
-
-    plot_metric(results, 'avg_rssi', "RSSI (dBm)", "Average RSSI Over Time", "rssi_plot.png")
-    plot_metric(results, 'avg_rate', "Data Rate (Mbps)", "Average Data Rate Over Time", "rate_plot.png")
-    plot_metric(results, 'frame_loss', "Frame Loss Rate", "Frame Loss Over Time", "loss_plot.png")
-    plot_metric(results, 'rate_gap', "Rate Gap", "Rate Gap Over Time", "rate_gap_plot.png")
-    plot_metric(results, 'theoretical_throughput', "Throughput (Mbps)", "Estimated Throughput Over Time", "throughput_plot.png")
+    if plots:
+        with stage("plots", frames_in=len(results)):
+            from plotting import render_metrics
+            for path in render_metrics(results, "combined" if plots is True else plots):
+                print(f"Saved plot to {path}")
+    return results
@@ -1,16 +1,33 @@
+import os
 import pathlib
-from parser_11n import extract_all_data as extract_all_data_11n, add_rate_gap as add_rate_gap_11n, filter_for_1_2 as filter_11n
-from parser_11ac import extract_all_data as extract_all_data_11ac, add_rate_gap as add_rate_gap_11ac, filter_for_1_2 as filter_11ac
-from wifi_analysis_engine import run_analysis
-
+import parser_11n
+import parser_11ac
+from wifi_analysis_engine import run_analysis, run_links_analysis
+from frame_filter import FrameFilter
+from capture_cache import CaptureCache, load_or_extract
+from packet_table import ANALYSIS_FIELDS
+from capture_catalog import CaptureCatalog, catalog_entry, describe
+
+# choice -> (parser module, parser name, TA, RA)
+PARSERS = {
+    "1": (parser_11n, "parser_all", "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31"),
+    "2": (parser_11ac, "parser_for_testings", "f8:aa:3f:92:dd:1b", "dc:e9:94:2a:68:31")
+}
 
 def get_parser_choice():
     print("\nSelect Parser:")
+    print("0) Auto - parser and busiest link picked from the capture catalog")
     print("1) parser_11n - 802.11n (for 2.4 GHz)")
     print("2) parser_11ac - 802.11ac (for 5 GHz)")
     print("3) Exit")
     return input("Enter your choice: ").strip()
 
+def get_link_mode():
+    print("\nAnalyze:")
+    print("1) the default link of the parser")
+    print("2) every station link (BSSID, station)")
+    return input("Enter your choice: ").strip()
+
 def get_pcap_file():
     print("\nAvailable PCAP files:")
     pcap_dir = pathlib.Path(__file__).parent / "pcap_files"
@@ -19,14 +36,18 @@ def get_pcap_file():
         print(f"[ERROR] Could not find directory: {pcap_dir}")
         return None
 
-    files = [f for f in pcap_dir.iterdir() if f.suffix in [".pcap", ".pcapng"]]
+    # packet count, duration, PHY, channels, SSIDs and busiest link of every capture,
+    # only new or changed files are scanned
+    catalog = CaptureCatalog(pcap_dir)
+    entries = catalog.refresh()
+    files = catalog.files()
 
     if not files:
         print("No .pcap files found in pcap_files/")
         return None
 
     for i, file in enumerate(files, 1):
-        print(f"{i}) {file.name}")
+        print(f"{i}) {file.name}  {describe(entries[file.name])}")
     try:
         choice = int(input("Select a file: "))
         return str(files[choice - 1])
@@ -36,41 +57,73 @@ def get_pcap_file():
 
 
 def run_wifi_doctor():
-    parser_map = {
-        "1": (extract_all_data_11n, "parser_all"),
-        "2": (extract_all_data_11ac, "parser_for_testings")
-    }
-
     parser_choice = get_parser_choice()
     if parser_choice == "3":
         print("Exiting...")
         return
 
-    if parser_choice not in parser_map:
+    auto = parser_choice == "0"
+    if parser_choice not in PARSERS and not auto:
         print("Invalid choice.")
         return
 
-    extract_func, parser_name = parser_map[parser_choice]
     pcap_path = get_pcap_file()
     if not pcap_path:
         return
 
-    print(f"\n[INFO] Running Wi-Fi Doctor using {parser_name} on {pcap_path}")
-    packets = extract_func(pcap_path)
+    if auto:
+        entry = catalog_entry(pcap_path)
+        if 'error' in entry:
+            print(f"[ERROR] Could not read {pcap_path}: {entry['error']}")
+            return
+        parser_choice = next(choice for choice, (parser, *_) in PARSERS.items() if parser.PHY == entry['parser'])
+    parser, parser_name, source_mac, dest_mac = PARSERS[parser_choice]
+    if auto and entry['busiest_link']:
+        source_mac, dest_mac = entry['busiest_link']['ta'], entry['busiest_link']['ra']
+    if auto:
+        print(f"[INFO] Catalog picked {parser_name}, busiest link {source_mac} -> {dest_mac}")
+
+    all_links = get_link_mode() == "2"
 
-    if(parser_choice==1):
-        packets = add_rate_gap_11n(packets)
-        filtered_packets = filter_11n(packets, "f8:aa:3f:92:dd:16", "dc:e9:94:2a:68:31", "0x0028")
-    else:
-        packets = add_rate_gap_11ac(packets)
-        filtered_packets = filter_11ac(packets, "f8:aa:3f:92:dd:1b", "dc:e9:94:2a:68:31", "0x0028")
-    
+    print(f"\n[INFO] Running Wi-Fi Doctor using {parser_name} on {pcap_path}")
+    if all_links:
+        # one decode of the capture, every link analyzed from it
+        frame_filter = FrameFilter(subtype="0x0028", keep_beacons=True)
+        packets = load_or_extract(pcap_path, parser, frame_filter=frame_filter, fields=ANALYSIS_FIELDS,
+                              cache=CaptureCache(), workers=os.cpu_count())
+        print("\n[INFO] Analyzing metrics of every link...")
+        run_links_analysis(packets, group_by='bssid_station')
+        print("\n[INFO] Wi-Fi Doctor analysis complete.")
+        return
 
+    # only the link frames (and the beacons for RSSID) get decoded
+    frame_filter = FrameFilter(source_mac, dest_mac, "0x0028", keep_beacons=True)
+    # extracted + rate-gap annotated table, reused from the on-disk cache on re-runs
+    packets = load_or_extract(pcap_path, parser, frame_filter=frame_filter, fields=ANALYSIS_FIELDS,
+                              cache=CaptureCache(), workers=os.cpu_count())
+    filtered_packets = parser.filter_for_1_2(packets, source_mac, dest_mac, "0x0028")
 
     print("\n[INFO] Analyzing metrics...")
-    run_analysis(filtered_packets)
+    run_analysis(filtered_packets, rssid_packets=packets)
     print("\n[INFO] Wi-Fi Doctor analysis complete.")
 
 
+def main():
+    # WIFIDOCTOR_METRICS=metrics.json saves the per-stage report, WIFIDOCTOR_PROFILE=1 adds the sampling profile
+    metrics_file = os.environ.get("WIFIDOCTOR_METRICS")
+    profile = os.environ.get("WIFIDOCTOR_PROFILE") == "1"
+    if not metrics_file and not profile:
+        run_wifi_doctor()
+        return
+
+    from instrumentation import Instrumentation
+    with Instrumentation(profile=profile) as instrumentation:
+        run_wifi_doctor()
+    instrumentation.print_summary()
+    if metrics_file:
+        instrumentation.write_json(metrics_file)
+        print(f"[INFO] Saved the stage metrics to {metrics_file}")
+
+
 if __name__ == "__main__":
-    run_wifi_doctor()
+    main()
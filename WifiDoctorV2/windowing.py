@@ -0,0 +1,226 @@
+"""
+Single-pass sliding window engine for run_analysis.
+
+Packets are sorted by time once, every window is an index range [lo, hi) found with
+searchsorted, and all per-window sums come out of one np.add.reduceat call per column,
+so the cost is O(packets + windows) instead of O(windows x packets).
+
+Percentiles come from per-window histograms (see sketches.py) counted with searchsorted over
+the packets grouped by bin, O(packets log packets + windows x occupied bins).
+"""
+import numpy as np
+from packet_table import MISSING_INT
+from sketches import METRICS, bin_count_quantiles, percentile_columns
+
+# windows x occupied bins counted at once when computing percentiles
+_BIN_COUNT_CELLS = 1 << 22
+
+
+def window_bounds(timestamps, window_size, step=None, max_duration=None):
+    """
+    Args:
+        timestamps (numpy.ndarray): sorted packet times in seconds since the first packet
+        window_size (float): window length in seconds
+        step (float): distance between window starts, smaller than window_size gives
+            overlapping windows (defaults to window_size, i.e. hopping windows)
+        max_duration (float): ignore packets later than this (None = no limit)
+
+    Returns:
+        tuple: (starts, lo, hi) arrays, the packets of window i are timestamps[lo[i]:hi[i]]
+    """
+    step = step or window_size
+    if max_duration is not None:
+        timestamps = timestamps[:np.searchsorted(timestamps, max_duration, side='right')]
+    if len(timestamps) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return np.empty(0), empty, empty
+    # same stopping rule as the old while loop: a window starts strictly before the last packet
+    count = int(np.ceil(timestamps[-1] / step)) if timestamps[-1] > 0 else 0
+    starts = np.arange(count) * step
+    lo = np.searchsorted(timestamps, starts, side='left')
+    hi = np.searchsorted(timestamps, starts + window_size, side='left')
+    return starts, lo, hi
+
+
+def window_sums(values, lo, hi):
+    """
+    Sum of values[lo[i]:hi[i]] for every window in a single reduceat pass,
+    overlapping windows included.
+    """
+    if len(lo) == 0:
+        return np.empty(0, dtype=values.dtype)
+    # reduceat needs every index < len(values), the trailing 0 makes hi == len(values) valid
+    padded = np.append(values, np.zeros(1, dtype=values.dtype))
+    indices = np.empty(2 * len(lo), dtype=np.intp)
+    indices[0::2] = lo
+    indices[1::2] = hi
+    sums = np.add.reduceat(padded, indices)[0::2]
+    sums[lo >= hi] = 0
+    return sums
+
+
+def window_means(values, valid, lo, hi):
+    """Mean of the valid values in every window, NaN for windows without any."""
+    total = window_sums(np.where(valid, values, 0).astype(np.float64), lo, hi)
+    count = window_sums(valid.astype(np.int64), lo, hi)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def window_bin_counts(indices, lo, hi):
+    """
+    Histogram of every window.
+
+    Args:
+        indices (numpy.ndarray): bin index of every packet, -1 for packets without a value
+        lo, hi (numpy.ndarray): the windows as index ranges
+
+    Returns:
+        tuple: (occupied bin indices ascending, counts shaped (windows, occupied bins))
+    """
+    positions = np.flatnonzero(indices >= 0)
+    occupied, inverse = np.unique(indices[positions], return_inverse=True)
+    # the packets of bin b are the keys in [b * stride, (b + 1) * stride), in time order
+    stride = len(indices) + 1
+    keys = np.sort(inverse.astype(np.int64) * stride + positions)
+    offsets = np.arange(len(occupied), dtype=np.int64) * stride
+    counts = (np.searchsorted(keys, offsets + np.asarray(hi, dtype=np.int64)[:, None])
+              - np.searchsorted(keys, offsets + np.asarray(lo, dtype=np.int64)[:, None]))
+    return occupied, counts
+
+
+def window_percentiles(packets, lo, hi, percentiles, metrics=METRICS):
+    """
+    Per-window percentiles of the METRICS of the time sorted packets.
+
+    Returns:
+        dict: percentile_columns() -> array with one entry per window (NaN where a window has no value)
+    """
+    columns = {}
+    for name, (column, bins, truncate) in metrics.items():
+        values = packets[column]
+        valid = ~np.isnan(values)
+        indices = np.full(len(values), -1, dtype=np.intp)
+        indices[valid] = bins.index(np.trunc(values[valid]) if truncate else values[valid])
+        quantiles = np.full((len(percentiles), len(lo)), np.nan)
+        occupied = np.unique(indices[valid])
+        chunk = max(_BIN_COUNT_CELLS // max(len(occupied), 1), 1)
+        for first in range(0, len(lo), chunk):
+            occupied, counts = window_bin_counts(indices, lo[first:first + chunk], hi[first:first + chunk])
+            quantiles[:, first:first + chunk] = bin_count_quantiles(bins, occupied, counts, percentiles)
+        columns.update(zip(percentile_columns(percentiles, {name: None}), quantiles))
+    return columns
+
+
+def _segment_searchsorted(timestamps, packet_groups, values, value_groups):
+    """
+    np.searchsorted(side='left') of every value among the packets of its own group, all groups
+    at once: one lexsort of the packets and values by (group, time), a value sorts before the
+    packets with the same time.
+
+    Returns:
+        numpy.ndarray: per value, the number of packets before it in the (group, time) order
+    """
+    is_packet = np.concatenate([np.ones(len(timestamps), dtype=np.intp), np.zeros(len(values), dtype=np.intp)])
+    order = np.lexsort((is_packet, np.concatenate([timestamps, values]), np.concatenate([packet_groups, value_groups])))
+    packets_before = np.empty(len(order), dtype=np.intp)
+    packets_before[order] = np.cumsum(is_packet[order]) - is_packet[order]
+    return packets_before[len(timestamps):]
+
+
+def segment_window_bounds(timestamps, segment_starts, segment_ends, window_size, step=None, max_duration=None):
+    """
+    window_bounds() for several groups stored one after the other in timestamps
+    (e.g. links after a sort by (link, time)), each group with its own time origin.
+    No loop over the groups, a capture can have thousands of links with a few frames each.
+
+    Args:
+        timestamps (numpy.ndarray): seconds since the first packet of the packet's own group,
+            sorted within every group
+        segment_starts, segment_ends (numpy.ndarray): group g is timestamps[segment_starts[g]:segment_ends[g]]
+
+    Returns:
+        tuple: (group, starts, lo, hi) arrays with one entry per window, lo / hi index the whole array
+    """
+    step = step or window_size
+    segment_starts = np.asarray(segment_starts, dtype=np.intp)
+    segment_ends = np.asarray(segment_ends, dtype=np.intp)
+    sizes = segment_ends - segment_starts
+    if not len(sizes) or not sizes.sum():
+        empty = np.empty(0, dtype=np.intp)
+        return empty, np.empty(0), empty, empty
+
+    # packets after max_duration are a suffix of every group
+    kept = sizes if max_duration is None else window_sums((timestamps <= max_duration).astype(np.intp),
+                                                          segment_starts, segment_ends)
+    last = np.where(kept > 0, timestamps[np.maximum(segment_starts + kept - 1, 0)], 0.0)
+    # same stopping rule as window_bounds(): a window starts strictly before the group's last packet
+    counts = np.where(last > 0, np.ceil(last / step), 0).astype(np.intp)
+    group = np.repeat(np.arange(len(sizes), dtype=np.intp), counts)
+    starts = (np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)) * step
+
+    # the groups' packets without anything between them, gaps = how far group g moved left by that
+    gaps = segment_starts - (np.cumsum(sizes) - sizes)
+    packets = np.arange(sizes.sum()) + np.repeat(gaps, sizes)
+    packet_groups = np.repeat(np.arange(len(sizes), dtype=np.intp), sizes)
+    bounds = _segment_searchsorted(timestamps[packets], packet_groups, np.concatenate([starts, starts + window_size]),
+                                   np.concatenate([group, group])) + np.concatenate([gaps[group], gaps[group]])
+    limit = (segment_starts + kept)[group]
+    lo = np.minimum(bounds[:len(group)], limit)
+    hi = np.minimum(bounds[len(group):], limit)
+    return group, starts, lo, hi
+
+
+def aggregate_windows(packets, starts, lo, hi, window_size, percentiles=None):
+    """
+    Per-window link metrics for windows given as index ranges into the time sorted packets.
+
+    Args:
+        percentiles (list): also the percentiles of RSSI, rate and rate gap (see window_percentiles())
+
+    Returns:
+        dict: arrays 'start', 'end', 'packets', 'avg_rssi', 'avg_rate', 'frame_loss', 'rate_gap',
+            'avg_payload' and 'avg_total' (plus the percentile columns) with one entry per window
+            (NaN where undefined)
+    """
+    counts = hi - lo
+
+    rssi = np.trunc(packets['signal_strength'])
+    rate = packets['data_rate']
+    gap = packets['rate_gap']
+    payload = packets['payload_length']
+    total = packets['frame_length']
+
+    retries = window_sums((packets['retry_flag'] == 1).astype(np.int64), lo, hi)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        loss = np.where(counts > 0, retries / np.maximum(counts, 1), 0.0)
+
+    windows = {
+        'start': starts,
+        'end': starts + window_size,
+        'packets': counts,
+        'avg_rssi': window_means(rssi, ~np.isnan(rssi), lo, hi),
+        'avg_rate': window_means(rate, ~np.isnan(rate), lo, hi),
+        'frame_loss': loss,
+        'rate_gap': window_means(gap, ~np.isnan(gap), lo, hi),
+        'avg_payload': window_means(payload, payload != MISSING_INT, lo, hi),
+        'avg_total': window_means(total, total != MISSING_INT, lo, hi),
+    }
+    if percentiles:
+        windows.update(window_percentiles(packets, lo, hi, percentiles))
+    return windows
+
+
+def window_aggregates(packets, timestamps, window_size, step=None, max_duration=None, percentiles=None):
+    """
+    All per-window link metrics in one pass over the time sorted packets.
+
+    Args:
+        packets (PacketTable): link frames sorted by sniff_time
+        timestamps (numpy.ndarray): their times in seconds since the first one
+
+    Returns:
+        dict: see aggregate_windows()
+    """
+    starts, lo, hi = window_bounds(timestamps, window_size, step, max_duration)
+    return aggregate_windows(packets, starts, lo, hi, window_size, percentiles)